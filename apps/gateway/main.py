@@ -1,12 +1,14 @@
 # apps/gateway/main.py
 import csv
 import io
-from fastapi import FastAPI, HTTPException, Body, Request
+from fastapi import FastAPI, HTTPException, Body, Request, Depends
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 from typing import List, Literal, Optional, Dict, Any
 from pathlib import Path
 from zipfile import ZipFile, ZIP_DEFLATED
 import json, os, time, tempfile, logging
+from urllib.parse import urlparse
 from dotenv import load_dotenv
 from common.cursors import list_cursors, reset_cursors, set_cursor
 from common.files import save_bytes_local, upload_zip_via_sftp, send_bytes_via_email
@@ -14,6 +16,10 @@ from connectors.d365.metadata import find_tables, get_table, read_table_rows_gen
 from common.registry import get_tables, register_tables, set_tables
 from fastapi import Query
 from connectors.d365.metadata import list_registered_tables
+from common.httpclient import open_http_clients, close_http_clients
+from connectors.d365.breaker import CircuitOpenError
+from connectors.d365.retry import DeadlineExceeded, deadline_in
+from common.profiles import bind_profile, all_profiles, load_profiles, current_profile
 
 load_dotenv()  # picks up .env from the current working directory
 
@@ -32,58 +38,34 @@ except Exception:
         hub_port = int(os.getenv("HUB_PORT", "8080"))
     settings = _S()
 
+# Time kept back from the caller's budget to build and send our own response.
+DEADLINE_MARGIN = 0.5  # seconds
+
+def _request_deadline(request: Request, timeout: Optional[float] = None) -> Optional[float]:
+    """
+    time.monotonic() deadline for this request: ?timeout=<s>, else the
+    X-Request-Timeout: <s> header, else HUB_REQUEST_TIMEOUT; None = unbounded.
+    """
+    if timeout is None:
+        hdr = request.headers.get("X-Request-Timeout")
+        if hdr:
+            try:
+                timeout = float(hdr)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="X-Request-Timeout must be seconds")
+    if timeout is None:
+        timeout = getattr(settings, "hub_request_timeout", None)
+    if timeout is None:
+        return None
+    return deadline_in(max(0.0, timeout - DEADLINE_MARGIN))
+
 def _mask(v: str, head: int = 6, tail: int = 4) -> str:
     if not v or len(v) <= head + tail:
         return v
     return f"{v[:head]}...{v[-tail:]}"
 
 # ---------- D365 client helpers ----------
-try:
-    from connectors.d365.client import d365_whoami, d365_get
-except Exception:
-    import httpx
-    _TOKEN: Dict[str, Any] = {}
-
-    async def _get_token() -> str:
-        # basic cache with expiry if available
-        if _TOKEN.get("exp", 0) > time.time():
-            return _TOKEN["val"]
-
-        url = f"https://login.microsoftonline.com/{settings.d365_tenant_id}/oauth2/v2.0/token"
-        data = {
-            "client_id": settings.d365_client_id,
-            "client_secret": settings.d365_client_secret,
-            "grant_type": "client_credentials",
-            "scope": f"{settings.d365_org_url}/.default",
-        }
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-        async with httpx.AsyncClient(timeout=30) as cli:
-            r = await cli.post(url, data=data, headers=headers)
-            try:
-                r.raise_for_status()
-            except httpx.HTTPStatusError as e:
-                # bubble up useful error text
-                raise HTTPException(status_code=r.status_code, detail=f"Token error: {r.text}") from e
-            j = r.json()
-            _TOKEN["val"] = j["access_token"]
-            _TOKEN["exp"] = time.time() + j.get("expires_in", 3600) - 60
-            return _TOKEN["val"]
-
-    async def d365_get(path: str, params: Dict[str, Any] | None = None):
-        token = await _get_token()
-        base = f"{settings.d365_org_url}/api/data/v9.2"
-        headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
-        async with httpx.AsyncClient(timeout=30) as cli:
-            r = await cli.get(f"{base}{path}", params=params or {}, headers=headers)
-            try:
-                r.raise_for_status()
-            except httpx.HTTPStatusError as e:
-                raise HTTPException(status_code=r.status_code, detail=f"D365 GET {path} failed: {r.text}") from e
-            return r.json()
-
-    async def d365_whoami():
-        j = await d365_get("/WhoAmI")
-        return True, j
+from connectors.d365.client import d365_whoami, d365_get
 
 # ---------- Poller stub ----------
 try:
@@ -108,15 +90,61 @@ class SubmitRequest(BaseModel):
     route: str = Field("dryrun", description="dryrun | email | sftp")
 
 # ---------- App ----------
-app = FastAPI(title="integration-hub", version="0.1.0")
+async def _bind_tenant_profile(request: Request):
+    # Route this request's Dataverse calls to the tenant's org / AAD app / limits
+    # (data/profiles.json); routes without a tenant use the .env org.
+    tenant = request.path_params.get("tenant") or request.path_params.get("tenant_id")
+    bind_profile(tenant)
+
+app = FastAPI(title="integration-hub", version="0.1.0", dependencies=[Depends(_bind_tenant_profile)])
 
 @app.on_event("startup")
 def _print_cfg():
     log.info(
-        "CFG org=%s tenant=%s client=%s",
+        "CFG org=%s tenant=%s client=%s profiles=%s",
         settings.d365_org_url,
         _mask(settings.d365_tenant_id),
         _mask(settings.d365_client_id),
+        sorted(load_profiles()),
+    )
+
+@app.on_event("startup")
+def _open_http_pool():
+    # warm the pooled clients so the first Dataverse call skips pool setup
+    from common.auth import AAD_AUTHORITY
+    open_http_clients(*(p.org_url for p in all_profiles().values()), AAD_AUTHORITY)
+
+@app.on_event("startup")
+async def _start_scheduler():
+    if settings.hub_scheduler_enabled:
+        from connectors.d365.scheduler import scheduler
+        scheduler.start()
+
+@app.on_event("shutdown")
+async def _close_http_pool():
+    from common.auth import close_token_providers
+    from common.rowstore import close_row_writers
+    from connectors.d365.scheduler import scheduler
+    await scheduler.stop()  # before the pools and writers it uses go away
+    close_token_providers()
+    await close_http_clients()
+    await close_row_writers()
+
+@app.exception_handler(CircuitOpenError)
+async def _circuit_open(request: Request, exc: CircuitOpenError):
+    # the org is failing; answer immediately instead of tying up a worker on retries
+    return JSONResponse(
+        status_code=503,
+        content={"ok": False, "error": "d365_unavailable", "detail": str(exc)},
+        headers={"Retry-After": str(int(exc.retry_in) or 1)},
+    )
+
+@app.exception_handler(DeadlineExceeded)
+async def _deadline_exceeded(request: Request, exc: DeadlineExceeded):
+    # the caller has (or is about to) given up; say so instead of a generic 500
+    return JSONResponse(
+        status_code=504,
+        content={"ok": False, "error": "deadline_exceeded", "detail": str(exc)},
     )
 
 @app.get("/health")
@@ -127,8 +155,15 @@ def health():
         "d365_org_url": settings.d365_org_url,
         "tenant": _mask(settings.d365_tenant_id),
         "client": _mask(settings.d365_client_id),
+        "profiles": sorted(load_profiles()),
     }
 
+@app.get("/connectors/d365/scheduler")
+def scheduler_status():
+    """Background poller state: per (tenant, table) interval, last result, next poll (epoch seconds)."""
+    from connectors.d365.scheduler import scheduler
+    return {"ok": True, **scheduler.snapshot()}
+
 @app.post("/tenants/{tenant_id}/connectors/d365:test")
 async def test_d365(tenant_id: str):
     ok, info = await d365_whoami()
@@ -142,23 +177,44 @@ class PollRequest(BaseModel):
     max_records: Optional[int] = Field(default=None, ge=1)
     force_full: bool = Field(default=False, description="Ignore stored cursor and read from start")
     since_iso: Optional[str] = Field(default=None, description="Override cursor once (ISO Z, e.g. 2025-09-08T21:54:24Z)")
+    resume: bool = Field(default=False, description="force_full only: continue an interrupted full sync from its checkpoint instead of starting over")
+    continuation: Optional[Dict[str, str]] = Field(default=None, description="{logical: nextLink} from a previous poll that hit its deadline")
+    partitions: Optional[int] = Field(default=None, ge=1, le=64, description="force_full only: read the table as N parallel windows (default D365_FULL_SYNC_PARTITIONS)")
+    partition_by: Optional[Literal["time", "pk", "auto"]] = Field(default=None, description="split on modifiedon windows, primary-key ranges, or auto")
+    mode: Optional[Literal["modifiedon", "delta"]] = Field(default=None, description="modifiedon cursor or change tracking (deltaLink, includes deletes); default D365_POLL_MODE")
+    concurrency: Optional[int] = Field(default=None, ge=1, le=64, description="tables polled at once (default D365_POLL_CONCURRENCY)")
 
 @app.post("/tenants/{tenant}/connectors/d365:poll")
 async def poll_generic(
     tenant: str,
+    request: Request,
     # allow passing via querystring for quick Postman testing
     q_force_full: bool = Query(False, alias="force_full"),
     q_limit_pages: int = Query(2, ge=1, le=50, alias="limit_pages"),
     q_max_records: Optional[int] = Query(None, ge=1, alias="max_records"),
     q_since_iso: Optional[str] = Query(None, alias="since_iso"),
+    q_resume: bool = Query(False, alias="resume"),
+    q_timeout: Optional[float] = Query(None, gt=0, alias="timeout"),
     body: Optional[PollRequest] = Body(None),
 ):
     """
     Polls one or more logical tables for the given tenant.
     Priority: query string overrides body for quick testing.
+
+    With a time budget (?timeout= or X-Request-Timeout, seconds) the poll stops
+    fetching pages when it runs out and returns what it has: "complete" is
+    false and "continuation" holds {logical: nextLink} to send back in the body.
+
+    A force_full poll reads from the start; with resume it continues an
+    interrupted full sync from its checkpoint ("resumed" per table says
+    whether there was one).
+
+    Tables are polled concurrently; "results" has each table's count, timing
+    ("seconds") and, if it failed, "error" ("errors" lists just those).
     """
+    deadline = _request_deadline(request, q_timeout)
     from common.registry import get_tables
-    from connectors.d365.ingest import poll_table
+    from connectors.d365.ingest import poll_tables
 
     # 1) Merge body + query params (queries win for easy Postman use)
     req = body or PollRequest()
@@ -166,27 +222,44 @@ async def poll_generic(
     limit_pages  = q_limit_pages  if q_limit_pages is not None else req.limit_pages
     max_records  = q_max_records  if q_max_records is not None else req.max_records
     since_iso    = q_since_iso    if q_since_iso else req.since_iso
+    resume       = q_resume or req.resume
     tables       = req.tables or get_tables(tenant)
 
     # 2) Guard: must have at least one table
     if not tables:
         raise HTTPException(status_code=400, detail=f"No tables registered for tenant '{tenant}'. Register via POST /tenants/{tenant}/connectors/d365/tables:register")
 
-    # 3) Poll each table
-    total = 0
-    for logical in tables:
-        # helpful log (you can replace print with your logger)
-        print(f"[poll] tenant={tenant} table={logical} force_full={force_full} since={since_iso} limit_pages={limit_pages} max_records={max_records}")
-        total += await poll_table(
-            tenant=tenant,
-            logical=logical,
-            limit_pages=limit_pages,
-            max_records=max_records,
-            force_full=force_full,
-            since_iso=since_iso,
-        )
-
-    return {"ok": True, "count": total, "tables": tables, "force_full": force_full, "since_iso": since_iso}
+    # continuation links are fetched with our token: only accept the tenant's own org
+    for link in (req.continuation or {}).values():
+        if urlparse(link).netloc.lower() != current_profile().host:
+            raise HTTPException(status_code=400, detail=f"continuation is not a link to this tenant's org: {link}")
+
+    # 3) Poll the tables concurrently (metadata + first pages go out as $batch requests)
+    t0 = time.perf_counter()
+    results = await poll_tables(
+        tenant=tenant,
+        tables=tables,
+        limit_pages=limit_pages,
+        max_records=max_records,
+        force_full=force_full,
+        since_iso=since_iso,
+        deadline=deadline,
+        continuation=req.continuation,
+        partitions=req.partitions,
+        partition_by=req.partition_by,
+        mode=req.mode,
+        concurrency=req.concurrency,
+        resume=resume,
+    )
+    total = sum(r["count"] for r in results.values())
+    continuation = {l: r["continuation"] for l, r in results.items() if r["continuation"]}
+    errors = {l: r["error"] for l, r in results.items() if r.get("error")}
+
+    return {"ok": not errors, "count": total, "tables": tables, "force_full": force_full, "since_iso": since_iso,
+            "resume": resume,
+            "complete": all(r["complete"] for r in results.values()),
+            "continuation": continuation or None, "errors": errors or None,
+            "seconds": round(time.perf_counter() - t0, 3), "results": results}
     
 @app.post("/tenants/{tenant_id}/connectors/d365:pull")
 async def pull_items(tenant_id: str):
@@ -198,6 +271,8 @@ async def pull_items(tenant_id: str):
         })
         items = data.get("value", [])
         return {"ok": True, "count": len(items), "items": items}
+    except CircuitOpenError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"pull_failed: {e}")
 
@@ -277,6 +352,8 @@ def hub_root():
 async def list_tables(prefix: str | None = None):
     try:
         return {"ok": True, "tables": await find_tables(prefix)}
+    except CircuitOpenError:
+        raise
     except Exception as e:
         # surface a readable error
         raise HTTPException(status_code=500, detail=f"hub tables failed: {e}")
@@ -300,10 +377,13 @@ async def tables_register(tenant: str, body: dict = Body(...)):
     return {"ok": True, "tables": updated}
 
 @app.get("/tenants/{tenant_id}/connectors/d365/tables/{logical}/rows")
-async def rows(tenant_id: str, logical: str, request: Request, top: int = 100):
+async def rows(tenant_id: str, logical: str, request: Request, top: int = 100,
+               timeout: Optional[float] = Query(None, gt=0)):
+    deadline = _request_deadline(request, timeout)
     table = await get_table(logical)  # returns dict with 'set'
     # Take all original query params from the client
     params = dict(request.query_params)
+    params.pop("timeout", None)  # ours, not OData
 
     # Ensure $top applied (override or set)
     params["$top"] = params.get("$top", str(top))
@@ -311,7 +391,7 @@ async def rows(tenant_id: str, logical: str, request: Request, top: int = 100):
     # If you previously forced just pk/pname, remove that code.
     # DO NOT set your own $select here if the client provided one.
 
-    j = await d365_get(f"/{table['set']}", params=params)
+    j = await d365_get(f"/{table['set']}", params=params, deadline=deadline)
     return {
         "ok": True,
         "count": len(j.get("value", [])),
@@ -422,5 +502,11 @@ async def reset_cursors_route(tenant: str, body: ResetBody):
     for set_name in sets:
         set_cursor(tenant, set_name, None)  # use "" if your impl requires str
         cleared[set_name] = True
+    # change-tracking (mode=delta) cursors and full-sync checkpoints are kept per logical name
+    from connectors.d365.ingest import CHECKPOINT_SUFFIX, DELTA_CURSOR_SUFFIX, PARTITIONS_SUFFIX
+    for logical in logicals:
+        set_cursor(tenant, f"{logical}{DELTA_CURSOR_SUFFIX}", None)
+        set_cursor(tenant, f"{logical}{CHECKPOINT_SUFFIX}", None)
+        set_cursor(tenant, f"{logical}{PARTITIONS_SUFFIX}", None)
 
     return {"ok": True, "reset": len(sets), "resources": cleared}
\ No newline at end of file
@@ -1,27 +1,136 @@
 # common/auth.py
 from __future__ import annotations
-import httpx
-from common.settings import settings
+import asyncio
+import logging
+import time
+from typing import Optional
+from common.httpclient import get_http_client
+from common.profiles import D365Profile, current_profile
 
-TIMEOUT = 60  # seconds
+AAD_AUTHORITY = "https://login.microsoftonline.com"
+EXPIRY_SLACK = 60  # seconds; never hand out a token this close to expiry
 
-async def get_dataverse_token() -> str:
+log = logging.getLogger("integration-hub.auth")
+
+
+class TokenProvider:
     """
     Client credentials flow for Dataverse: scope = <org_url>/.default
+
+    - Caches the token until shortly before it expires.
+    - Single-flight: concurrent callers share one in-flight fetch, so a burst
+      of N requests on a cold cache causes exactly one AAD round-trip.
+    - Proactive refresh: a background task renews the token `refresh_margin`
+      seconds before expiry so callers normally never wait on AAD.
     """
-    tenant = settings.d365_tenant_id
-    token_url = f"https://login.microsoftonline.com/{tenant}/oauth2/v2.0/token"
-    scope = f"{settings.d365_org_url}/.default"
-
-    data = {
-        "client_id": settings.d365_client_id,
-        "client_secret": settings.d365_client_secret,
-        "grant_type": "client_credentials",
-        "scope": scope,
-    }
-
-    async with httpx.AsyncClient(timeout=TIMEOUT) as cli:
-        r = await cli.post(token_url, data=data)
+
+    def __init__(self, tenant_id: str, client_id: str, client_secret: str, scope: str,
+                 refresh_margin: float = 300, timeout: float = 60):
+        self.tenant_id = tenant_id
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.scope = scope
+        self.refresh_margin = refresh_margin
+        self.timeout = timeout  # seconds per token request
+        self._token: Optional[str] = None
+        self._expires_at = 0.0  # time.monotonic() based
+        self._inflight: Optional[asyncio.Future] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def _valid(self) -> bool:
+        return bool(self._token) and time.monotonic() < self._expires_at - EXPIRY_SLACK
+
+    async def get_token(self) -> str:
+        if self._valid():
+            return self._token
+        # shield: one caller giving up must not cancel the fetch others wait on
+        return await asyncio.shield(self._refresh())
+
+    def _refresh(self) -> asyncio.Future:
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.ensure_future(self._fetch())
+        return self._inflight
+
+    async def _fetch(self) -> str:
+        token_url = f"{AAD_AUTHORITY}/{self.tenant_id}/oauth2/v2.0/token"
+        data = {
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "grant_type": "client_credentials",
+            "scope": self.scope,
+        }
+        cli = get_http_client(token_url)
+        r = await cli.post(token_url, data=data, timeout=self.timeout)
         r.raise_for_status()
         j = r.json()
-        return j["access_token"]
+        expires_in = float(j.get("expires_in", 3600))
+        self._token = j["access_token"]
+        self._expires_at = time.monotonic() + expires_in
+        self._schedule_refresh(expires_in)
+        return self._token
+
+    def _schedule_refresh(self, expires_in: float) -> None:
+        current = asyncio.current_task()
+        if self._refresh_task and not self._refresh_task.done() and self._refresh_task is not current:
+            self._refresh_task.cancel()
+        delay = max(expires_in - self.refresh_margin, expires_in / 2)
+        self._refresh_task = asyncio.get_running_loop().create_task(self._refresh_later(delay))
+
+    async def _refresh_later(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        try:
+            # shield: the fetch reschedules (cancels) this task when it completes,
+            # and must not take callers that joined it down with it
+            await asyncio.shield(self._refresh())
+        except Exception as e:
+            # cached token is still usable until expiry; the next caller retries
+            log.warning("background token refresh failed for %s: %s", self.scope, e)
+
+    def close(self) -> None:
+        if self._refresh_task and not self._refresh_task.done():
+            self._refresh_task.cancel()
+        self._refresh_task = None
+
+
+_providers: dict[tuple[str, str, str], TokenProvider] = {}
+
+def get_token_provider(profile: Optional[D365Profile] = None) -> TokenProvider:
+    """
+    One provider (token cache) per AAD app and org; defaults to the current
+    tenant's profile. Rebuilt when the profile's secret, refresh margin or
+    D365_HTTP_TIMEOUT changes.
+    """
+    profile = profile or current_profile()
+    scope = f"{profile.org_url}/.default"
+    key = (profile.tenant_id, profile.client_id, scope)
+    prov = _providers.get(key)
+    if prov is not None and (prov.client_secret != profile.secret() or
+                             prov.refresh_margin != profile.setting("d365_token_refresh_margin") or
+                             prov.timeout != profile.setting("d365_http_timeout")):
+        # secret rotated / settings changed in the profiles file: drop the old token with it
+        prov.close()
+        prov = None
+    if prov is None:
+        prov = TokenProvider(
+            profile.tenant_id,
+            profile.client_id,
+            profile.secret(),
+            scope,
+            refresh_margin=profile.setting("d365_token_refresh_margin"),
+            timeout=profile.setting("d365_http_timeout"),
+        )
+        _providers[key] = prov
+    return prov
+
+async def get_dataverse_token(profile: Optional[D365Profile] = None) -> str:
+    """
+    Client credentials flow for Dataverse: scope = <org_url>/.default
+    Served from the shared TokenProvider cache of the (current) profile.
+    """
+    return await get_token_provider(profile).get_token()
+
+def close_token_providers() -> None:
+    """Stop background refresh tasks (called on shutdown)."""
+    for prov in _providers.values():
+        prov.close()
+    _providers.clear()
@@ -2,7 +2,7 @@
 from __future__ import annotations
 from pathlib import Path
 import json
-from typing import Optional
+from typing import Any, Optional
 
 _STORE = Path(".runtime/cursors.json")
 _STORE.parent.mkdir(parents=True, exist_ok=True)
@@ -21,11 +21,12 @@ def _save(d: dict) -> None:
 def _key(tenant_id: str, table: str) -> str:
     return f"{tenant_id}:{table}"
 
-def get_cursor(tenant_id: str, table: str) -> Optional[str]:
+def get_cursor(tenant_id: str, table: str) -> Optional[Any]:
+    """The stored value: an ISO-Z string, or a compound cursor dict (connectors/d365/cursor.py)."""
     data = _load()
     return data.get(_key(tenant_id, table))
 
-def set_cursor(tenant_id: str, table: str, iso_z: str) -> None:
+def set_cursor(tenant_id: str, table: str, iso_z: Any) -> None:
     data = _load()
     data[_key(tenant_id, table)] = iso_z
     _save(data)
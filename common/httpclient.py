@@ -0,0 +1,65 @@
+# common/httpclient.py
+from __future__ import annotations
+import asyncio
+from urllib.parse import urlparse
+import httpx
+from common.settings import settings
+from common.profiles import OrgRegistry, org_setting
+
+# One pooled AsyncClient per host (each Dataverse org, login.microsoftonline.com, ...).
+# Reusing them keeps TCP + TLS connections alive between calls instead of paying
+# the handshake on every request. Created on app startup, closed on shutdown,
+# and lazily (re)created for scripts that never run the FastAPI lifecycle.
+# A profile edit that changes the pool settings of an org swaps its client;
+# the old one is closed once requests in flight on it have had time to end.
+
+_POOL_SETTINGS = ("d365_http_timeout", "d365_http_max_connections",
+                  "d365_http_max_keepalive", "d365_http_keepalive_expiry")
+
+def _host_key(url: str) -> str:
+    p = urlparse(url)
+    return f"{p.scheme}://{p.netloc}".lower()
+
+def _limits(url: str) -> httpx.Limits:
+    # Each client only ever talks to one host, so these are per-host limits
+    # (a tenant profile can override them for its org).
+    return httpx.Limits(
+        max_connections=org_setting(url, "d365_http_max_connections"),
+        max_keepalive_connections=org_setting(url, "d365_http_max_keepalive"),
+        keepalive_expiry=org_setting(url, "d365_http_keepalive_expiry"),
+    )
+
+def _new_client(url: str) -> httpx.AsyncClient:
+    return httpx.AsyncClient(timeout=org_setting(url, "d365_http_timeout"), limits=_limits(url))
+
+def _retire(cli: httpx.AsyncClient) -> None:
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return  # no loop: nothing can be in flight on it either
+    grace = 2 * cli.timeout.read if cli.timeout.read else 120.0
+    loop.call_later(grace, lambda: loop.create_task(cli.aclose()))
+
+_clients: OrgRegistry[httpx.AsyncClient] = OrgRegistry(
+    _new_client, depends_on=_POOL_SETTINGS, key=_host_key, on_replace=_retire)
+
+def get_http_client(url: str) -> httpx.AsyncClient:
+    """
+    Return the shared pooled client for the host of `url`.
+    Callers must NOT close it or use it as a context manager.
+    """
+    cli = _clients.get(url)
+    if cli.is_closed:
+        _clients.discard(url)
+        cli = _clients.get(url)
+    return cli
+
+def open_http_clients(*urls: str) -> None:
+    """Pre-create pooled clients for the given hosts (called on startup)."""
+    for url in urls:
+        get_http_client(url)
+
+async def close_http_clients() -> None:
+    """Close every pooled client (called on shutdown)."""
+    for cli in _clients.clear():
+        await cli.aclose()
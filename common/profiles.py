@@ -0,0 +1,227 @@
+# common/profiles.py
+from __future__ import annotations
+import itertools, json, os, time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, Generic, Iterable, Iterator, List, Optional, Tuple, TypeVar
+from urllib.parse import urlparse
+from pydantic import BaseModel, Field, field_validator
+from common.settings import settings, Settings
+
+# Per-tenant D365 connector profiles: which org a tenant is polled against,
+# with which AAD app, and optional per-org limits. Tenants without a profile
+# use the single org from .env (the "default" profile).
+#
+# data/profiles.json:
+#   {
+#     "contoso": {
+#       "org_url": "https://contoso.crm.dynamics.com",
+#       "tenant_id": "<AAD tenant GUID>",
+#       "client_id": "<app id>",
+#       "client_secret_env": "CONTOSO_D365_SECRET",
+#       "limits": {"d365_throttle_max": 16, "d365_http_max_connections": 20}
+#     }
+#   }
+PROFILES_PATH = Path(os.getenv("PROFILES_PATH", "./data/profiles.json"))
+
+DEFAULT_PROFILE = "default"
+
+# Settings a profile may override for its own org (pool, token, throttle,
+# breaker, retries, paging); credentials are profile fields instead.
+_CREDENTIALS = {"d365_org_url", "d365_tenant_id", "d365_client_id", "d365_client_secret"}
+OVERRIDABLE = frozenset(n for n in Settings.model_fields if n.startswith("d365_") and n not in _CREDENTIALS)
+
+
+class D365Profile(BaseModel):
+    name: str
+    org_url: str
+    tenant_id: str
+    client_id: str
+    client_secret: Optional[str] = None
+    client_secret_env: Optional[str] = None  # read the secret from this env var (keeps it out of the file)
+    limits: Dict[str, Any] = Field(default_factory=dict)
+
+    @field_validator("org_url")
+    @classmethod
+    def _must_be_https(cls, v: str) -> str:
+        if not v.startswith("https://"):
+            raise ValueError("org_url must start with https://")
+        return v.rstrip("/")
+
+    @field_validator("limits")
+    @classmethod
+    def _known_limits(cls, v: Dict[str, Any]) -> Dict[str, Any]:
+        out = {k.lower(): val for k, val in v.items()}
+        unknown = sorted(set(out) - OVERRIDABLE)
+        if unknown:
+            raise ValueError(f"unknown limits {unknown}; allowed: {sorted(OVERRIDABLE)}")
+        return out
+
+    @property
+    def host(self) -> str:
+        return urlparse(self.org_url).netloc.lower()
+
+    def secret(self) -> str:
+        if self.client_secret_env:
+            v = os.getenv(self.client_secret_env)
+            if not v:
+                raise RuntimeError(f"Profile '{self.name}': env var {self.client_secret_env} is not set")
+            return v
+        if not self.client_secret:
+            raise RuntimeError(f"Profile '{self.name}' has no client_secret / client_secret_env")
+        return self.client_secret
+
+    def setting(self, name: str) -> Any:
+        """Per-org override from `limits`, else the global setting."""
+        if name in self.limits:
+            return self.limits[name]
+        return getattr(settings, name)
+
+
+def _default_profile() -> D365Profile:
+    return D365Profile(
+        name=DEFAULT_PROFILE,
+        org_url=settings.d365_org_url,
+        tenant_id=settings.d365_tenant_id,
+        client_id=settings.d365_client_id,
+        client_secret=settings.d365_client_secret,
+    )
+
+_DEFAULT = _default_profile()
+
+# parsed file, reloaded when its mtime changes (edit the file without a restart;
+# per-org objects built from `limits` follow through OrgRegistry, tokens through
+# common/auth.py). The mtime is looked at most every PROFILES_CHECK_EVERY
+# seconds, and every reload starts a new generation, so per-request lookups
+# cost neither a stat() nor a re-read of the settings they depend on.
+PROFILES_CHECK_EVERY = 1.0  # seconds
+
+_generations = itertools.count(1)
+_loaded: Dict[str, Any] = {"mtime": None, "profiles": {}, "checked": None, "generation": 0}
+
+def load_profiles() -> Dict[str, D365Profile]:
+    """Return { tenant: D365Profile } from PROFILES_PATH (empty if the file is missing)."""
+    now = time.monotonic()
+    checked = _loaded.get("checked")
+    if checked is not None and now - checked < PROFILES_CHECK_EVERY:
+        return _loaded["profiles"]
+    try:
+        mtime = PROFILES_PATH.stat().st_mtime
+    except FileNotFoundError:
+        if _loaded["mtime"] is not None:
+            _loaded.update(mtime=None, profiles={}, generation=next(_generations))
+        _loaded["checked"] = now
+        return {}
+    if mtime != _loaded["mtime"]:
+        with PROFILES_PATH.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+        # a broken file should fail loudly, not silently route tenants to the default org
+        profiles = {t: D365Profile(name=t, **p) for t, p in data.items()}
+        _loaded.update(mtime=mtime, profiles=profiles, generation=next(_generations))
+    _loaded["checked"] = now
+    return _loaded["profiles"]
+
+def profiles_generation() -> int:
+    """Changes every time the profiles file is (re)loaded."""
+    load_profiles()
+    return _loaded.get("generation", 0)
+
+def get_profile(tenant: Optional[str]) -> D365Profile:
+    """The tenant's profile, or the default (.env) one."""
+    if tenant:
+        prof = load_profiles().get(tenant)
+        if prof is not None:
+            return prof
+    return _DEFAULT
+
+def all_profiles() -> Dict[str, D365Profile]:
+    return {DEFAULT_PROFILE: _DEFAULT, **load_profiles()}
+
+def profile_for_url(url: str) -> Optional[D365Profile]:
+    """The profile whose org hosts `url` (None for other hosts, e.g. AAD)."""
+    host = urlparse(url).netloc.lower()
+    cur = current_profile()
+    if cur.host == host:
+        return cur
+    for prof in all_profiles().values():
+        if prof.host == host:
+            return prof
+    return None
+
+def org_setting(url: str, name: str) -> Any:
+    """Setting `name` for the org that `url` points at (profile override or global)."""
+    prof = profile_for_url(url)
+    return prof.setting(name) if prof else getattr(settings, name)
+
+def host_key(url: str) -> str:
+    return urlparse(url).netloc.lower()
+
+
+T = TypeVar("T")
+
+class OrgRegistry(Generic[T]):
+    """
+    One shared object per org (breaker, governor, retry budget, pool, ...),
+    built by build(url) from the org's settings. The settings named in
+    `depends_on` are re-read after each reload of the profiles file: once an
+    edit changes one of them, the next lookup builds a new object and hands
+    the old one to on_replace (e.g. to close it).
+    """
+
+    def __init__(self, build: Callable[[str], T], depends_on: Iterable[str] = (),
+                 key: Callable[[str], str] = host_key,
+                 on_replace: Optional[Callable[[T], None]] = None):
+        self._build, self._depends_on, self._key = build, tuple(depends_on), key
+        self._on_replace = on_replace
+        # key -> (profiles generation, depends_on values, object)
+        self._items: Dict[str, Tuple[int, Tuple[Any, ...], T]] = {}
+
+    def get(self, url: str) -> T:
+        """Return the shared object for the org (host) that `url` points at."""
+        key = self._key(url)
+        generation = profiles_generation()
+        entry = self._items.get(key)
+        if entry is not None and entry[0] == generation:
+            return entry[2]
+        values = tuple(org_setting(url, n) for n in self._depends_on)
+        if entry is not None and entry[1] == values:
+            self._items[key] = (generation, values, entry[2])
+            return entry[2]
+        obj = self._build(url)
+        self._items[key] = (generation, values, obj)
+        if entry is not None and self._on_replace is not None:
+            self._on_replace(entry[2])
+        return obj
+
+    def discard(self, url: str) -> None:
+        self._items.pop(self._key(url), None)
+
+    def clear(self) -> List[T]:
+        """Forget every object; returns them (e.g. to close them)."""
+        objs = [obj for _, _, obj in self._items.values()]
+        self._items.clear()
+        return objs
+
+
+# ---------- Current profile (per request / per task) ----------
+
+_current: ContextVar[Optional[D365Profile]] = ContextVar("d365_profile", default=None)
+
+def current_profile() -> D365Profile:
+    return _current.get() or _DEFAULT
+
+def bind_profile(tenant: Optional[str]) -> D365Profile:
+    """Make the tenant's profile current for the running task (and tasks it spawns)."""
+    prof = get_profile(tenant)
+    _current.set(prof)
+    return prof
+
+@contextmanager
+def use_profile(tenant: Optional[str]) -> Iterator[D365Profile]:
+    """Scoped bind_profile() for scripts and background jobs."""
+    token = _current.set(get_profile(tenant))
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
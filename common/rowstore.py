@@ -0,0 +1,373 @@
+# common/rowstore.py
+from __future__ import annotations
+import asyncio
+import gzip
+import io
+import json
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from common.settings import settings
+
+log = logging.getLogger("integration-hub.rowstore")
+
+# Raw row store: .runtime/data/<tenant>/<table>/, one JSON row per line.
+#
+# Rows are buffered per (tenant, table) and written by one background thread
+# that keeps the table's file open, so the event loop never opens, encodes,
+# writes or fsyncs. Buffers go to the thread at page boundaries (flush()),
+# when HUB_WRITER_BUFFER_ROWS rows are waiting, or FLUSH_INTERVAL seconds
+# after the first buffered row. Await commit() before advancing a cursor: it
+# returns once everything written so far is on disk (fsync'd, with
+# HUB_WRITER_FSYNC "commit" or "always").
+#
+# Each table is a series of segments: 00000001.jsonl, 00000002.jsonl, ...
+# The open segment is rotated once it reaches HUB_SEGMENT_MAX_BYTES or
+# HUB_SEGMENT_MAX_AGE seconds, then compressed (zstd or gzip) by a second
+# thread and listed in manifest.json with its row count and min/max
+# modifiedon, so readers (iter_rows) can skip segments outside a range.
+#
+# manifest.json:
+#   {"segments": [{"file": "00000001.jsonl.gz", "rows": 200000, "bytes": 5812093,
+#                  "raw_bytes": 61480017, "min_modifiedon": "2025-01-02T08:00:00Z",
+#                  "max_modifiedon": "2025-03-01T17:41:09Z", "sealed": "2025-03-01T18:00:00Z"}]}
+#
+# Tables stored before segments were one file, <tenant>/<table>.jsonl. Readers
+# include it (before the segments); the table's writer moves it in as segment
+# 00000000.jsonl the first time it writes, and seals it like any leftover.
+
+RAW_ROOT = Path(".runtime") / "data"
+
+FLUSH_INTERVAL = 1.0  # seconds a row may sit in the buffer
+
+FSYNC_POLICIES = ("never", "commit", "always")
+
+MANIFEST = "manifest.json"
+
+# one worker: batches of a file are written in order, and files never race
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rowstore")
+# sealing (compression + manifest) runs apart, so it never holds up writes
+_sealer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rowstore-seal")
+
+
+# ---------- Compression (zstandard is optional) ----------
+
+def _has_zstd() -> bool:
+    try:
+        import zstandard  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def segment_compression(name: str = "auto") -> str:
+    """Resolve HUB_SEGMENT_COMPRESSION: auto = zstd if installed, else gzip."""
+    if name == "auto":
+        return "zstd" if _has_zstd() else "gzip"
+    if name not in ("zstd", "gzip", "none"):
+        raise ValueError(f"Unknown segment compression '{name}'. Use one of: auto, zstd, gzip, none")
+    if name == "zstd" and not _has_zstd():
+        raise ImportError("HUB_SEGMENT_COMPRESSION=zstd needs the 'zstandard' package")
+    return name
+
+_SUFFIX = {"zstd": ".zst", "gzip": ".gz", "none": ""}
+
+def _compress(src: Path, compression: str, fsync: bool) -> Path:
+    dst = src.with_name(src.name + _SUFFIX[compression])
+    if compression == "none":
+        return src
+    tmp = dst.with_name(dst.name + ".tmp")
+    with src.open("rb") as fin, tmp.open("wb") as fout:
+        if compression == "zstd":
+            import zstandard
+            zstandard.ZstdCompressor(level=3).copy_stream(fin, fout)
+        else:
+            with gzip.GzipFile(fileobj=fout, mode="wb", compresslevel=6) as gz:
+                shutil.copyfileobj(fin, gz, 1 << 20)
+        if fsync:
+            fout.flush()
+            os.fsync(fout.fileno())
+    os.replace(tmp, dst)
+    return dst
+
+def _legacy_file(directory: Path) -> Path:
+    return directory.with_name(directory.name + ".jsonl")
+
+def _open_segment(path: Path):
+    if path.suffix == ".zst":
+        import zstandard
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(path.open("rb")), encoding="utf-8")
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8")
+    return path.open("r", encoding="utf-8")
+
+
+# ---------- Manifest ----------
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")
+
+def read_manifest(directory: Path) -> List[Dict[str, Any]]:
+    try:
+        return json.loads((directory / MANIFEST).read_text(encoding="utf-8"))["segments"]
+    except FileNotFoundError:
+        return []
+
+def _write_manifest(directory: Path, segments: List[Dict[str, Any]]) -> None:
+    tmp = directory / (MANIFEST + ".tmp")
+    tmp.write_text(json.dumps({"segments": segments}, indent=1), encoding="utf-8")
+    os.replace(tmp, directory / MANIFEST)  # readers never see a half-written manifest
+
+def _row_ts(row: Dict[str, Any]) -> Optional[str]:
+    return row.get("modifiedon") or row.get("createdon")
+
+def _scan_stats(path: Path) -> Dict[str, Any]:
+    """Stats of a segment left open by a previous process."""
+    stats = {"rows": 0, "min_modifiedon": None, "max_modifiedon": None}
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                _add_stats(stats, json.loads(line))
+            except ValueError:
+                continue  # torn last line of a crashed write
+    return stats
+
+def _add_stats(stats: Dict[str, Any], row: Dict[str, Any]) -> None:
+    stats["rows"] += 1
+    ts = _row_ts(row)
+    if ts:  # ISO Z strings of one format compare like the instants they name
+        if stats["min_modifiedon"] is None or ts < stats["min_modifiedon"]:
+            stats["min_modifiedon"] = ts
+        if stats["max_modifiedon"] is None or ts > stats["max_modifiedon"]:
+            stats["max_modifiedon"] = ts
+
+def _seal(path: Path, stats: Optional[Dict[str, Any]], compression: str, fsync: bool) -> None:
+    """Compress a closed segment and add it to the manifest (sealer thread)."""
+    directory = path.parent
+    segments = read_manifest(directory)
+    done = [s["file"] for s in segments if s["file"].split(".")[0] == path.stem]
+    if done:
+        if done[0] != path.name:
+            path.unlink(missing_ok=True)  # sealed before, the process died before the unlink
+        return
+    if stats is None:
+        stats = _scan_stats(path)
+    raw_bytes = path.stat().st_size
+    if stats["rows"] == 0:
+        path.unlink()
+        return
+    out = _compress(path, compression, fsync)
+    segments.append({"file": out.name, **stats, "bytes": out.stat().st_size,
+                     "raw_bytes": raw_bytes, "sealed": _now_iso()})
+    _write_manifest(directory, segments)
+    if out != path:
+        path.unlink()
+
+
+class RowWriter:
+    """Buffered, segmented JSONL appender for one table. Use from the event loop only."""
+
+    def __init__(self, directory: Path, buffer_rows: int = 1000, fsync: str = "commit",
+                 max_bytes: int = 64 << 20, max_age: float = 3600.0, compression: str = "auto"):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}; got {fsync!r}")
+        self.directory = directory
+        self.buffer_rows = max(1, buffer_rows)
+        self.fsync = fsync
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compression = segment_compression(compression)
+        self.rows_written = 0
+        self._rows: List[Any] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._last: Optional[Future] = None
+        self._error: Optional[BaseException] = None
+        # owned by the writer thread
+        self._fh = None
+        self._seg: Optional[Path] = None
+        self._seg_opened = 0.0
+        self._seg_bytes = 0
+        self._stats: Dict[str, Any] = {}
+        self._next_seq: Optional[int] = None
+
+    # ---- event loop side ----
+
+    def write(self, row: Dict[str, Any]) -> None:
+        """Buffer one row. It is encoded later: do not mutate it afterwards."""
+        self._rows.append(row)
+        if len(self._rows) >= self.buffer_rows:
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(FLUSH_INTERVAL, self.flush)
+
+    def flush(self) -> None:
+        """Hand the buffered rows to the writer thread (does not wait)."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._rows:
+            batch, self._rows = self._rows, []
+            self._submit(self._write_batch, batch)
+
+    async def commit(self) -> None:
+        """Flush and wait until every row so far is written (and fsync'd unless fsync="never")."""
+        self.flush()
+        if self.fsync == "commit":
+            self._submit(self._sync)
+        if self._last is not None:
+            await asyncio.wrap_future(self._last)
+        if self._error is not None:
+            err, self._error = self._error, None
+            raise err
+
+    async def close(self) -> None:
+        """Commit, then seal the open segment."""
+        try:
+            await self.commit()
+        finally:
+            await asyncio.wrap_future(self._submit(self._rotate))
+
+    def _submit(self, fn, *args) -> Future:
+        self._last = _executor.submit(self._guarded, fn, *args)
+        return self._last
+
+    # ---- writer thread side ----
+
+    def _guarded(self, fn, *args) -> None:
+        try:
+            fn(*args)
+        except BaseException as e:
+            # keep the first failure for commit(); later batches still try to write
+            self._error = self._error or e
+
+    def _open(self) -> None:
+        if self._next_seq is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            legacy = _legacy_file(self.directory)
+            if legacy.is_file():
+                os.replace(legacy, self.directory / f"{0:08d}.jsonl")  # sealed below
+            seqs = [int(p.name.split(".")[0]) for p in self.directory.iterdir() if p.name[:8].isdigit()]
+            self._next_seq = max(seqs, default=0) + 1
+            # segments a previous process left open (or did not finish sealing)
+            for p in sorted(self.directory.glob("*.jsonl")):
+                _sealer.submit(_seal, p, None, self.compression, self.fsync != "never")
+        self._seg = self.directory / f"{self._next_seq:08d}.jsonl"
+        self._next_seq += 1
+        self._fh = self._seg.open("a", encoding="utf-8")
+        self._seg_opened = time.monotonic()
+        self._seg_bytes = 0
+        self._stats = {"rows": 0, "min_modifiedon": None, "max_modifiedon": None}
+
+    def _write_batch(self, batch: List[Any]) -> None:
+        if self._fh is None:
+            self._open()
+        data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in batch)
+        self._fh.write(data)
+        self._fh.flush()
+        if self.fsync == "always":
+            os.fsync(self._fh.fileno())
+        for r in batch:
+            _add_stats(self._stats, r)
+        self._seg_bytes += len(data)  # characters; close enough to bytes for rotation
+        self.rows_written += len(batch)
+        if self._seg_bytes >= self.max_bytes or time.monotonic() - self._seg_opened >= self.max_age:
+            self._rotate()
+
+    def _sync(self) -> None:
+        if self._fh is not None:
+            os.fsync(self._fh.fileno())
+
+    def _rotate(self) -> None:
+        if self._fh is None:
+            return
+        if self.fsync != "never":
+            os.fsync(self._fh.fileno())
+        self._fh.close()
+        _sealer.submit(_seal, self._seg, self._stats, self.compression, self.fsync != "never")
+        self._fh = self._seg = None
+
+
+_writers: Dict[Tuple[str, str], RowWriter] = {}
+
+def table_dir(tenant: str, table: str, root: Path = RAW_ROOT) -> Path:
+    return root / tenant / table
+
+def get_row_writer(tenant: str, table: str) -> RowWriter:
+    """The shared writer for .runtime/data/<tenant>/<table>/."""
+    key = (tenant, table)
+    w = _writers.get(key)
+    if w is None:
+        w = _writers[key] = RowWriter(table_dir(tenant, table),
+                                      buffer_rows=settings.hub_writer_buffer_rows,
+                                      fsync=settings.hub_writer_fsync,
+                                      max_bytes=settings.hub_segment_max_bytes,
+                                      max_age=settings.hub_segment_max_age,
+                                      compression=settings.hub_segment_compression)
+    return w
+
+async def close_row_writers() -> None:
+    """Flush, close and seal every open writer (app shutdown)."""
+    writers = list(_writers.values())
+    _writers.clear()
+    for w in writers:
+        try:
+            await w.close()
+        except Exception:
+            log.exception("closing %s failed", w.directory)
+    await asyncio.wrap_future(_sealer.submit(lambda: None))  # wait for pending compression
+
+
+# ---------- Reading ----------
+
+def stored_tables(root: Path = RAW_ROOT) -> List[Tuple[str, str]]:
+    """[(tenant, table)] that have stored rows under `root`."""
+    if not root.exists():
+        return []
+    return sorted({(t.name, d.name if d.is_dir() else d.stem) for t in root.iterdir() if t.is_dir()
+                   for d in t.iterdir() if d.is_dir() or d.suffix == ".jsonl"})
+
+def iter_rows(tenant: str, table: str, since: Optional[str] = None, until: Optional[str] = None,
+              root: Path = RAW_ROOT) -> Iterator[Dict[str, Any]]:
+    """
+    Rows of a table in write order: a legacy <table>.jsonl not migrated
+    yet, sealed segments (manifest order), then the ones not sealed yet.
+    With since / until (ISO Z, inclusive) segments
+    whose modifiedon range lies outside are skipped; rows inside a segment
+    that is read are not filtered (and deletion tombstones have no
+    modifiedon, so segments without one are always read).
+    """
+    directory = table_dir(tenant, table, root)
+    legacy = _legacy_file(directory)
+    files = [legacy] if legacy.is_file() else []
+    segments = read_manifest(directory) if directory.exists() else []
+    sealed = {s["file"].split(".")[0] for s in segments}
+    for s in segments:
+        lo, hi = s.get("min_modifiedon"), s.get("max_modifiedon")
+        if lo and ((since and hi < since) or (until and lo > until)):
+            continue
+        files.append(directory / s["file"])
+    if directory.exists():
+        files += [p for p in sorted(directory.glob("*.jsonl")) if p.stem not in sealed]
+    for p in files:
+        try:
+            f = _open_segment(p)
+        except FileNotFoundError:
+            # migrated or sealed while we were listing: read it where it is now
+            stem = f"{0:08d}" if p == legacy else p.stem
+            now = [s["file"] for s in read_manifest(directory) if s["file"].split(".")[0] == stem]
+            if now:
+                f = _open_segment(directory / now[0])
+            elif p == legacy and (directory / f"{stem}.jsonl").exists():
+                f = _open_segment(directory / f"{stem}.jsonl")
+            else:
+                continue
+        with f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue  # torn last line of an unsealed segment
@@ -9,6 +9,20 @@ from pydantic import Field, field_validator
 class Settings(BaseSettings):
     # -------- Hub / server ----------
     hub_port: int = Field(8080, alias="HUB_PORT")
+    # Default time budget (seconds) for a request when the caller sends none
+    # (X-Request-Timeout header or ?timeout=); unset = no deadline.
+    hub_request_timeout: float | None = Field(default=None, alias="HUB_REQUEST_TIMEOUT")
+    # Background polling of every registered table (connectors/d365/scheduler.py)
+    hub_scheduler_enabled: bool = Field(False, alias="HUB_SCHEDULER_ENABLED")
+    hub_scheduler_concurrency: int = Field(4, alias="HUB_SCHEDULER_CONCURRENCY")   # polls running at once
+    # Raw row store (.runtime/data): rows buffered per table before a background write;
+    # fsync never | commit (before a cursor advances) | always (every write)
+    hub_writer_buffer_rows: int = Field(1000, alias="HUB_WRITER_BUFFER_ROWS")
+    hub_writer_fsync: str = Field("commit", alias="HUB_WRITER_FSYNC")
+    # Segments are rotated at this size / age, then compressed: auto (zstd if installed) | zstd | gzip | none
+    hub_segment_max_bytes: int = Field(64 * 1024 * 1024, alias="HUB_SEGMENT_MAX_BYTES")
+    hub_segment_max_age: float = Field(3600.0, alias="HUB_SEGMENT_MAX_AGE")             # seconds
+    hub_segment_compression: str = Field("auto", alias="HUB_SEGMENT_COMPRESSION")
 
     # -------- D365 / Dataverse (required) ----------
     # We expose them in lowercase, but accept .env UPPERCASE via alias.
@@ -17,6 +31,93 @@ class Settings(BaseSettings):
     d365_client_id: str = Field(..., alias="D365_CLIENT_ID")
     d365_client_secret: str = Field(..., alias="D365_CLIENT_SECRET")
 
+    # -------- Dataverse HTTP connection pool (optional) ----------
+    # One pooled client per host, so these limits apply per org / per AAD host.
+    d365_http_max_connections: int = Field(100, alias="D365_HTTP_MAX_CONNECTIONS")
+    d365_http_max_keepalive: int = Field(20, alias="D365_HTTP_MAX_KEEPALIVE")
+    d365_http_keepalive_expiry: float = Field(30.0, alias="D365_HTTP_KEEPALIVE_EXPIRY")  # seconds idle
+    d365_http_timeout: float = Field(60.0, alias="D365_HTTP_TIMEOUT")                    # seconds
+
+    # -------- AAD token cache (optional) ----------
+    # Renew the cached token this many seconds before it expires.
+    d365_token_refresh_margin: float = Field(300.0, alias="D365_TOKEN_REFRESH_MARGIN")
+
+    # -------- Throttle governor (optional) ----------
+    # In-flight request limit per org; adapts between min and max from
+    # Retry-After / x-ms-ratelimit-* feedback. Dataverse allows 52 concurrent.
+    d365_throttle_initial: int = Field(8, alias="D365_THROTTLE_INITIAL")
+    d365_throttle_min: int = Field(1, alias="D365_THROTTLE_MIN")
+    d365_throttle_max: int = Field(52, alias="D365_THROTTLE_MAX")
+
+    # -------- Circuit breaker (optional) ----------
+    # Opens per org when >= rate of the requests in the window failed (5xx/network).
+    d365_breaker_failure_rate: float = Field(0.5, alias="D365_BREAKER_FAILURE_RATE")
+    d365_breaker_min_requests: int = Field(10, alias="D365_BREAKER_MIN_REQUESTS")
+    d365_breaker_window: float = Field(30.0, alias="D365_BREAKER_WINDOW")              # seconds
+    d365_breaker_open_seconds: float = Field(30.0, alias="D365_BREAKER_OPEN_SECONDS")  # before half-open probe
+
+    # -------- Retry policy (optional) ----------
+    # Full-jitter backoff; retries per org capped at BUDGET_RATIO of requests.
+    d365_retry_max_attempts: int = Field(4, alias="D365_RETRY_MAX_ATTEMPTS")
+    d365_retry_base_delay: float = Field(0.5, alias="D365_RETRY_BASE_DELAY")     # seconds
+    d365_retry_max_delay: float = Field(30.0, alias="D365_RETRY_MAX_DELAY")      # seconds
+    d365_retry_budget_ratio: float = Field(0.2, alias="D365_RETRY_BUDGET_RATIO")
+    d365_retry_budget_reserve: float = Field(10.0, alias="D365_RETRY_BUDGET_RESERVE")
+
+    # -------- JSON decoding (optional) ----------
+    # auto = fastest installed of orjson, msgspec, ujson; falls back to json
+    d365_json_decoder: str = Field("auto", alias="D365_JSON_DECODER")
+
+    # -------- Polling (optional) ----------
+    d365_page_size: int = Field(200, alias="D365_PAGE_SIZE")             # Prefer: odata.maxpagesize
+    d365_stream_pages: bool = Field(False, alias="D365_STREAM_PAGES")    # parse pages incrementally
+    d365_prefetch_pages: int = Field(0, alias="D365_PREFETCH_PAGES")     # pages fetched ahead of processing (0 = off)
+    # auto page size (connectors/d365/pagesize.py): tuned per table between polls, starting at
+    # D365_PAGE_SIZE, aiming for pages of at most TARGET_BYTES that take at most TARGET_SECONDS
+    d365_page_size_auto: bool = Field(False, alias="D365_PAGE_SIZE_AUTO")
+    d365_page_size_min: int = Field(50, alias="D365_PAGE_SIZE_MIN")
+    d365_page_size_max: int = Field(5000, alias="D365_PAGE_SIZE_MAX")  # Dataverse's own maximum
+    d365_page_target_bytes: int = Field(4 * 1024 * 1024, alias="D365_PAGE_TARGET_BYTES")
+    d365_page_target_seconds: float = Field(5.0, alias="D365_PAGE_TARGET_SECONDS")
+    # poll pipeline (fetch -> transform -> sinks): pages queued between stages, transform workers
+    d365_pipeline_queue: int = Field(4, alias="D365_PIPELINE_QUEUE")
+    d365_pipeline_transform_workers: int = Field(1, alias="D365_PIPELINE_TRANSFORM_WORKERS")
+
+    # modifiedon = filter on the modifiedon cursor; delta = Dataverse change tracking
+    # (deltaLink cursor, also returns deletes; tables without it fall back to modifiedon)
+    d365_poll_mode: str = Field("modifiedon", alias="D365_POLL_MODE")
+    # modifiedon mode cursor: modifiedon = (modifiedon, primary key) position;
+    # versionnumber = row version (tables without one use modifiedon)
+    d365_cursor_field: str = Field("modifiedon", alias="D365_CURSOR_FIELD")
+    # tables polled at once by :poll (also capped by the org's throttle limit)
+    d365_poll_concurrency: int = Field(4, alias="D365_POLL_CONCURRENCY")
+    # long polls save a resume point every N pages or seconds (0 = off)
+    d365_checkpoint_pages: int = Field(10, alias="D365_CHECKPOINT_PAGES")
+    d365_checkpoint_seconds: float = Field(30.0, alias="D365_CHECKPOINT_SECONDS")
+
+    # -------- Background scheduler (optional, HUB_SCHEDULER_ENABLED) ----------
+    # Per-table interval adapts between min and max (seconds) to how much changed.
+    d365_scheduler_min_interval: float = Field(30.0, alias="D365_SCHEDULER_MIN_INTERVAL")
+    d365_scheduler_max_interval: float = Field(900.0, alias="D365_SCHEDULER_MAX_INTERVAL")
+    d365_scheduler_jitter: float = Field(0.2, alias="D365_SCHEDULER_JITTER")        # +-20% per wait
+    d365_scheduler_max_pages: int = Field(50, alias="D365_SCHEDULER_MAX_PAGES")     # per poll
+
+    # -------- Full sync (optional) ----------
+    # force_full polls split the table into this many modifiedon windows read in parallel (1 = off).
+    d365_full_sync_partitions: int = Field(1, alias="D365_FULL_SYNC_PARTITIONS")
+    # time | pk | auto (time, or primary-key ranges when modifiedon is too clustered)
+    d365_full_sync_partition_by: str = Field("auto", alias="D365_FULL_SYNC_PARTITION_BY")
+
+    # -------- Request coalescing (optional) ----------
+    # Identical concurrent GETs share one upstream call.
+    d365_coalesce_gets: bool = Field(True, alias="D365_COALESCE_GETS")
+
+    # -------- Hedged reads (optional) ----------
+    # Re-send a GET that is slower than the org's p<PERCENTILE> latency; first answer wins.
+    d365_hedge_gets: bool = Field(False, alias="D365_HEDGE_GETS")
+    d365_hedge_percentile: float = Field(95.0, alias="D365_HEDGE_PERCENTILE")
+    d365_hedge_min_delay: float = Field(0.05, alias="D365_HEDGE_MIN_DELAY")  # seconds
+
     # -------- Output location (optional) ----------
     submission_dir: str | None = Field(default=None, alias="SUBMISSION_DIR")
 
@@ -93,7 +194,27 @@ except Exception as e:
         "  D365_CLIENT_SECRET=<secret value>\n"
         "Optional:\n"
         "  HUB_PORT=8080\n"
+        "  HUB_REQUEST_TIMEOUT=25 (seconds; default deadline per request)\n"
+        "  HUB_WRITER_BUFFER_ROWS, HUB_WRITER_FSYNC (never | commit | always)\n"
+        "  HUB_SCHEDULER_ENABLED, HUB_SCHEDULER_CONCURRENCY\n"
+        "  D365_SCHEDULER_MIN_INTERVAL, D365_SCHEDULER_MAX_INTERVAL, D365_SCHEDULER_JITTER, D365_SCHEDULER_MAX_PAGES\n"
+        "  HUB_SEGMENT_MAX_BYTES, HUB_SEGMENT_MAX_AGE, HUB_SEGMENT_COMPRESSION (auto | zstd | gzip | none)\n"
         "  SUBMISSION_DIR=C:/Users/MANIRAJ/OneDrive/Documents/Git/integration-hub/out\n"
+        "  D365_HTTP_MAX_CONNECTIONS, D365_HTTP_MAX_KEEPALIVE, D365_HTTP_KEEPALIVE_EXPIRY, D365_HTTP_TIMEOUT\n"
+        "  D365_TOKEN_REFRESH_MARGIN\n"
+        "  D365_THROTTLE_INITIAL, D365_THROTTLE_MIN, D365_THROTTLE_MAX\n"
+        "  D365_BREAKER_FAILURE_RATE, D365_BREAKER_MIN_REQUESTS, D365_BREAKER_WINDOW, D365_BREAKER_OPEN_SECONDS\n"
+        "  D365_RETRY_MAX_ATTEMPTS, D365_RETRY_BASE_DELAY, D365_RETRY_MAX_DELAY,\n"
+        "  D365_RETRY_BUDGET_RATIO, D365_RETRY_BUDGET_RESERVE\n"
+        "  D365_JSON_DECODER (auto | orjson | msgspec | ujson | json)\n"
+        "  D365_PAGE_SIZE, D365_STREAM_PAGES, D365_PREFETCH_PAGES, D365_COALESCE_GETS\n"
+        "  D365_PAGE_SIZE_AUTO, D365_PAGE_SIZE_MIN, D365_PAGE_SIZE_MAX, D365_PAGE_TARGET_BYTES, D365_PAGE_TARGET_SECONDS\n"
+        "  D365_PIPELINE_QUEUE, D365_PIPELINE_TRANSFORM_WORKERS\n"
+        "  D365_HEDGE_GETS, D365_HEDGE_PERCENTILE, D365_HEDGE_MIN_DELAY\n"
+        "  D365_POLL_MODE (modifiedon | delta), D365_CURSOR_FIELD (modifiedon | versionnumber), D365_POLL_CONCURRENCY\n"
+        "  D365_CHECKPOINT_PAGES, D365_CHECKPOINT_SECONDS\n"
+        "  D365_FULL_SYNC_PARTITIONS, D365_FULL_SYNC_PARTITION_BY (time | pk | auto)\n"
+        "  PROFILES_PATH=./data/profiles.json (per-tenant orgs; see common/profiles.py)\n"
         "  SMTP_HOST, SMTP_PORT, SMTP_SENDER, SUBMIT_EMAIL_TO\n"
         "  SFTP_HOST, SFTP_PORT, SFTP_USER, SFTP_PASSWORD\n\n"
         f"Raw error: {e}"
@@ -0,0 +1,120 @@
+# connectors/d365/breaker.py
+from __future__ import annotations
+import time
+from collections import deque
+from typing import Deque, Optional, Tuple
+from common.profiles import OrgRegistry, host_key, org_setting
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling Dataverse while an org's circuit is open."""
+
+    def __init__(self, org: str, retry_in: float):
+        self.org = org
+        self.retry_in = max(0.0, retry_in)
+        super().__init__(f"Dataverse org {org} is unavailable (circuit open); retry in {self.retry_in:.0f}s")
+
+
+class CircuitBreaker:
+    """
+    Per-org circuit breaker.
+
+    closed    -> calls flow; outcomes are kept for `window` seconds. Once at least
+                 `min_requests` were seen and the failure rate reaches
+                 `failure_rate`, the circuit opens.
+    open      -> calls fail fast with CircuitOpenError for `open_seconds`.
+    half_open -> exactly one probe call is let through; success closes the
+                 circuit, failure re-opens it.
+
+    Failures are 5xx responses and transport errors. 429 is not a failure:
+    the org is healthy, just asking us to slow down (see throttle.py).
+    """
+
+    def __init__(self, org: str, failure_rate: float = 0.5, min_requests: int = 10,
+                 window: float = 30.0, open_seconds: float = 30.0):
+        self.org = org
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.window = window
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._outcomes: Deque[Tuple[float, bool]] = deque()  # (monotonic ts, ok)
+        self._probe_in_flight = False
+
+    def _prune(self, now: float) -> None:
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            self._outcomes.popleft()
+
+    def _open(self, now: float) -> None:
+        self.state = OPEN
+        self.opened_at = now
+        self._outcomes.clear()
+        self._probe_in_flight = False
+
+    def check(self) -> None:
+        """Cheap pre-check (no probe taken): raise if the circuit is open."""
+        if self.state == OPEN:
+            remaining = self.opened_at + self.open_seconds - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpenError(self.org, remaining)
+
+    def allow(self) -> None:
+        """Raise CircuitOpenError unless a call may go upstream right now."""
+        now = time.monotonic()
+        if self.state == OPEN:
+            remaining = self.opened_at + self.open_seconds - now
+            if remaining > 0:
+                raise CircuitOpenError(self.org, remaining)
+            self.state = HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == HALF_OPEN:
+            if self._probe_in_flight:
+                raise CircuitOpenError(self.org, self.open_seconds)
+            self._probe_in_flight = True
+
+    def record(self, ok: Optional[bool]) -> None:
+        """Report the outcome of an allowed call. ok=None means no verdict (e.g. cancelled)."""
+        now = time.monotonic()
+        if self.state == HALF_OPEN:
+            if ok is None:
+                self._probe_in_flight = False
+            elif ok:
+                self.state = CLOSED
+                self._outcomes.clear()
+                self._probe_in_flight = False
+            else:
+                self._open(now)
+            return
+        if ok is None or self.state == OPEN:
+            return
+        self._outcomes.append((now, ok))
+        self._prune(now)
+        total = len(self._outcomes)
+        if total >= self.min_requests:
+            failures = sum(1 for _, o in self._outcomes if not o)
+            if failures / total >= self.failure_rate:
+                self._open(now)
+
+    def snapshot(self) -> dict:
+        return {"org": self.org, "state": self.state, "recent": len(self._outcomes)}
+
+
+def _new_breaker(url: str) -> CircuitBreaker:
+    return CircuitBreaker(
+        host_key(url),
+        failure_rate=org_setting(url, "d365_breaker_failure_rate"),
+        min_requests=org_setting(url, "d365_breaker_min_requests"),
+        window=org_setting(url, "d365_breaker_window"),
+        open_seconds=org_setting(url, "d365_breaker_open_seconds"),
+    )
+
+# per org; a new breaker (closed) once the org's breaker limits are edited
+_breakers: OrgRegistry[CircuitBreaker] = OrgRegistry(_new_breaker, depends_on=(
+    "d365_breaker_failure_rate", "d365_breaker_min_requests",
+    "d365_breaker_window", "d365_breaker_open_seconds"))
+
+def get_breaker(url: str) -> CircuitBreaker:
+    return _breakers.get(url)
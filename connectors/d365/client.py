@@ -1,15 +1,30 @@
 # connectors/d365/client.py
 from __future__ import annotations
-import asyncio
+import re
+import time
+import uuid
 import httpx
-from urllib.parse import urlparse
-from typing import Optional, Dict, Any
+from urllib.parse import urlparse, urlencode, quote
+from typing import Optional, Dict, Any, AsyncIterator, List
 from common.settings import settings
 from common.auth import get_dataverse_token
+from common.profiles import current_profile, profile_for_url, org_setting
+from common.httpclient import get_http_client
+from connectors.d365.throttle import get_governor
+from connectors.d365.breaker import get_breaker
+from connectors.d365.retry import (send_with_retries, get_retry_budget, default_policy,
+                                   DeadlineExceeded, attempt_timeout, remaining, within)
+from connectors.d365.codec import loads
+from connectors.d365.stream import iter_odata_page
+from connectors.d365.coalesce import SingleFlight, request_key
+from connectors.d365.hedge import get_latency_tracker, send_hedged
 
-TIMEOUT = 60  # seconds
-RETRIES = 3
-BACKOFF_BASE = 0.8  # seconds
+# identical concurrent GETs share one upstream call (see d365_get)
+_get_flights = SingleFlight()
+
+def _api_base() -> str:
+    # org of the tenant being served (common/profiles.py); .env org by default
+    return f"{current_profile().org_url}/api/data/v9.2"
 
 def _is_absolute(url: str) -> bool:
     try:
@@ -25,17 +40,60 @@ def _needs_consistency(params: Optional[Dict[str, Any]]) -> bool:
     v = params.get("$count")
     return bool(v) and str(v).lower() != "false"
 
+def _release_on_close(r: httpx.Response, governor) -> None:
+    """Hold a governor slot for a streamed response until it is closed."""
+    close = r.aclose
+    released = False
+
+    async def aclose() -> None:
+        nonlocal released
+        try:
+            await close()
+        finally:
+            if not released:
+                released = True
+                governor.release()
+
+    r.aclose = aclose
+
 async def _request(method: str, url_or_path: str,
                    params: Optional[Dict[str, Any]] = None,
                    json: Any = None,
                    extra_headers: Optional[Dict[str, str]] = None,
-                   max_page_size: Optional[int] = None):
-    token = await get_dataverse_token()
-
-    base = f"{settings.d365_org_url.rstrip('/')}/api/data/v9.2"
+                   max_page_size: Optional[int] = None,
+                   deadline: Optional[float] = None,
+                   raw: bool = False,
+                   stream: bool = False,
+                   content: Optional[bytes] = None,
+                   hedge: Optional[bool] = None):
+    """
+    One Dataverse call: circuit breaker -> token -> retry engine, where each
+    attempt takes a throttle-governor slot. `deadline` is a time.monotonic()
+    timestamp: waits for a token or a slot end there, each attempt's timeout is
+    cut to the time left and retries that can't finish are skipped
+    (DeadlineExceeded when it passes).
+    hedge: for GETs, send a duplicate once an attempt is slower than the org's
+    D365_HEDGE_PERCENTILE latency (connectors/d365/hedge.py); None = D365_HEDGE_GETS.
+    Returns the decoded JSON, or the undecoded body bytes when raw=True.
+    stream=True returns the open httpx.Response once headers arrived with a
+    2xx status; the caller reads the body and must aclose() it, which also
+    gives back the governor slot (a body still downloading counts against
+    the org's concurrency).
+    """
+    base = _api_base()
     is_abs = _is_absolute(url_or_path)
     url = url_or_path if is_abs else f"{base}{url_or_path}"
 
+    # nextLinks point at the org that issued them; authenticate for that org,
+    # and never hand a bearer token to a host that isn't one of our orgs
+    profile = profile_for_url(url)
+    if profile is None:
+        raise ValueError(f"Refusing to call {url}: not the org of any configured D365 profile")
+
+    breaker = get_breaker(url)
+    breaker.check()  # don't even fetch a token for an org that is down
+    token = await within(deadline, get_dataverse_token(profile))
+
     # If this is a nextLink (absolute), DO NOT append params again.
     effective_params = None if is_abs else (params or {})
 
@@ -50,55 +108,268 @@ async def _request(method: str, url_or_path: str,
     if extra_headers:
         headers.update(extra_headers)
 
-    last_exc = None
-    async with httpx.AsyncClient(timeout=TIMEOUT) as cli:
-        for attempt in range(1, RETRIES + 1):
+    cli = get_http_client(url)
+    governor = get_governor(url)
+    # per attempt (D365_HTTP_TIMEOUT of the org); retries are governed by connectors/d365/retry.py
+    attempt_cap = org_setting(url, "d365_http_timeout")
+
+    latency = get_latency_tracker(url)
+    if hedge is None:
+        hedge = org_setting(url, "d365_hedge_gets")
+    hedge = bool(hedge) and method == "GET" and not stream
+
+    async def send_once(is_hedge: bool = False) -> Optional[httpx.Response]:
+        # the governor queues callers fairly and caps in-flight requests per org;
+        # a hedge only takes a slot that is free right now
+        if is_hedge:
+            if not governor.try_acquire():
+                return None
+        else:
             try:
-                r = await cli.request(method, url, params=effective_params, json=json, headers=headers)
-                # Fast path
-                if r.status_code < 400:
-                    return r.json()
-                # Throttle or transient
-                if r.status_code in (429, 502, 503, 504):
-                    # Honor Retry-After if present
-                    ra = r.headers.get("Retry-After")
-                    delay = float(ra) if ra else BACKOFF_BASE * (2 ** (attempt - 1))
-                    await asyncio.sleep(delay)
-                    continue
-                # Other errors -> raise with body for debugging
-                raise httpx.HTTPStatusError(
-                    f"{r.status_code} {r.reason_phrase} - {r.text}",
-                    request=r.request,
-                    response=r,
-                )
-            except (httpx.ReadTimeout, httpx.ConnectTimeout, httpx.RemoteProtocolError) as e:
-                last_exc = e
-                # retry transient network errors
-                if attempt < RETRIES:
-                    await asyncio.sleep(BACKOFF_BASE * (2 ** (attempt - 1)))
-                    continue
+                await within(deadline, governor.acquire())
+            except BaseException:
+                # never sent (deadline or cancelled while queued): free the breaker's probe
+                breaker.record(None)
                 raise
-        # If we somehow fall out of loop
-        if last_exc:
-            raise last_exc
+        r = None
+        try:
+            timeout = attempt_timeout(deadline, attempt_cap)
+            req = cli.build_request(method, url, params=effective_params, json=json,
+                                    content=content, headers=headers, timeout=timeout)
+            started = time.monotonic()
+            r = await cli.send(req, stream=stream)
+            if stream and r.status_code >= 400:
+                await r.aread()  # keep the error body for HTTPStatusError, free the connection
+                await r.aclose()
+            elif stream:
+                _release_on_close(r, governor)
+        except httpx.TimeoutException as e:
+            if timeout < attempt_cap:
+                # cut short by the caller's deadline: not the org's fault, and no time to retry
+                breaker.record(None)
+                raise DeadlineExceeded(f"deadline exceeded during {method} {url}") from e
+            breaker.record(False)
+            raise
+        except httpx.TransportError:
+            breaker.record(False)
+            raise
+        except BaseException:
+            breaker.record(None)
+            raise
+        finally:
+            if not (stream and r is not None and r.status_code < 400):
+                governor.release()
+        breaker.record(r.status_code < 500)
+        governor.observe(r.status_code, r.headers)
+        if method == "GET" and not stream and r.status_code < 400:
+            latency.record(time.monotonic() - started)
+        return r
+
+    async def send(attempt: int) -> httpx.Response:
+        remaining(deadline)  # raises DeadlineExceeded instead of starting an attempt too late
+        # fail fast (CircuitOpenError) while the org is known to be down
+        breaker.allow()
+        if not hedge or breaker.state != "closed":
+            return await send_once()
+        delay = latency.hedge_delay(org_setting(url, "d365_hedge_percentile"),
+                                    org_setting(url, "d365_hedge_min_delay"))
+        return await send_hedged(send_once, delay)
+
+    r = await send_with_retries(send, method=method, budget=get_retry_budget(url),
+                                policy=default_policy(url), deadline=deadline)
+    # Fast path
+    if r.status_code < 400:
+        if stream:
+            return r
+        return r.content if raw else loads(r.content)
+    # Errors (or retries exhausted) -> raise with body for debugging
+    raise httpx.HTTPStatusError(
+        f"{r.status_code} {r.reason_phrase} - {r.text}",
+        request=r.request,
+        response=r,
+    )
 
 async def d365_get(path_or_nextlink: str,
                    params: Optional[Dict[str, Any]] = None,
                    extra_headers: Optional[Dict[str, str]] = None,
-                   max_page_size: Optional[int] = None):
+                   max_page_size: Optional[int] = None,
+                   deadline: Optional[float] = None,
+                   raw: bool = False,
+                   hedge: Optional[bool] = None):
     """
     GET wrapper. If you pass an absolute @odata.nextLink, do NOT pass params.
+    raw=True returns the response bytes undecoded (for callers that only store them).
+    hedge=True/False forces hedging on/off for this call (default: D365_HEDGE_GETS).
+
+    Identical GETs that are in flight at the same time (same org, URL, params
+    and response-shaping headers) are coalesced into one upstream call, so
+    callers share the returned object: treat it as read-only. Each caller's
+    deadline only bounds its own wait, not the shared call.
     """
     # guard: if absolute AND params provided, ignore to prevent duplication
     if _is_absolute(path_or_nextlink):
         params = None
-    return await _request("GET", path_or_nextlink, params=params,
-                          extra_headers=extra_headers, max_page_size=max_page_size)
+
+    async def call(deadline: Optional[float] = None):
+        return await _request("GET", path_or_nextlink, params=params,
+                              extra_headers=extra_headers, max_page_size=max_page_size,
+                              deadline=deadline, raw=raw, hedge=hedge)
+
+    if not settings.d365_coalesce_gets:
+        return await call(deadline)
+    # per org AND app user: two tenants on one org may see different rows
+    prof = current_profile()
+    key = request_key(prof.org_url, path_or_nextlink, params, extra_headers, max_page_size, raw, prof.client_id)
+    # the shared call runs without a deadline; each caller only waits until its own
+    return await _get_flights.do(key, call, deadline=deadline)
+
+async def d365_get_absolute(next_link: str,
+                            extra_headers: Optional[Dict[str, str]] = None,
+                            deadline: Optional[float] = None,
+                            raw: bool = False):
+    """
+    GET an absolute @odata.nextLink / deltaLink exactly as Dataverse returned it
+    (no params re-applied), through the same authenticated, throttled and
+    retrying path as d365_get. Resend the first page's Prefer header so page
+    size stays the same.
+    """
+    if not _is_absolute(next_link):
+        raise ValueError(f"d365_get_absolute needs an absolute URL, got {next_link!r}")
+    return await d365_get(next_link, extra_headers=extra_headers, deadline=deadline, raw=raw)
+
+async def d365_whoami():
+    """(ok, info) for the connector test endpoint: WhoAmI against the current tenant's org."""
+    try:
+        return True, await d365_get("/WhoAmI")
+    except httpx.HTTPStatusError as e:
+        return False, {"error": f"{e.response.status_code} {e.response.text}"}
 
 async def d365_post(path: str,
                     payload: Any,
-                    extra_headers: Optional[Dict[str, str]] = None):
+                    extra_headers: Optional[Dict[str, str]] = None,
+                    deadline: Optional[float] = None):
     """
     POST wrapper for actions/operations.
     """
-    return await _request("POST", path, json=payload, extra_headers=extra_headers)
\ No newline at end of file
+    return await _request("POST", path, json=payload, extra_headers=extra_headers,
+                          deadline=deadline)
+
+async def d365_stream_rows(path_or_nextlink: str,
+                           trailer: Dict[str, Any],
+                           params: Optional[Dict[str, Any]] = None,
+                           extra_headers: Optional[Dict[str, str]] = None,
+                           max_page_size: Optional[int] = None,
+                           deadline: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    GET one page and yield its rows while the body is still downloading.
+    Non-row keys (@odata.nextLink, @odata.deltaLink, ...) land in `trailer`
+    once the page has been fully consumed.
+    """
+    if _is_absolute(path_or_nextlink):
+        params = None
+    r = await _request("GET", path_or_nextlink, params=params, extra_headers=extra_headers,
+                       max_page_size=max_page_size, deadline=deadline, stream=True)
+    try:
+        async for row in iter_odata_page(r.aiter_bytes(), trailer):
+            yield row
+    finally:
+        await r.aclose()
+
+
+# ---------- OData $batch ----------
+
+BATCH_MAX_PARTS = 1000  # Dataverse limit per $batch request
+
+def _batch_part_url(path: str, params: Optional[Dict[str, Any]]) -> str:
+    url = path if _is_absolute(path) else f"{_api_base()}{path}"
+    if params and not _is_absolute(path):
+        url += "?" + urlencode({k: str(v) for k, v in params.items()}, quote_via=quote, safe="$,'()")
+    return url
+
+def _build_batch_body(boundary: str, requests: List[Dict[str, Any]]) -> bytes:
+    lines: List[str] = []
+    for req in requests:
+        method = (req.get("method") or "GET").upper()
+        if method != "GET":
+            # writes need a changeset (atomic multipart inside the batch); not supported yet
+            raise ValueError(f"d365_batch only supports GET parts, got {method}")
+        lines += [
+            f"--{boundary}",
+            "Content-Type: application/http",
+            "Content-Transfer-Encoding: binary",
+            "",
+            f"GET {_batch_part_url(req['path'], req.get('params'))} HTTP/1.1",
+            "Accept: application/json",
+        ]
+        headers = dict(req.get("headers") or {})
+        if req.get("max_page_size"):
+            headers["Prefer"] = f"odata.maxpagesize={int(req['max_page_size'])}"
+        lines += [f"{k}: {v}" for k, v in headers.items()]
+        lines.append("")
+    lines += [f"--{boundary}--", ""]
+    return "\r\n".join(lines).encode("utf-8")
+
+_BLANK_LINE = re.compile(rb"\r?\n\r?\n")
+
+def _parse_headers(block: bytes) -> Dict[str, str]:
+    out: Dict[str, str] = {}
+    for line in block.decode("utf-8", "replace").splitlines():
+        if ":" in line:
+            k, v = line.split(":", 1)
+            out[k.strip()] = v.strip()
+    return out
+
+def _parse_batch_response(body: bytes) -> List[Dict[str, Any]]:
+    """Split a multipart/mixed $batch response into [{status, headers, body}] in request order."""
+    first = body.lstrip().split(b"\n", 1)[0].strip()
+    if not first.startswith(b"--"):
+        raise ValueError("Unexpected $batch response: no multipart boundary")
+    boundary = first
+    results: List[Dict[str, Any]] = []
+    for part in body.split(boundary)[1:]:
+        if part.startswith(b"--"):
+            break  # closing delimiter
+        # part = MIME headers, blank line, embedded HTTP response
+        mime = _BLANK_LINE.split(part.strip(b"\r\n"), 1)
+        if len(mime) < 2:
+            continue
+        http = _BLANK_LINE.split(mime[1], 1)
+        head = http[0].decode("utf-8", "replace").splitlines()
+        status_line, header_lines = head[0], "\n".join(head[1:]).encode()
+        status = int(status_line.split()[1])
+        payload = http[1].strip() if len(http) > 1 else b""
+        results.append({
+            "status": status,
+            "headers": _parse_headers(header_lines),
+            "body": loads(payload) if payload else None,
+        })
+    return results
+
+async def d365_batch(requests: List[Dict[str, Any]],
+                     deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Send many GETs in one OData $batch round-trip (chunked at BATCH_MAX_PARTS).
+
+    requests: [{"path": "/accounts", "params": {...}, "headers": {...}, "max_page_size": 200}, ...]
+    returns:  [{"status": 200, "headers": {...}, "body": {...} | None}, ...] in the same order.
+
+    Each part succeeds or fails on its own: check "status" per result.
+    The whole batch counts as one request against throttling and the retry budget.
+    """
+    results: List[Dict[str, Any]] = []
+    for i in range(0, len(requests), BATCH_MAX_PARTS):
+        chunk = requests[i:i + BATCH_MAX_PARTS]
+        boundary = f"batch_{uuid.uuid4()}"
+        raw_body = await _request(
+            "POST", "/$batch",
+            content=_build_batch_body(boundary, chunk),
+            extra_headers={"Content-Type": f"multipart/mixed; boundary={boundary}",
+                           "OData-Version": "4.0", "OData-MaxVersion": "4.0"},
+            deadline=deadline,
+            raw=True,
+        )
+        parts = _parse_batch_response(raw_body)
+        if len(parts) != len(chunk):
+            raise ValueError(f"$batch returned {len(parts)} parts for {len(chunk)} requests")
+        results.extend(parts)
+    return results
@@ -0,0 +1,64 @@
+# connectors/d365/coalesce.py
+from __future__ import annotations
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Mapping, Optional
+from connectors.d365.retry import within
+
+# Headers that change what Dataverse returns for the same URL; anything else
+# (Authorization, Accept, ...) is identical for every caller of one org.
+RELEVANT_HEADERS = ("prefer", "consistencylevel", "if-none-match")
+
+
+class SingleFlight:
+    """
+    Deduplicates identical concurrent calls: the first caller for a key runs
+    the call, everyone arriving while it is in flight awaits the same result
+    (or exception). Nothing is cached once the call has finished.
+
+    Each caller waits until its own `deadline` (DeadlineExceeded), so `fn`
+    should not carry one caller's deadline. Once every caller has stopped
+    waiting (deadline, cancellation), the call is cancelled.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._waiters: Dict[asyncio.Future, int] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]],
+                 deadline: Optional[float] = None) -> Any:
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(fn())
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda f, k=key: self._forget(k, f))
+        self._waiters[fut] = self._waiters.get(fut, 0) + 1
+        try:
+            # shield: one caller giving up must not cancel the call others wait on
+            return await within(deadline, asyncio.shield(fut))
+        finally:
+            self._waiters[fut] -= 1
+            if not self._waiters[fut]:
+                del self._waiters[fut]
+                if not fut.done():
+                    # nobody is waiting any more; later callers start a fresh call
+                    if self._inflight.get(key) is fut:
+                        del self._inflight[key]
+                    fut.cancel()
+
+    def _forget(self, key: Hashable, fut: asyncio.Future) -> None:
+        if self._inflight.get(key) is fut:
+            del self._inflight[key]
+        if not fut.cancelled():
+            fut.exception()  # mark retrieved even if every waiter went away
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+
+def request_key(org: str, path: str, params: Optional[Mapping[str, Any]],
+                headers: Optional[Mapping[str, str]], *extra: Hashable) -> tuple:
+    """Key for 'the same GET': org, path, params and the response-shaping headers."""
+    p = tuple(sorted((str(k), str(v)) for k, v in (params or {}).items()))
+    h = tuple(sorted((k.lower(), str(v)) for k, v in (headers or {}).items()
+                     if k.lower() in RELEVANT_HEADERS))
+    return (org.lower(), path, p, h) + extra
@@ -0,0 +1,55 @@
+# connectors/d365/codec.py
+from __future__ import annotations
+import json
+from typing import Any, Callable, Dict
+from common.settings import settings
+
+# Pluggable JSON decoding for Dataverse payloads. The fast decoders are
+# optional: install orjson (or msgspec / ujson) to use them, otherwise the
+# standard library parser is used. All of them take the raw response bytes,
+# which skips httpx's bytes -> str decode step as well.
+
+def _stdlib() -> Callable[[bytes], Any]:
+    return json.loads
+
+def _orjson() -> Callable[[bytes], Any]:
+    import orjson
+    return orjson.loads
+
+def _msgspec() -> Callable[[bytes], Any]:
+    import msgspec
+    return msgspec.json.Decoder().decode
+
+def _ujson() -> Callable[[bytes], Any]:
+    import ujson
+    return ujson.loads
+
+DECODERS: Dict[str, Callable[[], Callable[[bytes], Any]]] = {
+    "orjson": _orjson,
+    "msgspec": _msgspec,
+    "ujson": _ujson,
+    "json": _stdlib,
+}
+AUTO_ORDER = ("orjson", "msgspec", "ujson", "json")
+
+def get_decoder(name: str = "auto") -> tuple[str, Callable[[bytes], Any]]:
+    """
+    Resolve a decoder by name ('auto' = fastest installed).
+    Raises ImportError if a specific, uninstalled decoder is requested.
+    """
+    if name != "auto":
+        if name not in DECODERS:
+            raise ValueError(f"Unknown JSON decoder '{name}'. Use one of: auto, {', '.join(DECODERS)}")
+        return name, DECODERS[name]()
+    for cand in AUTO_ORDER:
+        try:
+            return cand, DECODERS[cand]()
+        except ImportError:
+            continue
+    return "json", _stdlib()
+
+DECODER_NAME, _loads = get_decoder(settings.d365_json_decoder)
+
+def loads(data: bytes | str) -> Any:
+    """Decode a Dataverse JSON payload with the configured decoder."""
+    return _loads(data)
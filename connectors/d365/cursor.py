@@ -0,0 +1,68 @@
+# connectors/d365/cursor.py
+from __future__ import annotations
+from typing import Any, Dict, Optional, Tuple, Union
+from connectors.d365.partition import guid_sort_key
+
+# Poll cursors (stored through common/cursors.py). A cursor is the position
+# of the last row read, in the order the poll reads rows:
+#
+#   "2025-09-08T21:54:24Z"                          legacy: modifiedon gt <ts>
+#   {"modifiedon": "2025-09-08T21:54:24Z",
+#    "pk": "<guid>"}                                after that row in (modifiedon, pk) order
+#   {"versionnumber": 48211734}                     after that row version
+#
+# modifiedon alone cannot say where a poll stopped inside a run of rows that
+# share one timestamp (Dataverse stores whole seconds, bulk updates stamp
+# thousands of rows alike): "gt" loses the rest of them, "ge" reads them all
+# again every poll. Ordering by (modifiedon, pk) makes every row's position
+# unique, so the next poll starts exactly after the last row read.
+# versionnumber (the row version) is unique on its own and also moves when a
+# row changes without touching modifiedon.
+
+CURSOR_FIELDS = ("modifiedon", "versionnumber")
+
+Cursor = Union[str, Dict[str, Any]]
+
+
+def parse_cursor(value: Optional[Cursor]) -> Optional[Dict[str, Any]]:
+    """Stored cursor -> dict form (None if unset)."""
+    if not value:
+        return None
+    if isinstance(value, dict):
+        return value
+    return {"modifiedon": value}
+
+def cursor_filter(cursor: Optional[Cursor], pk: Optional[str]) -> Optional[str]:
+    """$filter for the rows after `cursor` (None = no cursor, read everything)."""
+    c = parse_cursor(cursor)
+    if not c:
+        return None
+    if "versionnumber" in c:
+        return f"versionnumber gt {int(c['versionnumber'])}"
+    m = c["modifiedon"]
+    # Dataverse OData v4 accepts datetimeoffset literals like 2025-09-08T21:54:24Z (no quotes).
+    if c.get("pk") and pk:
+        return f"(modifiedon ne null) and ((modifiedon gt {m}) or (modifiedon eq {m} and {pk} gt {c['pk']}))"
+    return f"(modifiedon ne null) and (modifiedon gt {m})"
+
+def cursor_orderby(field: str, pk: Optional[str]) -> str:
+    if field == "versionnumber":
+        return "versionnumber asc"
+    return f"modifiedon asc,{pk} asc" if pk else "modifiedon asc"
+
+def row_cursor(row: Dict[str, Any], field: str, pk: Optional[str]) -> Optional[Dict[str, Any]]:
+    """The cursor pointing just after `row` (None if the row lacks the field)."""
+    if field == "versionnumber":
+        v = row.get("versionnumber")
+        return {"versionnumber": int(v)} if v is not None else None
+    m = row.get("modifiedon")
+    if not m:
+        return None
+    return {"modifiedon": m, "pk": row.get(pk)} if pk and row.get(pk) else {"modifiedon": m}
+
+def cursor_sort_key(cursor: Cursor) -> Tuple:
+    """Sort key matching Dataverse's order (GUIDs in SQL Server order), for max() over unordered rows."""
+    c = parse_cursor(cursor)
+    if "versionnumber" in c:
+        return (1, int(c["versionnumber"]))
+    return (0, c["modifiedon"], guid_sort_key(c["pk"]) if c.get("pk") else -1)
@@ -0,0 +1,79 @@
+# connectors/d365/hedge.py
+from __future__ import annotations
+import asyncio
+import math
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional
+import httpx
+from common.profiles import OrgRegistry
+
+# Hedged reads: if a GET hasn't answered by the org's p<N> latency, the same
+# GET is sent again and whichever response arrives first wins; the slower one
+# is cancelled. The hedge only runs when the throttle governor has a free slot
+# (see client._request), so it is counted against the org's concurrency and
+# never queues behind, or ahead of, real traffic.
+
+MIN_SAMPLES = 20  # no hedging until an org has this many latency samples
+WINDOW = 500      # recent successful GET latencies kept per org
+
+
+class LatencyTracker:
+    """Rolling window of successful GET latencies (seconds) for one org."""
+
+    def __init__(self, window: int = WINDOW):
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def quantile(self, pct: float) -> Optional[float]:
+        """Latency at percentile `pct` (0-100), or None while there are too few samples."""
+        if len(self._samples) < MIN_SAMPLES:
+            return None
+        s = sorted(self._samples)
+        i = min(len(s) - 1, max(0, math.ceil(pct / 100.0 * len(s)) - 1))
+        return s[i]
+
+    def hedge_delay(self, pct: float, min_delay: float) -> Optional[float]:
+        q = self.quantile(pct)
+        return None if q is None else max(min_delay, q)
+
+    def snapshot(self) -> dict:
+        return {"samples": len(self._samples),
+                "p50": self.quantile(50), "p95": self.quantile(95), "p99": self.quantile(99)}
+
+
+_trackers: OrgRegistry[LatencyTracker] = OrgRegistry(lambda url: LatencyTracker())
+
+def get_latency_tracker(url: str) -> LatencyTracker:
+    return _trackers.get(url)
+
+
+async def send_hedged(send_once: Callable[[bool], Awaitable[Optional[httpx.Response]]],
+                      delay: Optional[float]) -> httpx.Response:
+    """
+    Run send_once(False); if it has not finished after `delay` seconds, also
+    run send_once(True) and return the first response. send_once(True) may
+    return None to skip the hedge (no free slot). If one call fails the other
+    is still awaited; the first error is raised only if both fail.
+    """
+    primary = asyncio.ensure_future(send_once(False))
+    if delay is None:
+        return await primary
+    pending = {primary}
+    errors = []
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if not done:
+            pending.add(asyncio.ensure_future(send_once(True)))
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.exception() is not None:
+                    errors.append(t.exception())
+                elif t.result() is not None:
+                    return t.result()
+        raise errors[0]
+    finally:
+        for t in pending:
+            t.cancel()  # the loser gives its governor slot and connection back
@@ -1,16 +1,31 @@
 # connectors/d365/ingest.py
 from __future__ import annotations
+import asyncio
+import logging
+import time
 from datetime import datetime, timezone
-from typing import Optional
-from connectors.d365.metadata import get_table
+from typing import Any, AsyncIterator, Optional, Dict, List, Tuple
+import httpx
+from connectors.d365.metadata import get_table, get_tables_meta
 from connectors.d365.paginate import paginate_table
+from connectors.d365.pipeline import Page, Sink, Transform, run_pipeline
+from connectors.d365.partition import plan_partitions, scan_partitions
+from connectors.d365.client import d365_batch, d365_get
+from connectors.d365.cursor import CURSOR_FIELDS, cursor_filter, cursor_orderby, cursor_sort_key, row_cursor
+from connectors.d365.retry import DeadlineExceeded, within
+from connectors.d365.breaker import CircuitOpenError
+from connectors.d365.throttle import get_governor
 from connectors.d365.mapping import map_d365_event
+from connectors.d365.pagesize import observe as observe_pages, page_size
 from common.cursors import get_cursor, set_cursor
-from pathlib import Path
-import json
+from common.profiles import current_profile
+from common.rowstore import get_row_writer
+
+log = logging.getLogger("integration-hub.ingest")
 
 # ---- Configure your custom table + columns here ----
 TABLE_PATH = "/cr83d_sourcingevents"  # entity set (plural) name
+TABLE_PK = "cr83d_sourcingeventid"
 SELECT = (
     "cr83d_sourcingeventid,cr83d_title,cr83d_status,"
     "cr83d_due_at,modifiedon,createdon"
@@ -29,14 +44,6 @@ def _is_iso_z(ts: str) -> bool:
     except Exception:
         return False
 
-def _max_dt(a: Optional[str], b: Optional[str]) -> Optional[str]:
-    """Return the later of two ISO Z timestamps (or the non-None one)."""
-    if not a: return b
-    if not b: return a
-    da = datetime.fromisoformat(a.replace("Z", "+00:00"))
-    db = datetime.fromisoformat(b.replace("Z", "+00:00"))
-    return a if da >= db else b
-
 # ------------- main poller ----------------
 async def poll_sourcing_events(
     tenant_id: str,
@@ -44,6 +51,7 @@ async def poll_sourcing_events(
     max_records: Optional[int] = None,
     force_full: bool = False,
     since_iso: Optional[str] = None,
+    resume: bool = False,
 ) -> int:
     """
     Poll the custom table and publish/print mapped events.
@@ -57,62 +65,82 @@ async def poll_sourcing_events(
         max_records: optional cap on total items processed.
         force_full: ignore stored cursor; start from beginning.
         since_iso: ISO-Z string (e.g., '2025-09-08T21:54:24Z') to override cursor for this call only.
+        resume: with force_full, continue an interrupted full run from its
+            checkpoint instead of starting over.
 
     Cursor rules (in priority order):
-      1) if force_full -> no $filter
+      1) if force_full -> no $filter (resume: the full run's checkpoint)
       2) elif since_iso (valid) -> filter from since_iso
       3) elif stored cursor -> filter from stored cursor
       4) else -> no $filter (first-time full catch-up)
     """
 
-    # 1) Load existing cursor (string ISO-Z or None)
+    # 1) Load existing cursor (ISO-Z string, compound cursor dict, or None)
     stored_cursor = get_cursor(tenant_id, "cr83d_sourcingevents")
 
     # 2) Decide effective starting point
-    effective_cursor: Optional[str] = None
+    effective_cursor = None
     if not force_full:
         if since_iso and _is_iso_z(since_iso):
             effective_cursor = since_iso
-        elif stored_cursor and _is_iso_z(stored_cursor):
+        elif isinstance(stored_cursor, dict) or (stored_cursor and _is_iso_z(stored_cursor)):
             effective_cursor = stored_cursor
+    elif resume:
+        # an interrupted full run continues from its last checkpoint
+        effective_cursor = get_cursor(tenant_id, f"cr83d_sourcingevents{CHECKPOINT_SUFFIX}")
 
-    # 3) Build query params
-    params = {"$select": SELECT, "$orderby": "modifiedon asc"}
+    # 3) Build query params: (modifiedon, pk) order, starting just after the cursor row
+    params = {"$select": SELECT, "$orderby": cursor_orderby("modifiedon", TABLE_PK)}
     if effective_cursor:
-        # Dataverse OData v4 accepts datetimeoffset literals like 2025-09-08T21:54:24Z (no quotes).
-        # Add a not-null guard in case some rows have null modifiedon.
-        params["$filter"] = f"(modifiedon ne null) and (modifiedon gt {effective_cursor})"
+        params["$filter"] = cursor_filter(effective_cursor, TABLE_PK)
 
     processed = 0
-    pages_seen = 0
-    latest_seen: Optional[str] = effective_cursor
-
-    # 4) Iterate with pagination
-    async for row, page_bumped in paginate_table(TABLE_PATH, params=params, page_size=200):
-        if page_bumped:
-            pages_seen += 1
-            if limit_pages and pages_seen > limit_pages:
-                break
-
-        # Skip rows missing modifiedon (should be rare)
-        mod = row.get("modifiedon")
-        if not mod:
-            # You could choose to use createdon here as a fallback
-            mod = row.get("createdon")
-
+    latest_seen = effective_cursor
+    state: Dict[str, object] = {}
+    checkpoint = _Checkpointer(tenant_id, "cr83d_sourcingevents", force_full)
+    if force_full and not resume:
+        checkpoint.finish()  # starting over: an older run's checkpoint no longer applies
+    sizing = _PageSizing(tenant_id, "cr83d_sourcingevents")
+
+    # 4) Fetch -> map -> publish pipeline
+    def map_page(rows: List[dict]) -> list:
         # Map to canonical model (and later publish to the bus)
-        ev = map_d365_event(row, tenant_id)
-        print("EVENT:", ev.model_dump())  # TODO: replace with bus.publish(...)
-
-        # Update cursor tracker with the latest 'modifiedon' we saw
-        if mod:
-            latest_seen = _max_dt(latest_seen, mod)
-
-        processed += 1
-        if max_records and processed >= max_records:
-            break
+        return [map_d365_event(row, tenant_id) for row in rows]
+
+    async def publish(page: Page) -> None:
+        for ev in page.items:
+            print("EVENT:", ev.model_dump())  # TODO: replace with bus.publish(...)
+
+    async def page_done(page: Page) -> None:
+        # Pages complete in cursor order: the last one is where we are
+        # (rows missing modifiedon sort first and carry no position)
+        nonlocal processed, latest_seen
+        processed += len(page.rows)
+        if page.pos:
+            latest_seen = page.pos
+            checkpoint.row(page.pos)
+        await checkpoint.page()
+
+    rows = paginate_table(TABLE_PATH, params=params,
+                          page_size=sizing.size,
+                          stream=current_profile().setting("d365_stream_pages"),
+                          prefetch=current_profile().setting("d365_prefetch_pages"),
+                          max_pages=limit_pages,
+                          state=state)
+    try:
+        await run_pipeline(_pages(rows, max_records, "modifiedon", TABLE_PK),
+                           {"events": publish}, transform=map_page, on_page_done=page_done,
+                           **_pipeline_opts())
+    except httpx.TimeoutException:
+        sizing.done(state, timed_out=True)
+        raise
+    sizing.done(state)
 
     # 5) Persist updated cursor only if we advanced
+    if state.get("complete"):
+        checkpoint.finish()
+    else:
+        await checkpoint.save()
     if latest_seen and latest_seen != stored_cursor:
         set_cursor(tenant_id, "cr83d_sourcingevents", latest_seen)
 
@@ -134,13 +162,6 @@ async def poll_sourcing_events_no_cursor(
         since_iso=None,
     )
 
-def _store_raw_row(tenant: str, logical: str, row: dict):
-    p = Path(".runtime") / "data" / tenant
-    p.mkdir(parents=True, exist_ok=True)
-    (p / f"{logical}.jsonl").open("a", encoding="utf-8").write(
-        json.dumps(row, ensure_ascii=False) + "\n"
-    )
-
 def _max_iso(a: Optional[str], b: Optional[str]) -> Optional[str]:
     if not a: return b
     if not b: return a
@@ -149,6 +170,157 @@ def _max_iso(a: Optional[str], b: Optional[str]) -> Optional[str]:
     db = datetime.fromisoformat(b.replace("Z","+00:00"))
     return a if da >= db else b
 
+def _table_params(tenant: str, logical: str, force_full: bool, since_iso: Optional[str],
+                  pk: Optional[str] = None, field: str = "modifiedon", resume: bool = False):
+    """
+    Build one poll's OData query: rows after the cursor, in cursor order
+    (connectors/d365/cursor.py). Returns (params, stored_cursor, effective_cursor).
+    """
+    stored = get_cursor(tenant, logical)
+    effective = None
+    if not force_full:
+        effective = since_iso or stored
+    elif resume and not since_iso:
+        # an interrupted full sync continues from its last checkpoint
+        effective = get_cursor(tenant, f"{logical}{CHECKPOINT_SUFFIX}")
+
+    params = {"$orderby": cursor_orderby(field, pk)}
+    if effective:
+        # a cursor stored under the other field still says which rows are new
+        params["$filter"] = cursor_filter(effective, pk)
+    return params, stored, effective
+
+# Whether an entity set can be filtered / ordered on versionnumber, per (org, set).
+_versionnumber_ok: Dict[tuple, bool] = {}
+
+def _known_cursor_field(set_name: str) -> Optional[str]:
+    """D365_CURSOR_FIELD for this table, or None while versionnumber support is unknown."""
+    field = current_profile().setting("d365_cursor_field")
+    if field not in CURSOR_FIELDS:
+        raise ValueError(f"D365_CURSOR_FIELD must be one of {CURSOR_FIELDS}; got {field!r}")
+    if field == "modifiedon":
+        return field
+    ok = _versionnumber_ok.get((current_profile().host, set_name))
+    return None if ok is None else ("versionnumber" if ok else "modifiedon")
+
+async def _cursor_field(set_name: str, deadline: Optional[float] = None) -> str:
+    """Like _known_cursor_field(), probing the table once if needed."""
+    field = _known_cursor_field(set_name)
+    if field is not None:
+        return field
+    try:
+        await d365_get(f"/{set_name}", params={"$select": "versionnumber", "$orderby": "versionnumber asc",
+                                               "$top": 1}, deadline=deadline)
+        ok = True
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code != 400:
+            raise
+        log.warning("%s: no versionnumber, using the (modifiedon, pk) cursor", set_name)
+        ok = False
+    _versionnumber_ok[(current_profile().host, set_name)] = ok
+    return "versionnumber" if ok else "modifiedon"
+
+# Where a force_full run keeps its mid-run checkpoint (incremental runs checkpoint the cursor itself).
+CHECKPOINT_SUFFIX = "@checkpoint"
+
+class _Checkpointer:
+    """
+    Periodic resume points for a read in cursor order.
+
+    The cursor of the last row read is an exact resume point (see
+    connectors/d365/cursor.py). Every `pages` pages or `seconds` seconds
+    (D365_CHECKPOINT_PAGES / _SECONDS, 0 = off) the rows are committed and
+    that point is saved: into the table's cursor for incremental runs, into
+    "<key>@checkpoint" for force_full runs (cleared when they finish).
+    """
+
+    def __init__(self, tenant: str, key: str, full: bool, writer=None):
+        prof = current_profile()
+        self.tenant, self.key, self.full, self.writer = tenant, key, full, writer
+        self.every_pages = prof.setting("d365_checkpoint_pages")
+        self.every_seconds = prof.setting("d365_checkpoint_seconds")
+        self.saved: Optional[dict] = None
+        self._last: Optional[dict] = None
+        self._pages = 0
+        self._since = time.monotonic()
+
+    def row(self, pos: Optional[dict]) -> None:
+        if pos:
+            self._last = pos
+
+    async def page(self) -> None:
+        """Call at each page boundary (before the new page's rows)."""
+        self._pages += 1
+        due = (self.every_pages and self._pages >= self.every_pages) or \
+              (self.every_seconds and time.monotonic() - self._since >= self.every_seconds)
+        if due:
+            await self.save()
+
+    async def save(self) -> None:
+        self._pages, self._since = 0, time.monotonic()
+        pos = self._last
+        if not pos or pos == self.saved:
+            return
+        if self.writer is not None:
+            await self.writer.commit()
+        set_cursor(self.tenant, f"{self.key}{CHECKPOINT_SUFFIX}" if self.full else self.key, pos)
+        self.saved = pos
+
+    def finish(self) -> None:
+        """The run read everything (or starts over): drop a full sync's checkpoint."""
+        if self.full and get_cursor(self.tenant, f"{self.key}{CHECKPOINT_SUFFIX}"):
+            set_cursor(self.tenant, f"{self.key}{CHECKPOINT_SUFFIX}", None)
+
+async def _pages(rows: AsyncIterator, max_records: Optional[int],
+                 field: str, pk: Optional[str]) -> AsyncIterator[Page]:
+    """
+    Group paginate_table()'s (row, page_bumped) stream into pipeline Pages,
+    stopping after max_records rows (paginate_table enforces the page limit).
+    page.pos is the cursor of the page's last positioned row.
+    """
+    seq = count = 0
+    buf: List[dict] = []
+
+    def page() -> Page:
+        pos = next((c for c in (row_cursor(r, field, pk) for r in reversed(buf)) if c), None)
+        return Page(seq, buf, pos)
+
+    try:
+        async for row, page_bumped in rows:
+            if page_bumped:
+                if buf:
+                    yield page()
+                    seq, buf = seq + 1, []
+            buf.append(row)
+            count += 1
+            if max_records and count >= max_records:
+                break
+        if buf:
+            yield page()
+    finally:
+        await rows.aclose()  # stop paginate_table's prefetch right away
+
+def _pipeline_opts() -> dict:
+    prof = current_profile()
+    return {"queue_size": prof.setting("d365_pipeline_queue"),
+            "transform_workers": prof.setting("d365_pipeline_transform_workers")}
+
+class _PageSizing:
+    """
+    Page size of one poll (auto-tuned per table, see connectors/d365/pagesize.py):
+    request .size, then report the pages with done(state) once the poll ended.
+    """
+
+    def __init__(self, tenant: str, logical: str):
+        self.tenant, self.logical = tenant, logical
+        self.size = page_size(tenant, logical)
+        self._governor = get_governor(current_profile().org_url)
+        self._throttled = self._governor.throttled
+
+    def done(self, state: Dict[str, object], timed_out: bool = False) -> None:
+        observe_pages(self.tenant, self.logical, self.size, state.get("fetched"),
+                      throttled=self._governor.throttled > self._throttled, timed_out=timed_out)
+
 async def poll_table(
     tenant: str,
     logical: str,
@@ -156,48 +328,461 @@ async def poll_table(
     max_records: Optional[int] = None,
     force_full: bool = False,
     since_iso: Optional[str] = None,
-) -> int:
+    meta: Optional[dict] = None,
+    first_page: Optional[dict] = None,
+    deadline: Optional[float] = None,
+    continuation: Optional[str] = None,
+    partitions: Optional[int] = None,
+    partition_by: Optional[str] = None,
+    mode: Optional[str] = None,
+    transform: Optional[Transform] = None,
+    sinks: Optional[Dict[str, Sink]] = None,
+    resume: bool = False,
+) -> Dict[str, object]:
     """
     Generic poller for ANY table by logical name (e.g., 'cr83d_sourcingevent').
     Persists a cursor on 'modifiedon' per (tenant, logical).
+
+    Pages go through a fetch -> transform -> sinks pipeline
+    (connectors/d365/pipeline.py): the "rows" sink stores the raw rows;
+    `transform` (e.g. a mapper over a page's rows) and extra `sinks` (name ->
+    async fn(page), reading page.items) add processing. The result's
+    "pipeline" entry has per-stage timings and queue depths.
+
+    mode="delta" (default D365_POLL_MODE) uses Dataverse change tracking
+    instead, see _poll_delta(); it also reports deletes.
+
+    force_full with partitions > 1 (default D365_FULL_SYNC_PARTITIONS) runs
+    a partitioned full sync instead, split by partition_by = time | pk | auto
+    (default D365_FULL_SYNC_PARTITION_BY), see _poll_partitioned().
+
+    meta / first_page let poll_tables() hand over metadata and the first
+    page it already fetched in a $batch.
+
+    deadline (time.monotonic()): stop requesting pages once it passes; the
+    rows read so far are stored and the cursor advanced as usual.
+    continuation: the nextLink returned by a poll that hit its deadline or
+    limit_pages; resumes exactly there instead of starting from the cursor.
+
+    Long runs checkpoint every D365_CHECKPOINT_PAGES pages / _SECONDS (see
+    _Checkpointer): after a crash the next poll continues from there. A
+    force_full run starts from the beginning; resume=True continues an
+    interrupted one from its checkpoint (or, partitioned, from where each
+    window stopped), and the result's "resumed" says whether there was one.
+
+    Returns {"count": rows processed, "complete": True if the table was read
+    to the end, "continuation": nextLink to resume from, or None,
+    "page_size": the odata.maxpagesize used (D365_PAGE_SIZE_AUTO tunes it per table)}.
     """
-    meta = await get_table(logical)  # uses EntityDefinitions(LogicalName='...')
+    meta = meta or await get_table(logical)  # uses EntityDefinitions(LogicalName='...')
     # prefer normalized keys from get_table(); fall back to raw keys if present
     set_name = meta.get("set") or meta.get("EntitySetName")
     if not set_name:
         raise RuntimeError(f"get_table('{logical}') returned no entity set name. Got: {meta}")
 
+    mode = mode or current_profile().setting("d365_poll_mode")
+    if mode == "delta":
+        res = await _poll_delta(tenant, logical, set_name, meta.get("pk"), limit_pages,
+                                max_records, force_full, deadline, continuation)
+        if res is not None:
+            return res
+        # change tracking is off for this table: fall through to modifiedon
+
+    if partitions is None:
+        partitions = current_profile().setting("d365_full_sync_partitions")
+    if force_full and partitions > 1 and not continuation:
+        return await _poll_partitioned(tenant, logical, set_name, meta.get("pk"), partitions,
+                                       partition_by or current_profile().setting("d365_full_sync_partition_by"),
+                                       limit_pages, max_records, deadline, resume)
 
     # decide cursor
-    stored = get_cursor(tenant, logical)
-    effective = None
-    if not force_full:
-        effective = since_iso or stored
-
-    params = {"$orderby": "modifiedon asc"}
-    if effective:
-        params["$filter"] = f"(modifiedon ne null) and (modifiedon gt {effective})"
+    pk = meta.get("pk")
+    field = await _cursor_field(set_name, deadline=deadline)
+    params, stored, effective = _table_params(tenant, logical, force_full, since_iso, pk, field, resume)
+    resumed = bool(force_full and effective) and not continuation
 
     processed = 0
-    pages = 0
     latest = effective
+    if continuation:
+        # the nextLink carries the original query; the stored cursor is the floor
+        latest, first_page = stored, None
+    state: Dict[str, object] = {}
+    writer = get_row_writer(tenant, logical)
+    checkpoint = _Checkpointer(tenant, logical, force_full, writer)
+    if force_full and not resume and not continuation:
+        checkpoint.finish()  # starting over: an older run's checkpoint no longer applies
+    sizing = _PageSizing(tenant, logical)
+
+    async def store_rows(page: Page) -> None:
+        for row in page.rows:
+            writer.write(row)
+        writer.flush()  # this page goes to disk while the next one is processed
+
+    async def page_done(page: Page) -> None:
+        # pages complete in order, so the last one done is the new position
+        nonlocal processed, latest
+        processed += len(page.rows)
+        if page.pos:
+            latest = page.pos
+            checkpoint.row(page.pos)
+        await checkpoint.page()
+
+    rows = paginate_table(continuation or f"/{set_name}", params=params,
+                          page_size=sizing.size,
+                          stream=current_profile().setting("d365_stream_pages"),
+                          first_page=first_page,
+                          prefetch=current_profile().setting("d365_prefetch_pages"),
+                          max_pages=limit_pages,
+                          deadline=deadline,
+                          state=state)
+    try:
+        metrics = await run_pipeline(_pages(rows, max_records, field, pk),
+                                     {"rows": store_rows, **(sinks or {})}, transform=transform,
+                                     on_page_done=page_done, **_pipeline_opts())
+    except httpx.TimeoutException:
+        sizing.done(state, timed_out=True)
+        raise
+    sizing.done(state)
+
+    await writer.commit()  # rows on disk before the cursor moves past them
+    if state.get("complete"):
+        checkpoint.finish()
+    else:
+        await checkpoint.save()
+    if latest and latest != stored:
+        set_cursor(tenant, logical, latest)
 
-    async for row, page_bumped in paginate_table(f"/{set_name}", params=params, page_size=200):
-        if page_bumped:
-            pages += 1
-            if limit_pages and pages > limit_pages:
-                break
-
-        mod = row.get("modifiedon") or row.get("createdon")
-        _store_raw_row(tenant, logical, row)
-        if mod:
-            latest = _max_iso(latest, mod)
+    return {"count": processed, "complete": bool(state.get("complete")),
+            "continuation": state.get("continuation"), "page_size": sizing.size, "pipeline": metrics,
+            "resumed": resumed}
 
-        processed += 1
-        if max_records and processed >= max_records:
-            break
+# Stored next to the modifiedon cursor of the same table.
+DELTA_CURSOR_SUFFIX = "@delta"
+PARTITIONS_SUFFIX = "@partitions"  # progress of an unfinished partitioned full sync
 
-    if latest and latest != stored:
-        set_cursor(tenant, logical, latest)
+def _is_deleted(row: dict) -> bool:
+    # {"@odata.context": ".../$metadata#accounts/$deletedEntity", "id": "<guid>", "reason": "deleted"}
+    return "$deletedEntity" in str(row.get("@odata.context", "")) or row.get("reason") == "deleted"
 
-    return processed
\ No newline at end of file
+async def _poll_delta(
+    tenant: str,
+    logical: str,
+    set_name: str,
+    pk: Optional[str],
+    limit_pages: Optional[int],
+    max_records: Optional[int],
+    force_full: bool,
+    deadline: Optional[float],
+    continuation: Optional[str],
+) -> Optional[Dict[str, object]]:
+    """
+    Incremental poll with Dataverse change tracking (Prefer: odata.track-changes).
+
+    The first poll reads the whole table; its last page carries an
+    @odata.deltaLink, stored as the table's cursor. Every later poll GETs
+    that link and receives only rows changed since, plus deleted rows
+    ($deletedEntity), stored as {pk: id, "@deleted": true} tombstones.
+    The new deltaLink is stored only once the chain was read to the end.
+    A poll that stops early (deadline, limit_pages) stores the nextLink it
+    stopped at in its place, so the next poll carries on from there even if
+    the caller does not pass the continuation back; without that, a first
+    read bigger than one poll would start over every time. An expired
+    deltaLink (or nextLink) restarts with a full read.
+
+    Returns None when change tracking is not enabled for the table.
+    """
+    key = f"{logical}{DELTA_CURSOR_SUFFIX}"
+    delta = None if force_full else get_cursor(tenant, key)
+    start = continuation or delta or f"/{set_name}"
+
+    processed = deleted = 0
+    state: Dict[str, object] = {}
+    writer = get_row_writer(tenant, logical)
+    sizing = _PageSizing(tenant, logical)
+    try:
+        async for row, page_bumped in paginate_table(start, page_size=sizing.size,
+                                                     prefetch=current_profile().setting("d365_prefetch_pages"),
+                                                     track_changes=True, max_pages=limit_pages,
+                                                     deadline=deadline, state=state):
+            if page_bumped:
+                writer.flush()
+            if _is_deleted(row):
+                writer.write({pk or "id": row.get("id"), "@deleted": True,
+                              "@reason": row.get("reason", "deleted")})
+                deleted += 1
+            else:
+                writer.write(row)
+            processed += 1
+            if max_records and processed >= max_records:
+                break
+    except httpx.TimeoutException:
+        sizing.done(state, timed_out=True)
+        raise
+    except httpx.HTTPStatusError as e:
+        if processed or e.response.status_code not in (400, 410):
+            raise
+        if start == delta:
+            # delta token expired (outside the change-tracking retention): read everything again
+            log.warning("%s/%s: deltaLink rejected (%s), full resync", tenant, logical, e.response.status_code)
+            return await _poll_delta(tenant, logical, set_name, pk, limit_pages, max_records,
+                                     True, deadline, None)
+        if start == f"/{set_name}":
+            log.warning("%s/%s: change tracking not available, using modifiedon: %s", tenant, logical, e)
+            return None
+        raise
+
+    sizing.done(state)
+    await writer.commit()
+    complete = bool(state.get("complete"))
+    if complete and state.get("delta_link"):
+        set_cursor(tenant, key, state["delta_link"])
+    elif state.get("continuation"):
+        set_cursor(tenant, key, state["continuation"])  # resumes like a deltaLink does
+    return {"count": processed, "deleted": deleted, "complete": complete,
+            "continuation": state.get("continuation"), "page_size": sizing.size,
+            "mode": "delta"}
+
+async def _poll_partitioned(
+    tenant: str,
+    logical: str,
+    set_name: str,
+    pk: Optional[str],
+    partitions: int,
+    partition_by: str,
+    limit_pages: Optional[int],
+    max_records: Optional[int],
+    deadline: Optional[float],
+    resume: bool = False,
+) -> Dict[str, object]:
+    """
+    Full sync split into `partitions` modifiedon windows or primary-key ranges
+    of similar estimated size, read concurrently (connectors/d365/partition.py).
+    pk ranges keep the split even when many rows share one modifiedon. Windows finish
+    out of order, so the cursor (the greatest row position seen) is committed
+    once, and only if every window was read to its end.
+    limit_pages applies per window. A run that stops early (limit_pages,
+    max_records, deadline) stores its plan, where each window stopped and the
+    greatest position so far in "<logical>@partitions"; a partitioned
+    force_full run with resume=True and the same partitions / partition_by
+    carries on from there instead of planning and reading the table again.
+    The result's "partitions_left" counts the windows not finished yet.
+    """
+    stored = get_cursor(tenant, logical)
+    cursor_field = await _cursor_field(set_name, deadline=deadline)
+    progress_key = f"{logical}{PARTITIONS_SUFFIX}"
+    progress = get_cursor(tenant, progress_key)
+    resumed = bool(resume and progress and progress.get("by") == partition_by
+                   and progress.get("requested") == partitions)
+    if progress and not resumed:
+        set_cursor(tenant, progress_key, None)  # starting over
+    if resumed:
+        field, parts = progress["field"], progress["parts"]
+    else:
+        field, filters = await plan_partitions(set_name, partitions, by=partition_by,
+                                               pk=pk, deadline=deadline)
+        parts = [{"filter": f, "next": None, "done": False} for f in filters]
+        progress = {"by": partition_by, "requested": partitions, "field": field, "parts": parts, "latest": None}
+    latest: Dict[str, object] = {"pos": None, "key": None}
+    if progress.get("latest"):
+        latest.update(pos=progress["latest"], key=cursor_sort_key(progress["latest"]))
+    writer = get_row_writer(tenant, logical)
+
+    def on_row(row: dict) -> None:
+        writer.write(row)
+        pos = row_cursor(row, cursor_field, pk)
+        if pos is None:
+            return
+        cur = latest["pos"]
+        if cur is not None and "modifiedon" in pos and pos["modifiedon"] < cur["modifiedon"]:
+            return  # cheap string check first; GUID sort keys only for the newest timestamp
+        key = cursor_sort_key(pos)
+        if cur is None or key > latest["key"]:
+            latest.update(pos=pos, key=key)
+
+    pending = [p for p in parts if not p["done"]]
+    res = await scan_partitions(
+        set_name, [p["filter"] for p in pending], on_row,
+        params={"$orderby": f"{field} asc"},
+        page_size=page_size(tenant, logical),
+        prefetch=current_profile().setting("d365_prefetch_pages"),
+        limit_pages=limit_pages,
+        max_records=max_records,
+        deadline=deadline,
+        starts=[p["next"] for p in pending],
+    )
+    for p, r in zip(pending, res["partitions"]):
+        p["done"], p["next"] = r["complete"], r["next"]
+    await writer.commit()  # rows on disk before their progress is stored
+    if res["complete"]:
+        if latest["pos"] and latest["pos"] != stored:
+            set_cursor(tenant, logical, latest["pos"])
+        if get_cursor(tenant, progress_key):
+            set_cursor(tenant, progress_key, None)
+    else:
+        progress["latest"] = latest["pos"]
+        set_cursor(tenant, progress_key, progress)
+    return {"count": res["count"], "complete": res["complete"], "continuation": None,
+            "partitions": len(parts), "partition_by": field, "resumed": resumed,
+            "partitions_left": sum(1 for p in parts if not p["done"])}
+
+def _first_page_params(tenant: str, logical: str, meta: dict, force_full: bool,
+                       since_iso: Optional[str], resume: bool = False) -> Dict[str, Any]:
+    return _table_params(tenant, logical, force_full, since_iso, meta.get("pk"),
+                         _known_cursor_field(meta["set"]), resume)[0]
+
+async def _batch_first_pages(tenant: str, metas: Dict[str, dict], force_full: bool,
+                             since_iso: Optional[str], deadline: Optional[float] = None,
+                             resume: bool = False) -> Dict[str, tuple]:
+    """
+    Fetch the first page of every table in one $batch. Returns
+    {logical: (query params used, page body)}; parts that fail are left out.
+    """
+    # tables whose versionnumber support is not probed yet fetch their own first page
+    logicals = [l for l, m in metas.items() if m.get("set") and _known_cursor_field(m["set"])]
+    if not logicals or current_profile().setting("d365_stream_pages"):
+        return {}  # streaming wants each page's body incrementally, not inside a batch
+    reqs = [{
+        "path": f"/{metas[l]['set']}",
+        "params": _first_page_params(tenant, l, metas[l], force_full, since_iso, resume),
+        "max_page_size": page_size(tenant, l),  # nextLinks continue with the same size
+    } for l in logicals]
+    try:
+        parts = await d365_batch(reqs, deadline=deadline)
+    except DeadlineExceeded:
+        return {}  # the tables will report themselves incomplete
+    except (httpx.HTTPError, ValueError) as e:
+        log.warning("$batch of first pages failed, fetching per table: %s", e)
+        return {}
+    return {l: (r["params"], p["body"]) for l, r, p in zip(logicals, reqs, parts)
+            if p["status"] < 400 and p["body"] is not None}
+
+# One poll per (tenant, table) at a time (poll_tables, the scheduler): two
+# concurrent polls of a table would store its rows twice, and whichever
+# finished last would set the cursor, possibly moving it backwards.
+_table_locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+
+def table_lock(tenant: str, logical: str) -> asyncio.Lock:
+    return _table_locks.setdefault((tenant, logical), asyncio.Lock())
+
+async def poll_tables(
+    tenant: str,
+    tables: List[str],
+    limit_pages: int = 2,
+    max_records: Optional[int] = None,
+    force_full: bool = False,
+    since_iso: Optional[str] = None,
+    deadline: Optional[float] = None,
+    continuation: Optional[Dict[str, str]] = None,
+    partitions: Optional[int] = None,
+    partition_by: Optional[str] = None,
+    mode: Optional[str] = None,
+    concurrency: Optional[int] = None,
+    resume: bool = False,
+) -> Dict[str, Dict[str, object]]:
+    """
+    Poll several tables for one tenant. Metadata for all tables and every
+    table's first page are fetched with $batch (two round-trips in total)
+    before each table continues on its own nextLink chain. If a $batch
+    fails, the tables fetch their metadata / first page on their own.
+
+    Up to `concurrency` tables (default D365_POLL_CONCURRENCY) are polled at
+    once, never more than the org's current throttle limit, so a slow table
+    only holds up its own slot. A table that fails does not stop the others:
+    its result carries "error" (count 0, complete False, its continuation
+    kept). Every result has "seconds" (wall time of that table's poll).
+    A table that is already being polled (table_lock) is waited for; if the
+    deadline passes first it comes back with count 0, complete False, "busy".
+
+    deadline / continuation ({logical: nextLink}) / resume as in poll_table(); tables
+    not reached before the deadline come back with count 0, complete False.
+    Returns {logical: poll_table() result}, in the order of `tables`.
+    Raises CircuitOpenError if every table failed on an open circuit.
+    """
+    continuation = continuation or {}
+    tables = list(dict.fromkeys(tables))
+    prof = current_profile()
+    if partitions is None:
+        partitions = prof.setting("d365_full_sync_partitions")
+    if concurrency is None:
+        concurrency = prof.setting("d365_poll_concurrency")
+    try:
+        metas = await get_tables_meta(tables, deadline=deadline)
+    except (httpx.HTTPError, ValueError) as e:
+        log.warning("$batch of table metadata failed, resolving per table: %s", e)
+        metas = {}  # poll_table() looks each one up itself
+    mode = mode or prof.setting("d365_poll_mode")
+    # a partitioned full sync / delta poll plans its own queries; no shared first page for it
+    own_queries = (force_full and partitions > 1) or mode == "delta"
+    fresh = {} if own_queries else {l: m for l, m in metas.items() if l not in continuation}
+    first_pages = await _batch_first_pages(tenant, fresh, force_full, since_iso, deadline=deadline,
+                                         resume=resume)
+
+    governor = get_governor(prof.org_url)
+    errors: Dict[str, BaseException] = {}
+
+    def width() -> int:
+        # re-read per table: the governor shrinks the fan-out while the org throttles us
+        return max(1, min(concurrency, int(governor.limit)))
+
+    async def one(logical: str) -> Dict[str, object]:
+        log.info("poll tenant=%s table=%s force_full=%s since=%s limit_pages=%s max_records=%s",
+                 tenant, logical, force_full, since_iso, limit_pages, max_records)
+        t0 = time.perf_counter()
+        lock = table_lock(tenant, logical)
+        try:
+            await within(deadline, lock.acquire())
+        except DeadlineExceeded:
+            return {"count": 0, "complete": False, "continuation": continuation.get(logical),
+                    "busy": True, "seconds": round(time.perf_counter() - t0, 3)}
+        try:
+            first_page = first_pages.get(logical)
+            if first_page is not None:
+                # batched before we held the lock: if a poll that held it since has moved
+                # the cursor, that page starts too early and would store its rows again
+                fresh_params = _first_page_params(tenant, logical, metas[logical], force_full,
+                                                  since_iso, resume)
+                first_page = first_page[1] if first_page[0] == fresh_params else None
+            res = await poll_table(
+                tenant=tenant,
+                logical=logical,
+                limit_pages=limit_pages,
+                max_records=max_records,
+                force_full=force_full,
+                since_iso=since_iso,
+                meta=metas.get(logical),
+                first_page=first_page,
+                deadline=deadline,
+                continuation=continuation.get(logical),
+                partitions=partitions,
+                partition_by=partition_by,
+                mode=mode,
+                resume=resume,
+            )
+        except Exception as e:
+            log.warning("poll tenant=%s table=%s failed: %r", tenant, logical, e)
+            errors[logical] = e
+            res = {"count": 0, "complete": False, "continuation": continuation.get(logical),
+                   "error": f"{type(e).__name__}: {e}"}
+        finally:
+            lock.release()
+        res["seconds"] = round(time.perf_counter() - t0, 3)
+        return res
+
+    results: Dict[str, Dict[str, object]] = {}
+    queue = list(tables)
+    running: Dict[asyncio.Future, str] = {}
+    try:
+        while queue or running:
+            while queue and len(running) < width():
+                logical = queue.pop(0)
+                running[asyncio.ensure_future(one(logical))] = logical
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                results[running.pop(t)] = t.result()
+    finally:
+        for t in running:
+            t.cancel()  # the request was cancelled: stop the tables still polling
+
+    if tables and len(errors) == len(tables) and all(isinstance(e, CircuitOpenError) for e in errors.values()):
+        raise next(iter(errors.values()))
+    return {l: results[l] for l in tables}
@@ -3,7 +3,7 @@ from typing import Any, Optional, List, Dict
 from urllib.parse import urlparse
 import json
 
-from connectors.d365.client import d365_get
+from connectors.d365.client import d365_get, d365_batch
 from common.cursors import get_cursor, set_cursor   # <- reuse the simple kv store
 
 # ---------- PAGED TABLE DISCOVERY (already added) ----------
@@ -12,6 +12,14 @@ def _split_nextlink(next_link: str) -> str:
     p = urlparse(next_link)
     return f"{p.path}?{p.query}" if p.query else p.path
 
+def _norm_entity(e: Dict) -> Dict:
+    return {
+        "logical": e.get("LogicalName"),
+        "set": e.get("EntitySetName"),
+        "pk": e.get("PrimaryIdAttribute"),
+        "pname": e.get("PrimaryNameAttribute"),
+    }
+
 async def find_tables(prefix: Optional[str] = None) -> List[Dict]:
     """
     Robust version:
@@ -35,12 +43,7 @@ async def find_tables(prefix: Optional[str] = None) -> List[Dict]:
             if norm_prefix and not logical.lower().startswith(norm_prefix):
                 continue
 
-            out.append({
-                "logical": logical,
-                "set": e.get("EntitySetName"),
-                "pk": e.get("PrimaryIdAttribute"),
-                "pname": e.get("PrimaryNameAttribute"),
-            })
+            out.append(_norm_entity(e))
 
         # Paging (nextLink can be absolute; d365_get handles it)
         next_link = j.get("@odata.nextLink")
@@ -78,6 +81,34 @@ async def get_table(logical: str) -> Dict:
     # Not found -> return empty structure (caller can handle)
     return {"logical": None, "set": None, "pk": None, "pname": None}
 
+async def get_tables_meta(logicals: List[str], deadline: Optional[float] = None) -> Dict[str, Dict]:
+    """
+    Resolve several logical names in ONE $batch round-trip
+    (EntityDefinitions(LogicalName='...') per part) instead of one call each.
+    Any part that fails or comes back empty falls back to the find_tables()
+    list, so the result matches get_table() for every name. Returns {logical: meta}.
+    """
+    names = list(dict.fromkeys(logicals))  # de-dup, keep order
+    if not names:
+        return {}
+    parts = await d365_batch([
+        {"path": f"/EntityDefinitions(LogicalName='{n.lower()}')"} for n in names
+    ], deadline=deadline)
+    out: Dict[str, Dict] = {}
+    missing: List[str] = []
+    for name, part in zip(names, parts):
+        meta = _norm_entity(part["body"] or {}) if part["status"] < 400 else {}
+        if meta.get("set"):
+            out[name] = meta
+        else:
+            missing.append(name)
+    if missing:
+        # single-entity quirk or unknown name: one pass over the robust paged list
+        by_logical = {(t.get("logical") or "").lower(): t for t in await find_tables()}
+        for name in missing:
+            out[name] = by_logical.get(name.lower()) or {"logical": None, "set": None, "pk": None, "pname": None}
+    return out
+
 async def read_table_rows_generic(
     logical: str,
     top: int = 50,
@@ -0,0 +1,85 @@
+# connectors/d365/pagesize.py
+from __future__ import annotations
+import json
+from pathlib import Path
+from typing import Any, Dict, Optional
+from common.profiles import current_profile
+
+# Auto page size (D365_PAGE_SIZE_AUTO): the Prefer: odata.maxpagesize of each
+# (tenant, table), adjusted after every poll from what its pages cost:
+#
+#   bytes per row    -> the size whose pages stay under D365_PAGE_TARGET_BYTES
+#   seconds per row  -> the size whose pages come back within D365_PAGE_TARGET_SECONDS
+#                       (seconds / rows includes the fixed cost of a request,
+#                       so this settles where a whole page takes the target time)
+#
+# The smaller of the two wins, moving at most x2 or /2 per poll: narrow tables
+# climb towards D365_PAGE_SIZE_MAX (fewer round-trips), tables with big memo
+# columns come down before their pages time out. A poll during which the org
+# throttled us (429 / low x-ms-ratelimit budget) never grows the size, one that
+# timed out halves it, and one that never filled a page leaves it alone.
+# Sizes are kept in .runtime/pagesizes.json, so they survive restarts.
+
+_STORE = Path(".runtime/pagesizes.json")
+SMOOTHING = 0.5  # weight of the latest poll in the per-row averages
+
+_sizes: Optional[Dict[str, Dict[str, Any]]] = None
+
+def _load() -> Dict[str, Dict[str, Any]]:
+    global _sizes
+    if _sizes is None:
+        try:
+            _sizes = json.loads(_STORE.read_text()) if _STORE.exists() else {}
+        except Exception:
+            _sizes = {}
+    return _sizes
+
+def _save() -> None:
+    _STORE.parent.mkdir(parents=True, exist_ok=True)
+    _STORE.write_text(json.dumps(_load(), indent=2))
+
+def _key(tenant: str, table: str) -> str:
+    return f"{tenant}:{table}"
+
+def _clamp(size: float) -> int:
+    prof = current_profile()
+    return int(min(max(size, prof.setting("d365_page_size_min")), prof.setting("d365_page_size_max")))
+
+def page_size(tenant: str, table: str) -> int:
+    """Page size for the next poll of `table` (D365_PAGE_SIZE unless auto-tuned)."""
+    prof = current_profile()
+    entry = _load().get(_key(tenant, table)) if prof.setting("d365_page_size_auto") else None
+    return _clamp(entry["size"]) if entry else prof.setting("d365_page_size")
+
+def observe(tenant: str, table: str, size: int, fetched: Optional[Dict[str, Any]],
+            throttled: bool = False, timed_out: bool = False) -> Optional[int]:
+    """
+    Feed back one poll that read its pages with `size`: `fetched` is
+    paginate_table()'s state["fetched"]. Returns the size for the next
+    poll (None while auto-tuning is off).
+    """
+    prof = current_profile()
+    if not prof.setting("d365_page_size_auto"):
+        return None
+    key = _key(tenant, table)
+    entry = _load().get(key) or {"size": size, "bytes_per_row": None, "seconds_per_row": None}
+    new = size
+    if timed_out:
+        new = size / 2
+    elif fetched and fetched.get("rows"):
+        rows = fetched["rows"]
+        for name, value in (("bytes_per_row", fetched["bytes"] / rows),
+                            ("seconds_per_row", fetched["seconds"] / rows)):
+            old = entry.get(name)
+            entry[name] = value if old is None else old + SMOOTHING * (value - old)
+        want = min(prof.setting("d365_page_target_bytes") / max(entry["bytes_per_row"], 1.0),
+                   prof.setting("d365_page_target_seconds") / max(entry["seconds_per_row"], 1e-6))
+        new = min(max(want, size / 2), size * 2)
+        if new > size and (throttled or rows < size):
+            new = size  # throttled, or the table fits in one page anyway
+    else:
+        return _clamp(entry["size"])  # nothing read, nothing learned
+    entry["size"] = _clamp(new)
+    _load()[key] = entry
+    _save()
+    return entry["size"]
@@ -1,38 +1,208 @@
 # connectors/d365/paginate.py
 from __future__ import annotations
-from typing import AsyncGenerator, Tuple, Dict, Any
-from connectors.d365.client import d365_get
-import httpx
+import asyncio
+import time
+from typing import AsyncGenerator, AsyncIterator, Tuple, Dict, Any
+from connectors.d365.client import d365_get, d365_get_absolute, d365_stream_rows
+from connectors.d365.codec import loads
+from connectors.d365.retry import DeadlineExceeded
 
 async def paginate_table(
     path: str,
     params: Dict[str, Any] | None = None,
-    page_size: int = 200
+    page_size: int = 200,
+    stream: bool = False,
+    first_page: Dict[str, Any] | None = None,
+    deadline: float | None = None,
+    state: Dict[str, Any] | None = None,
+    prefetch: int = 0,
+    track_changes: bool = False,
+    max_pages: int | None = None,
 ) -> AsyncGenerator[Tuple[Dict[str, Any], bool], None]:
     """
     Yields (row, page_bumped). page_bumped=True on the first row of each new page.
     Follows @odata.nextLink. Adds Prefer: odata.maxpagesize.
+
+    stream=True parses each page's "value" array incrementally from the
+    response bytes, so rows are yielded while the page is still downloading
+    and a page is never held in memory as a whole (useful for large page sizes
+    on wide tables).
+
+    first_page: an already fetched first page (e.g. from a $batch); only its
+    nextLink chain is requested. Ignored when stream=True.
+
+    deadline (time.monotonic()): no page is requested once it has passed; the
+    generator just ends. Pass a `state` dict to find out why it ended:
+    state["complete"] is False and state["continuation"] holds the nextLink of
+    the first page NOT read (pass it back as `path` to resume), or None if the
+    deadline hit before the first page. With stream=True a page cut off by the
+    deadline is the continuation, so its first rows are yielded again on resume.
+
+    prefetch=k (k >= 1): request up to k pages ahead of the consumer, starting
+    the next nextLink as soon as it is known, so network time overlaps with
+    the consumer's processing; fetching pauses while k pages are waiting.
+    With a deadline, pages fetched before it passed are still yielded.
+    Ignored when stream=True.
+
+    max_pages=n: request at most n pages (first_page included), then end
+    like a deadline does: state["complete"] False, state["continuation"]
+    the nextLink not requested. Prefetching stops there too.
+
+    track_changes=True adds Prefer: odata.track-changes (Dataverse change
+    tracking). `path` may then also be a stored @odata.deltaLink; the new
+    deltaLink from the last page lands in state["delta_link"].
+
+    state["page_link"] is the absolute link of the page currently being
+    yielded (None for a first page requested by relative path): a consumer
+    that stops at a page boundary can resume from it.
+
+    state["fetched"] = {"pages", "rows", "bytes", "seconds"} totals over the
+    pages this call requested (response body sizes and wall time of the
+    GETs), for tuning page_size (connectors/d365/pagesize.py). Not collected
+    with stream=True or for first_page.
     """
     q = dict(params or {})
-    headers = {"Prefer": f"odata.maxpagesize={page_size}"}
-
-    # first page
-    j = await d365_get(path, params=q, extra_headers=headers)
-    page_bumped = True
-    for item in j.get("value", []):
-        yield item, page_bumped
-        page_bumped = False
-
-    next_link = j.get("@odata.nextLink")
-    while next_link:
-        # nextLink already contains query, ignore params
-        async with httpx.AsyncClient(timeout=30) as cli:
-            # d365_get can be used, but we need to honor nextLink fully:
-            r = await cli.get(next_link, headers={"Accept":"application/json"})
-            r.raise_for_status()
-            j = r.json()
+    prefer = [f"odata.maxpagesize={page_size}"]
+    if track_changes:
+        prefer.insert(0, "odata.track-changes")
+    headers = {"Prefer": ",".join(prefer)}
+    state = state if state is not None else {}
+    state.update(complete=False, continuation=None, page_link=None, delta_link=None,
+                 fetched={"pages": 0, "rows": 0, "bytes": 0, "seconds": 0.0})
+
+    def resumable(link: str) -> str | None:
+        # only absolute nextLinks can be resumed; a relative path needs its params again
+        return link if "://" in link else None
+
+    def stop_at(link: str) -> None:
+        state["continuation"] = resumable(link)
+
+    def out_of_time(link: str) -> bool:
+        if deadline is not None and time.monotonic() >= deadline:
+            stop_at(link)
+            return True
+        return False
+
+    def limit_reached(link: str, pages: int) -> bool:
+        if max_pages and pages >= max_pages:
+            stop_at(link)
+            return True
+        return False
+
+    if stream:
+        link: str | None = path
+        read = 0
+        while link:
+            if out_of_time(link) or limit_reached(link, read):
+                return
+            read += 1
+            trailer: Dict[str, Any] = {}
+            page_bumped = True
+            state["page_link"] = resumable(link)
+            try:
+                async for item in d365_stream_rows(link, trailer, params=q, extra_headers=headers,
+                                                   deadline=deadline):
+                    yield item, page_bumped
+                    page_bumped = False
+            except DeadlineExceeded:
+                # resuming re-reads this page, so rows already yielded from it repeat
+                stop_at(link)
+                return
+            if "@odata.deltaLink" in trailer:
+                state["delta_link"] = trailer["@odata.deltaLink"]
+            # nextLink already contains query, ignore params
+            link, q = trailer.get("@odata.nextLink"), None
+        state["complete"] = True
+        return
+
+    async def fetch(get: Any) -> Dict[str, Any]:
+        t = time.monotonic()
+        body = await get
+        f = state["fetched"]
+        f["seconds"] += time.monotonic() - t
+        j = loads(body)
+        f["pages"] += 1
+        f["rows"] += len(j.get("value", []))
+        f["bytes"] += len(body)
+        return j
+
+    async def pages() -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        j = first_page
+        if j is None:
+            if out_of_time(path):
+                return
+            try:
+                j = await fetch(d365_get(path, params=q, extra_headers=headers, deadline=deadline, raw=True))
+            except DeadlineExceeded:
+                stop_at(path)
+                return
+        yield path, j
+
+        read = 1
+        next_link = j.get("@odata.nextLink")
+        while next_link:
+            if out_of_time(next_link) or limit_reached(next_link, read):
+                return
+            read += 1
+            # nextLink already contains query, ignore params
+            try:
+                j = await fetch(d365_get_absolute(next_link, extra_headers=headers, deadline=deadline, raw=True))
+            except DeadlineExceeded:
+                stop_at(next_link)
+                return
+            yield next_link, j
+            next_link = j.get("@odata.nextLink")
+        state["complete"] = True
+
+    source = _prefetch(pages(), prefetch) if prefetch > 0 else pages()
+    async for link, j in source:
+        state["page_link"] = resumable(link)
+        if "@odata.deltaLink" in j:
+            state["delta_link"] = j["@odata.deltaLink"]
         page_bumped = True
         for item in j.get("value", []):
             yield item, page_bumped
             page_bumped = False
-        next_link = j.get("@odata.nextLink")
\ No newline at end of file
+
+
+_END = object()
+
+async def _prefetch(pages: AsyncIterator[Any], ahead: int) -> AsyncIterator[Any]:
+    """
+    Drive `pages` from a background task so that up to `ahead` pages are
+    fetched (or being fetched) while the consumer works on the current one.
+    The pump waits once it is `ahead` pages in front (backpressure), and
+    errors surface to the consumer in page order.
+    """
+    permits = asyncio.Semaphore(ahead + 1)  # the page being consumed + `ahead`
+    q: asyncio.Queue = asyncio.Queue()
+
+    async def pump() -> None:
+        try:
+            while True:
+                await permits.acquire()
+                try:
+                    page = await pages.__anext__()
+                except StopAsyncIteration:
+                    break
+                q.put_nowait((page, None))
+        except Exception as e:
+            q.put_nowait((_END, e))
+            return
+        q.put_nowait((_END, None))
+
+    task = asyncio.ensure_future(pump())
+    try:
+        while True:
+            page, err = await q.get()
+            if err is not None:
+                raise err
+            if page is _END:
+                return
+            yield page
+            permits.release()  # the consumer is done with that page
+    finally:
+        # consumer stopped early (limit reached, error, cancelled): stop fetching
+        task.cancel()
+        await asyncio.wait([task])
+        await pages.aclose()
@@ -0,0 +1,213 @@
+# connectors/d365/partition.py
+from __future__ import annotations
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+from connectors.d365.client import d365_get
+from connectors.d365.paginate import paginate_table
+
+# Partitioned full scans: instead of one sequential nextLink chain over the
+# whole table, split it into N disjoint $filter ranges and page through them
+# concurrently. Every request still goes through the org's throttle governor,
+# so N only bounds how much work is queued, not how hard Dataverse is hit.
+
+# Dataverse caps @odata.count at 5000, so larger windows all "look" equal;
+# ties are broken by splitting the widest window.
+COUNT_CAP = 5000
+
+K = TypeVar("K")  # a partition key: datetime (time windows) or int (GUID sort key)
+
+
+def _parse_iso(ts: str) -> datetime:
+    return datetime.fromisoformat(ts.replace("Z", "+00:00")).astimezone(timezone.utc)
+
+def _iso(dt: datetime) -> str:
+    return dt.replace(microsecond=0).isoformat().replace("+00:00", "Z")
+
+# SQL Server orders uniqueidentifier by byte groups 10-15, 8-9, 6-7, 4-5, 0-3
+# (of the mixed-endian storage form). As indexes into the canonical string
+# byte order (uuid.UUID(...).bytes), most significant first:
+_SQL_GUID_ORDER = (10, 11, 12, 13, 14, 15, 8, 9, 7, 6, 5, 4, 3, 2, 1, 0)
+
+def guid_sort_key(g: str) -> int:
+    """The GUID as a 128-bit int that sorts the way Dataverse ($orderby / gt / lt) sorts it."""
+    b = uuid.UUID(g).bytes
+    return int.from_bytes(bytes(b[i] for i in _SQL_GUID_ORDER), "big")
+
+def guid_from_sort_key(k: int) -> str:
+    kb = k.to_bytes(16, "big")
+    b = bytearray(16)
+    for pos, i in enumerate(_SQL_GUID_ORDER):
+        b[i] = kb[pos]
+    return str(uuid.UUID(bytes=bytes(b)))
+
+def _window_filter(field: str, lo: str, hi: str, last: bool) -> str:
+    # half-open [lo, hi) so windows never overlap; the last one includes the max value
+    op = "le" if last else "lt"
+    return f"({field} ge {lo}) and ({field} {op} {hi})"
+
+async def _edge(set_name: str, field: str, desc: bool, deadline: Optional[float]) -> Optional[str]:
+    j = await d365_get(f"/{set_name}", params={
+        "$select": field,
+        "$filter": f"{field} ne null",
+        "$orderby": f"{field} {'desc' if desc else 'asc'}",
+        "$top": 1,
+    }, deadline=deadline)
+    rows = j.get("value") or []
+    return rows[0].get(field) if rows else None
+
+async def _edges(set_name: str, field: str, deadline: Optional[float]) -> Tuple[Optional[str], Optional[str]]:
+    lo, hi = await asyncio.gather(_edge(set_name, field, False, deadline),
+                                  _edge(set_name, field, True, deadline))
+    return lo, hi
+
+async def _count(set_name: str, flt: str, select: str, deadline: Optional[float]) -> int:
+    """Rows matching `flt`, as reported by @odata.count (capped at COUNT_CAP by Dataverse)."""
+    j = await d365_get(f"/{set_name}", params={
+        "$select": select, "$filter": flt, "$count": "true", "$top": 1,
+    }, deadline=deadline)
+    return int(j.get("@odata.count", len(j.get("value") or [])))
+
+async def _bisect(set_name: str, field: str, partitions: int, lo: K, hi: K,
+                  midpoint: Callable[[K, K], Optional[K]], literal: Callable[[K], str],
+                  deadline: Optional[float]) -> List[str]:
+    """
+    Split [lo, hi] on `field` into up to `partitions` disjoint $filter windows
+    of roughly equal estimated row count: repeatedly halve the window with the
+    largest estimate (counted with $count; widest first on ties).
+    """
+    def flt(a: K, b: K, last: bool) -> str:
+        return _window_filter(field, literal(a), literal(b), last)
+
+    # (estimate, lo, hi, last)
+    windows: List[Tuple[int, Any, Any, bool]] = [
+        (await _count(set_name, flt(lo, hi, True), field, deadline), lo, hi, True)
+    ]
+    while len(windows) < partitions:
+        splittable = [(w, m) for w in windows if w[0] > 1
+                      for m in [midpoint(w[1], w[2])] if m is not None]
+        if not splittable:
+            break
+        w, mid = max(splittable, key=lambda wm: (wm[0][0], wm[0][2] - wm[0][1]))
+        _, a, b, last = w
+        left, right = (a, mid, False), (mid, b, last)
+        c_left, c_right = await asyncio.gather(_count(set_name, flt(*left), field, deadline),
+                                               _count(set_name, flt(*right), field, deadline))
+        windows.remove(w)
+        windows += [(c_left, *left), (c_right, *right)]
+
+    windows.sort(key=lambda w: w[1])
+    return [flt(a, b, last) for _, a, b, last in windows]
+
+def _time_mid(a: datetime, b: datetime) -> Optional[datetime]:
+    if b - a < timedelta(seconds=2):
+        return None
+    return (a + (b - a) / 2).replace(microsecond=0)
+
+def _int_mid(a: int, b: int) -> Optional[int]:
+    return None if b - a < 2 else (a + b) // 2
+
+async def plan_time_windows(set_name: str, field: str, partitions: int,
+                            deadline: Optional[float] = None) -> List[str]:
+    """
+    Windows on `field` (modifiedon / createdon) of similar estimated size,
+    plus one window for rows where `field` is null.
+    """
+    lo, hi = await _edges(set_name, field, deadline)
+    null_window = f"{field} eq null"
+    if lo is None:
+        return [null_window]
+    windows = await _bisect(set_name, field, partitions, _parse_iso(lo), _parse_iso(hi),
+                            _time_mid, _iso, deadline)
+    return windows + [null_window]
+
+async def plan_pk_ranges(set_name: str, pk: str, partitions: int,
+                         deadline: Optional[float] = None) -> List[str]:
+    """
+    Ranges on the primary key GUID of similar estimated size. Splits between
+    the actual min and max key (in SQL Server uniqueidentifier order), so
+    sequential GUIDs and bulk-imported tables where every row shares one
+    modifiedon still split evenly.
+    """
+    lo, hi = await _edges(set_name, pk, deadline)
+    if lo is None:
+        return [f"{pk} ne null"]  # empty table: one (empty) partition
+    return await _bisect(set_name, pk, partitions, guid_sort_key(lo), guid_sort_key(hi),
+                         _int_mid, guid_from_sort_key, deadline)
+
+async def plan_partitions(set_name: str, partitions: int, by: str = "auto",
+                          time_field: str = "modifiedon", pk: Optional[str] = None,
+                          deadline: Optional[float] = None) -> Tuple[str, List[str]]:
+    """
+    by="time" | "pk" | "auto". auto plans time windows and falls back to pk
+    ranges when the timestamps are too clustered to give at least half the
+    requested partitions (e.g. a bulk import stamped in one instant).
+    Returns (field split on, filters); order each partition by that field.
+    """
+    if by not in ("time", "pk", "auto"):
+        raise ValueError(f"partition_by must be time, pk or auto; got {by!r}")
+    if by == "pk":
+        if not pk:
+            raise ValueError("pk partitioning needs the table's primary key")
+        return pk, await plan_pk_ranges(set_name, pk, partitions, deadline)
+    windows = await plan_time_windows(set_name, time_field, partitions, deadline)
+    if by == "auto" and pk and len(windows) - 1 < max(2, partitions // 2):
+        return pk, await plan_pk_ranges(set_name, pk, partitions, deadline)
+    return time_field, windows
+
+
+async def scan_partitions(
+    set_name: str,
+    filters: List[str],
+    on_row: Callable[[Dict[str, Any]], None],
+    params: Optional[Dict[str, Any]] = None,
+    page_size: int = 200,
+    prefetch: int = 0,
+    limit_pages: Optional[int] = None,
+    max_records: Optional[int] = None,
+    deadline: Optional[float] = None,
+    starts: Optional[List[Optional[str]]] = None,
+) -> Dict[str, Any]:
+    """
+    Page through every $filter in `filters` concurrently, calling on_row(row)
+    for each row (from one event loop, so on_row needs no locking).
+    limit_pages applies per partition, max_records to the total.
+    starts[i]: a nextLink to resume partition i from (None = its beginning).
+    Returns {"count", "complete": every partition read to its end,
+    "partitions": [{"complete", "next"}] in the order of `filters`}, where
+    "next" is the link to resume an unfinished partition from (None: from
+    its beginning; one cut short in the middle of a page resumes at that page).
+    If one partition fails the others are cancelled and the error is raised.
+    """
+    base = dict(params or {})
+    count = 0
+
+    async def one(flt: str, start: Optional[str]) -> Tuple[bool, Optional[str]]:
+        nonlocal count
+        state: Dict[str, Any] = {}
+        q = dict(base)
+        q["$filter"] = f"({q['$filter']}) and ({flt})" if q.get("$filter") else flt
+        path, q = (start, None) if start else (f"/{set_name}", q)
+        async for row, _ in paginate_table(path, params=q, page_size=page_size,
+                                           prefetch=prefetch, max_pages=limit_pages,
+                                           deadline=deadline, state=state):
+            if max_records and count >= max_records:
+                break
+            on_row(row)
+            count += 1
+        if state.get("complete"):
+            return True, None
+        return False, state.get("continuation") or state.get("page_link") or start
+
+    starts = starts or [None] * len(filters)
+    tasks = [asyncio.ensure_future(one(f, s)) for f, s in zip(filters, starts)]
+    try:
+        done = await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        await asyncio.wait(tasks)
+        raise
+    return {"count": count, "complete": all(ok for ok, _ in done),
+            "partitions": [{"complete": ok, "next": link} for ok, link in done]}
@@ -0,0 +1,181 @@
+# connectors/d365/pipeline.py
+from __future__ import annotations
+import asyncio
+import inspect
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+# Staged ingest: fetch -> transform -> sinks, joined by bounded queues.
+#
+#   fetch      pulls pages (lists of rows) from a source iterator
+#   transform  N workers map each page (e.g. map_d365_event); pages are put
+#              back in order before the sinks. A sync transform runs on the
+#              event loop, so more than one worker only helps async ones.
+#   sinks      each sink gets every page, in order, from its own queue
+#
+# The unit is a page, not a row, so the per-item cost stays small. A full
+# queue blocks the stage that feeds it, so memory stays bounded and the slow
+# stage shows up in the metrics: its input queue sits full ("queue_max",
+# "queue_avg") and the stages before it report time blocked on output
+# ("wait_out"), the ones after it time starved for input ("wait_in").
+
+_END = object()
+
+Transform = Callable[[List[Any]], Any]   # rows -> items (sync or async)
+Sink = Callable[["Page"], Awaitable[None]]  # gets the page: .rows as fetched, .items as transformed
+
+
+class Page:
+    __slots__ = ("seq", "rows", "items", "pos")
+
+    def __init__(self, seq: int, rows: List[Any], pos: Any = None):
+        self.seq, self.rows, self.pos = seq, rows, pos
+        self.items: List[Any] = rows
+
+
+class StageMetrics:
+    def __init__(self, name: str, workers: int = 1):
+        self.name, self.workers = name, workers
+        self.pages = self.rows = 0
+        self.busy = self.wait_in = self.wait_out = 0.0
+        self._depth_sum = self._depth_n = self.queue_max = 0
+
+    def sample(self, q: Optional[asyncio.Queue]) -> None:
+        if q is not None:
+            d = q.qsize()
+            self._depth_sum += d
+            self._depth_n += 1
+            self.queue_max = max(self.queue_max, d)
+
+    def snapshot(self) -> dict:
+        return {"workers": self.workers, "pages": self.pages, "rows": self.rows,
+                "busy": round(self.busy, 3), "wait_in": round(self.wait_in, 3), "wait_out": round(self.wait_out, 3),
+                "queue_max": self.queue_max,
+                "queue_avg": round(self._depth_sum / self._depth_n, 2) if self._depth_n else 0}
+
+
+async def run_pipeline(
+    pages: AsyncIterator[Page],
+    sinks: Dict[str, Sink],
+    transform: Optional[Transform] = None,
+    transform_workers: int = 1,
+    queue_size: int = 4,
+    on_page_done: Optional[Callable[[Page], Awaitable[None]]] = None,
+) -> Dict[str, Any]:
+    """
+    Run `pages` (numbered 0, 1, 2, ...) through `transform` (identity if
+    None) into every sink.
+    on_page_done(page) is awaited once every sink has handled a page, in page
+    order (e.g. to checkpoint a cursor). If any stage fails, the others are
+    cancelled and the error is raised.
+    Returns {"seconds", "stages": {name: metrics}}.
+    """
+    t_start = time.perf_counter()
+    workers = max(1, transform_workers)
+    q_fetch: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    q_sink = {name: asyncio.Queue(maxsize=queue_size) for name in sinks}
+    m_fetch, m_transform = StageMetrics("fetch"), StageMetrics("transform", workers)
+    m_sink = {name: StageMetrics(f"sink:{name}") for name in sinks}
+    pending_sinks: Dict[int, int] = {}  # seq -> sinks still to handle it
+    done_lock = asyncio.Lock()
+    is_async = transform is not None and inspect.iscoroutinefunction(transform)
+
+    async def put(q: asyncio.Queue, item: Any, m: StageMetrics) -> None:
+        t = time.perf_counter()
+        await q.put(item)
+        m.wait_out += time.perf_counter() - t
+
+    async def get(q: asyncio.Queue, m: StageMetrics) -> Any:
+        m.sample(q)
+        t = time.perf_counter()
+        item = await q.get()
+        m.wait_in += time.perf_counter() - t
+        return item
+
+    async def fetch() -> None:
+        it = pages.__aiter__()
+        while True:
+            t = time.perf_counter()
+            try:
+                page = await it.__anext__()
+            except StopAsyncIteration:
+                break
+            finally:
+                m_fetch.busy += time.perf_counter() - t
+            m_fetch.pages += 1
+            m_fetch.rows += len(page.rows)
+            await put(q_fetch, page, m_fetch)
+        for _ in range(workers):
+            await put(q_fetch, _END, m_fetch)
+
+    # transformed pages wait here until every earlier page is out too
+    ready: Dict[int, Page] = {}
+    next_seq = {"v": 0}
+    ended = {"v": 0}
+    release_lock = asyncio.Lock()  # one releaser at a time keeps the sink queues in page order
+
+    async def release() -> None:
+        async with release_lock:
+            while next_seq["v"] in ready:
+                page = ready.pop(next_seq["v"])
+                next_seq["v"] += 1
+                pending_sinks[page.seq] = len(sinks)
+                for q in q_sink.values():
+                    await put(q, page, m_transform)
+
+    async def transform_worker() -> None:
+        while True:
+            page = await get(q_fetch, m_transform)
+            if page is _END:
+                ended["v"] += 1
+                if ended["v"] == workers:
+                    async with release_lock:
+                        for q in q_sink.values():
+                            await put(q, _END, m_transform)
+                return
+            t = time.perf_counter()
+            if transform is not None:
+                page.items = await transform(page.rows) if is_async else transform(page.rows)
+            m_transform.busy += time.perf_counter() - t
+            m_transform.pages += 1
+            m_transform.rows += len(page.rows)
+            ready[page.seq] = page
+            await release()
+
+    async def sink_worker(name: str, sink: Sink) -> None:
+        m, q = m_sink[name], q_sink[name]
+        while True:
+            page = await get(q, m)
+            if page is _END:
+                return
+            t = time.perf_counter()
+            await sink(page)
+            m.busy += time.perf_counter() - t
+            m.pages += 1
+            m.rows += len(page.items)
+            async with done_lock:  # sinks finish pages in order, so completions are in order too
+                pending_sinks[page.seq] -= 1
+                if pending_sinks[page.seq] == 0:
+                    del pending_sinks[page.seq]
+                    if on_page_done is not None:
+                        await on_page_done(page)
+
+    tasks = [asyncio.ensure_future(fetch())]
+    tasks += [asyncio.ensure_future(transform_worker()) for _ in range(workers)]
+    tasks += [asyncio.ensure_future(sink_worker(n, s)) for n, s in sinks.items()]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for t in done:
+            if t.exception() is not None:
+                raise t.exception()
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.wait(tasks)
+        aclose = getattr(pages, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+    stages = [m_fetch, m_transform, *m_sink.values()]
+    return {"seconds": round(time.perf_counter() - t_start, 3),
+            "stages": {m.name: m.snapshot() for m in stages}}
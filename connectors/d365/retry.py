@@ -0,0 +1,170 @@
+# connectors/d365/retry.py
+from __future__ import annotations
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+import httpx
+from common.settings import settings
+from common.profiles import OrgRegistry, org_setting
+from connectors.d365.throttle import parse_retry_after
+
+# Per-status behaviour
+THROTTLE = "throttle"  # wait for a governor slot; the governor already paused the org for Retry-After
+BACKOFF = "backoff"    # full-jitter sleep, never shorter than Retry-After
+RETRY_STATUSES = {429: THROTTLE, 502: BACKOFF, 503: BACKOFF, 504: BACKOFF}
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# the request never reached Dataverse, so retrying is safe even for POST
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+# transient network errors worth retrying for idempotent requests
+TRANSIENT_ERRORS = (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)
+
+T = TypeVar("T")
+
+
+class RetryPolicy:
+    """Attempts, full-jitter exponential backoff and the status -> behaviour table."""
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 0.5, max_delay: float = 30.0,
+                 statuses: Optional[dict[int, str]] = None):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.statuses = RETRY_STATUSES if statuses is None else statuses
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        # "full jitter": uniform(0, min(cap, base * 2^n)) spreads retries out
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+class RetryBudget:
+    """
+    Token bucket that caps retries at `ratio` of request volume per org.
+    Every new request deposits `ratio` tokens, every retry withdraws one; the
+    bucket starts with (and never exceeds) `reserve` tokens so low-traffic
+    callers can still retry. When an org is struggling, retries stop well
+    before they multiply the load.
+    """
+
+    def __init__(self, ratio: float = 0.2, reserve: float = 10.0):
+        self.ratio = ratio
+        self.reserve = reserve
+        self.tokens = reserve
+
+    def record_request(self) -> None:
+        self.tokens = min(self.reserve, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+def default_policy(url: Optional[str] = None) -> RetryPolicy:
+    """Policy from settings, or from the tenant profile of the org `url` points at."""
+    get = (lambda n: org_setting(url, n)) if url else (lambda n: getattr(settings, n))
+    return RetryPolicy(
+        max_attempts=get("d365_retry_max_attempts"),
+        base_delay=get("d365_retry_base_delay"),
+        max_delay=get("d365_retry_max_delay"),
+    )
+
+_budgets: OrgRegistry[RetryBudget] = OrgRegistry(
+    lambda url: RetryBudget(org_setting(url, "d365_retry_budget_ratio"),
+                            org_setting(url, "d365_retry_budget_reserve")),
+    depends_on=("d365_retry_budget_ratio", "d365_retry_budget_reserve"))
+
+def get_retry_budget(url: str) -> RetryBudget:
+    return _budgets.get(url)
+
+def _fits(deadline: Optional[float], wait: float) -> bool:
+    """True if waiting `wait` seconds still leaves time before `deadline` (time.monotonic())."""
+    return deadline is None or time.monotonic() + wait < deadline
+
+
+# ---------- Deadlines ----------
+# A deadline is a time.monotonic() timestamp owned by whoever started the work
+# (usually a gateway request); everything below it only shortens its own waits.
+
+class DeadlineExceeded(TimeoutError):
+    """The caller's deadline passed before the Dataverse call could finish."""
+
+def deadline_in(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else time.monotonic() + seconds
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    """Seconds left before `deadline` (None = no deadline). Raises DeadlineExceeded if none are."""
+    if deadline is None:
+        return None
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("deadline exceeded")
+    return left
+
+def attempt_timeout(deadline: Optional[float], cap: float) -> float:
+    """Per-attempt timeout: `cap`, shortened to what is left of the deadline."""
+    left = remaining(deadline)
+    return cap if left is None else min(cap, left)
+
+async def within(deadline: Optional[float], aw: Awaitable[T]) -> T:
+    """Await `aw`, giving up with DeadlineExceeded when the deadline passes."""
+    left = remaining(deadline)
+    if left is None:
+        return await aw
+    try:
+        return await asyncio.wait_for(aw, left)
+    except asyncio.TimeoutError as e:
+        raise DeadlineExceeded("deadline exceeded") from e
+
+async def send_with_retries(
+    send: Callable[[int], Awaitable[httpx.Response]],
+    *,
+    method: str,
+    budget: RetryBudget,
+    policy: Optional[RetryPolicy] = None,
+    deadline: Optional[float] = None,
+) -> httpx.Response:
+    """
+    The single retry engine for Dataverse calls.
+
+    `send(attempt)` performs one attempt and returns the response (or raises a
+    transport error). Returns the final response; callers decide how to turn
+    a non-2xx into an exception. A retry happens only if the status/error is
+    retryable for this method, attempts remain, the wait fits before
+    `deadline`, and the org's retry budget has a token.
+    """
+    policy = policy or default_policy()
+    idempotent = method.upper() in IDEMPOTENT_METHODS
+    budget.record_request()
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            r = await send(attempt)
+        except TRANSIENT_ERRORS as e:
+            if not (idempotent or isinstance(e, NOT_SENT_ERRORS)):
+                raise
+            wait = policy.backoff(attempt)
+            if attempt >= policy.max_attempts or not _fits(deadline, wait) or not budget.try_spend():
+                raise
+            await asyncio.sleep(wait)
+            continue
+
+        kind = policy.statuses.get(r.status_code)
+        # Dataverse rejects throttled calls before running them, so 429 is safe for any method
+        if kind is None or (kind != THROTTLE and not idempotent):
+            return r
+        retry_after = parse_retry_after(r.headers.get("Retry-After"))
+        if kind == THROTTLE:
+            wait, sleep = (retry_after or 0.0), 0.0
+        else:
+            wait = sleep = policy.backoff(attempt, retry_after)
+        if attempt >= policy.max_attempts or not _fits(deadline, wait) or not budget.try_spend():
+            return r
+        if sleep:
+            await asyncio.sleep(sleep)
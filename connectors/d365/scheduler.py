@@ -0,0 +1,169 @@
+# connectors/d365/scheduler.py
+from __future__ import annotations
+import asyncio
+import logging
+import random
+import time
+from typing import Dict, Optional, Tuple
+from common.profiles import use_profile
+from common.registry import load_registry
+from common.settings import settings
+from connectors.d365.breaker import CircuitOpenError
+
+log = logging.getLogger("integration-hub.scheduler")
+
+# Background polling: every registered (tenant, table) is polled by its own
+# task on its own interval, in the tenant's profile. The interval adapts to
+# the table's activity:
+#   - the poll stopped before the end (page limit): poll again after the min
+#   - the poll found rows: halve the interval (down to the min)
+#   - nothing new: grow it by BACKOFF (up to the max)
+#   - the poll failed: double it (an open circuit waits at least until the
+#     breaker's probe)
+# Every wait is jittered by +-D365_SCHEDULER_JITTER, and first polls are
+# spread over one interval, so tables do not line up on the same second.
+# A poll that stopped early returns a continuation; the next round resumes
+# there (a delta read bigger than one round would otherwise restart forever).
+# Polls hold the table's ingest.table_lock, so a manual :poll of the same
+# table waits for the scheduled one instead of storing its rows again.
+# The registry (data/registry.json) is re-read every RECONCILE_EVERY seconds.
+
+RECONCILE_EVERY = 30.0
+BACKOFF = 1.5
+MAX_RESUME_FAILURES = 3  # a continuation failing this often may have expired: start over
+
+Key = Tuple[str, str]  # (tenant, logical table)
+
+
+class TableSchedule:
+    """Interval state of one (tenant, table)."""
+
+    def __init__(self, tenant: str, table: str, interval: float):
+        self.tenant, self.table = tenant, table
+        self.interval = interval
+        self.polls = 0
+        self.failures = 0  # consecutive
+        self.last_count: Optional[int] = None
+        self.last_error: Optional[str] = None
+        self.last_seconds: Optional[float] = None
+        self.next_at: Optional[float] = None  # time.time()
+        self.continuation: Optional[str] = None  # where the last poll stopped
+        self.meta: Optional[dict] = None  # table metadata, resolved once
+
+    def update(self, result: Optional[dict], error: Optional[BaseException],
+               min_interval: float, max_interval: float) -> None:
+        self.polls += 1
+        if error is not None:
+            self.failures += 1
+            self.last_error = f"{type(error).__name__}: {error}"
+            self.interval = max(self.interval, min_interval) * 2
+            if isinstance(error, CircuitOpenError):
+                self.interval = max(self.interval, error.retry_in)
+            if self.failures >= MAX_RESUME_FAILURES:
+                self.continuation = None
+        else:
+            self.failures, self.last_error = 0, None
+            self.last_count = result["count"]
+            self.continuation = result.get("continuation")
+            if not result.get("complete"):
+                self.interval = min_interval  # a backlog: keep reading
+            elif result["count"]:
+                self.interval /= 2
+            else:
+                self.interval *= BACKOFF
+        self.interval = min(max(self.interval, min_interval), max_interval)
+
+    def snapshot(self) -> dict:
+        return {"interval": round(self.interval, 1), "polls": self.polls, "failures": self.failures,
+                "last_count": self.last_count, "last_error": self.last_error,
+                "last_seconds": self.last_seconds, "next_at": self.next_at,
+                "resuming": self.continuation is not None}
+
+
+class PollScheduler:
+    """Runs the background polls; start() / stop() from the app's lifecycle hooks."""
+
+    def __init__(self):
+        self._schedules: Dict[Key, TableSchedule] = {}
+        self._tasks: Dict[Key, asyncio.Task] = {}
+        self._supervisor: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    @property
+    def running(self) -> bool:
+        return self._supervisor is not None
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._slots = asyncio.Semaphore(settings.hub_scheduler_concurrency)
+        self._supervisor = asyncio.ensure_future(self._supervise())
+
+    async def stop(self) -> None:
+        tasks = list(self._tasks.values()) + ([self._supervisor] if self._supervisor else [])
+        self._supervisor = None
+        self._tasks.clear()
+        for t in tasks:
+            t.cancel()
+        if tasks:
+            await asyncio.wait(tasks)
+
+    def snapshot(self) -> dict:
+        return {"running": self.running,
+                "tables": {f"{t}/{tbl}": s.snapshot() for (t, tbl), s in sorted(self._schedules.items())}}
+
+    async def _supervise(self) -> None:
+        while True:
+            try:
+                self._reconcile()
+            except Exception:
+                log.exception("reading the registry failed")
+            await asyncio.sleep(RECONCILE_EVERY)
+
+    def _reconcile(self) -> None:
+        wanted = {(tenant, table) for tenant, tables in load_registry().items() for table in tables}
+        for key in set(self._tasks) - wanted:
+            self._tasks.pop(key).cancel()  # unregistered
+            self._schedules.pop(key, None)
+        for key in wanted - set(self._tasks):
+            with use_profile(key[0]) as prof:
+                interval = prof.setting("d365_scheduler_min_interval")
+            self._schedules[key] = TableSchedule(*key, interval=interval)
+            self._tasks[key] = asyncio.ensure_future(self._run(self._schedules[key]))
+
+    async def _run(self, sched: TableSchedule) -> None:
+        from connectors.d365.ingest import poll_table, table_lock
+        from connectors.d365.metadata import get_tables_meta
+
+        await self._wait(sched, random.uniform(0, sched.interval))
+        while True:
+            # re-bound every round, so edits to data/profiles.json apply
+            with use_profile(sched.tenant) as prof:
+                result, error = None, None
+                async with self._slots, table_lock(sched.tenant, sched.table):
+                    t0 = time.perf_counter()
+                    try:
+                        if sched.meta is None:
+                            meta = (await get_tables_meta([sched.table]))[sched.table]
+                            if not meta.get("set"):
+                                raise RuntimeError(f"no entity set found for table '{sched.table}'")
+                            sched.meta = meta
+                        result = await poll_table(sched.tenant, sched.table,
+                                                  limit_pages=prof.setting("d365_scheduler_max_pages"),
+                                                  meta=sched.meta, continuation=sched.continuation)
+                    except Exception as e:
+                        log.warning("%s/%s poll failed: %r", sched.tenant, sched.table, e)
+                        error = e
+                    sched.last_seconds = round(time.perf_counter() - t0, 3)
+                sched.update(result, error, prof.setting("d365_scheduler_min_interval"),
+                             prof.setting("d365_scheduler_max_interval"))
+                jitter = prof.setting("d365_scheduler_jitter")
+            await self._wait(sched, sched.interval * random.uniform(1 - jitter, 1 + jitter))
+
+    @staticmethod
+    async def _wait(sched: TableSchedule, delay: float) -> None:
+        sched.next_at = time.time() + delay
+        await asyncio.sleep(delay)
+
+
+scheduler = PollScheduler()
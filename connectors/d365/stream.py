@@ -0,0 +1,163 @@
+# connectors/d365/stream.py
+from __future__ import annotations
+import codecs
+import json
+import re
+from typing import Any, AsyncIterator, Dict
+
+# Incremental parser for one OData page:
+#   {"@odata.context": "...", "value": [ {row}, {row}, ... ], "@odata.nextLink": "..."}
+# Rows of the "value" array are yielded as soon as each one is complete in the
+# byte stream, so peak memory is one network chunk + one row instead of the
+# whole page. Every other top-level key (@odata.nextLink, @odata.deltaLink,
+# @odata.count, ...) is collected into the caller's `trailer` dict, which is
+# complete once the generator is exhausted.
+#
+# Uses the stdlib scanner (json.JSONDecoder.raw_decode): the fast decoders in
+# codec.py can't resume on partial input. Use this for memory, codec for CPU.
+# raw_decode can't resume either, so a row that spans many chunks is not
+# decoded again from its start as each one arrives: _Scan first finds where it
+# ends (carrying its position across chunks), then the row is decoded once.
+
+_WS = " \t\n\r"
+_TRIM_AT = 1 << 16  # drop consumed text once this much has been parsed
+_IN_STRING = re.compile(r'["\\]')
+_STRUCTURE = re.compile(r'["{}\[\]]')
+
+
+class _Scan:
+    """Finds the end of the object / array / string starting at `start`, resuming where the last call stopped."""
+
+    def __init__(self):
+        self.at = 0  # offset from the value's start scanned so far
+        self.depth = 0
+        self.in_str = False
+
+    def end(self, text: str, start: int) -> int:
+        """Offset just past the value, or -1 if it is not all in `text` yet."""
+        i = start + self.at
+        while True:
+            if self.in_str:
+                m = _IN_STRING.search(text, i)
+                if m is None:
+                    i = len(text)
+                    break
+                if m.group() == "\\":
+                    if m.end() >= len(text):
+                        i = m.start()  # the escaped character is in the next chunk
+                        break
+                    i = m.end() + 1
+                    continue
+                self.in_str = False
+                i = m.end()
+                if self.depth == 0:
+                    return i
+            else:
+                m = _STRUCTURE.search(text, i)
+                if m is None:
+                    i = len(text)
+                    break
+                i = m.end()
+                c = m.group()
+                if c == '"':
+                    self.in_str = True
+                elif c in "{[":
+                    self.depth += 1
+                else:
+                    self.depth -= 1
+                    if self.depth == 0:
+                        return i
+        self.at = i - start
+        return -1
+
+
+class _Buffer:
+    def __init__(self, chunks: AsyncIterator[bytes]):
+        self._chunks = chunks.__aiter__()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._dec = json.JSONDecoder()
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+
+    async def _more(self) -> None:
+        try:
+            chunk = await self._chunks.__anext__()
+        except StopAsyncIteration:
+            self.text += self._utf8.decode(b"", final=True)
+            self.eof = True
+            return
+        if self.pos >= _TRIM_AT:
+            self.text = self.text[self.pos:]
+            self.pos = 0
+        self.text += self._utf8.decode(chunk)
+
+    async def peek(self) -> str:
+        """Next non-whitespace character ('' at end of stream), not consumed."""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WS:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if self.eof:
+                return ""
+            await self._more()
+
+    async def expect(self, ch: str) -> None:
+        got = await self.peek()
+        if got != ch:
+            raise ValueError(f"Malformed OData page: expected '{ch}' at offset {self.pos}, got {got!r}")
+        self.pos += 1
+
+    async def value(self) -> Any:
+        """Decode the next complete JSON value."""
+        first = await self.peek()
+        if first and first in '{["':
+            scan = _Scan()
+            while scan.end(self.text, self.pos) < 0 and not self.eof:
+                await self._more()
+            obj, self.pos = self._dec.raw_decode(self.text, self.pos)  # truncated at EOF: JSONDecodeError
+            return obj
+        while True:
+            try:
+                obj, end = self._dec.raw_decode(self.text, self.pos)
+                # a value ending exactly at the buffer edge may be truncated (e.g. a number)
+                if end < len(self.text) or self.eof:
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            await self._more()
+
+
+async def iter_odata_page(chunks: AsyncIterator[bytes], trailer: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """Yield the rows of one OData page from its body byte chunks; fill `trailer` with the other keys."""
+    buf = _Buffer(chunks)
+    await buf.expect("{")
+    if await buf.peek() == "}":
+        return
+    while True:
+        key = await buf.value()
+        await buf.expect(":")
+        if key == "value" and await buf.peek() == "[":
+            await buf.expect("[")
+            if await buf.peek() == "]":
+                buf.pos += 1
+            else:
+                while True:
+                    yield await buf.value()
+                    nxt = await buf.peek()
+                    buf.pos += 1
+                    if nxt == "]":
+                        break
+                    if nxt != ",":
+                        raise ValueError(f"Malformed OData page: expected ',' or ']', got {nxt!r}")
+        else:
+            trailer[key] = await buf.value()
+        nxt = await buf.peek()
+        buf.pos += 1
+        if nxt == "}":
+            return
+        if nxt != ",":
+            raise ValueError(f"Malformed OData page: expected ',' or '}}', got {nxt!r}")
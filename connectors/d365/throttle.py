@@ -0,0 +1,185 @@
+# connectors/d365/throttle.py
+from __future__ import annotations
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Deque, Mapping, Optional
+from common.profiles import OrgRegistry, org_setting
+
+# Dataverse service-protection headers, sent on every response.
+# https://learn.microsoft.com/power-apps/developer/data-platform/api-limits
+H_BURST_REMAINING = "x-ms-ratelimit-burst-remaining-xrm-requests"
+H_TIME_REMAINING = "x-ms-ratelimit-time-remaining-xrm-requests"  # ms of execution time
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After is either delta-seconds or an HTTP date. Returns seconds or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+def _header_number(headers: Mapping[str, str], name: str) -> Optional[float]:
+    v = headers.get(name)
+    if v is None:
+        return None
+    try:
+        return float(str(v).replace(",", ""))
+    except ValueError:
+        return None
+
+
+class ThrottleGovernor:
+    """
+    AIMD concurrency governor for one Dataverse org.
+
+    - Callers take a slot with `async with gov.slot():` and report every
+      response with `gov.observe(status, headers)`.
+    - Successful responses with healthy remaining budget grow the limit
+      additively (~+1 per window of completions); 429s or a nearly exhausted
+      x-ms-ratelimit-* budget shrink it multiplicatively.
+    - Retry-After pauses the whole org queue once, instead of every caller
+      sleeping on its own and then bursting together.
+    - Waiters are served strictly FIFO.
+    """
+
+    # remaining-budget low-water marks that trigger a decrease
+    MIN_BURST_REMAINING = 200
+    MIN_TIME_REMAINING_MS = 60_000
+    DECREASE_FACTOR = 0.5
+    DECREASE_COOLDOWN = 1.0  # seconds; at most one decrease per "round-trip"
+
+    def __init__(self, initial: int = 8, min_limit: int = 1, max_limit: int = 52):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.in_flight = 0
+        self.paused_until = 0.0  # time.monotonic()
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+        self.throttled = 0  # 429s and low-budget responses seen (ever increasing)
+        self._wake_handle: Optional[asyncio.TimerHandle] = None
+
+    # ---- slots ----
+    def _can_run(self) -> bool:
+        return self.in_flight < int(self.limit) and time.monotonic() >= self.paused_until
+
+    async def acquire(self) -> None:
+        if not self._waiters and self._can_run():
+            self.in_flight += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        self._wake()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # slot was granted just as we were cancelled: hand it back
+                self.release()
+            else:
+                try:
+                    self._waiters.remove(fut)
+                except ValueError:
+                    pass
+            raise
+
+    def try_acquire(self) -> bool:
+        """Take a slot only if one is free right now (nobody queued, not paused)."""
+        if not self._waiters and self._can_run():
+            self.in_flight += 1
+            return True
+        return False
+
+    def release(self) -> None:
+        self.in_flight = max(0, self.in_flight - 1)
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _wake(self) -> None:
+        while self._waiters and self._can_run():
+            fut = self._waiters.popleft()
+            if fut.done():
+                continue
+            self.in_flight += 1
+            fut.set_result(None)
+        if self._waiters and self.paused_until > time.monotonic() and self._wake_handle is None:
+            delay = self.paused_until - time.monotonic()
+            self._wake_handle = asyncio.get_running_loop().call_later(delay, self._on_pause_end)
+
+    def _on_pause_end(self) -> None:
+        self._wake_handle = None
+        self._wake()
+
+    # ---- feedback ----
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def _decrease(self) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < self.DECREASE_COOLDOWN:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.min_limit), self.limit * self.DECREASE_FACTOR)
+
+    def _increase(self) -> None:
+        # additive increase: +1 after roughly `limit` successful completions
+        self.limit = min(float(self.max_limit), self.limit + 1.0 / max(self.limit, 1.0))
+
+    def observe(self, status: int, headers: Mapping[str, str]) -> None:
+        retry_after = parse_retry_after(headers.get("Retry-After"))
+        if status == 429:
+            self.throttled += 1
+            self._decrease()
+            self.pause(retry_after if retry_after is not None else 1.0)
+        else:
+            burst = _header_number(headers, H_BURST_REMAINING)
+            exec_ms = _header_number(headers, H_TIME_REMAINING)
+            low = (burst is not None and burst < self.MIN_BURST_REMAINING) or \
+                  (exec_ms is not None and exec_ms < self.MIN_TIME_REMAINING_MS)
+            if low:
+                self.throttled += 1
+                self._decrease()
+            elif status < 400:
+                self._increase()
+            if retry_after and status == 503:
+                self.pause(retry_after)
+        self._wake()
+
+    def snapshot(self) -> dict:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "throttled": self.throttled,
+            "paused_for": max(0.0, round(self.paused_until - time.monotonic(), 3)),
+        }
+
+
+def _new_governor(url: str) -> ThrottleGovernor:
+    return ThrottleGovernor(
+        initial=org_setting(url, "d365_throttle_initial"),
+        min_limit=org_setting(url, "d365_throttle_min"),
+        max_limit=org_setting(url, "d365_throttle_max"),
+    )
+
+# per org; requests already holding a slot release it on the governor they took it from
+_governors: OrgRegistry[ThrottleGovernor] = OrgRegistry(_new_governor, depends_on=(
+    "d365_throttle_initial", "d365_throttle_min", "d365_throttle_max"))
+
+def get_governor(url: str) -> ThrottleGovernor:
+    return _governors.get(url)
@@ -0,0 +1,75 @@
+# tests/bench_decode.py
+"""
+Micro-benchmark for the JSON decoders in connectors/d365/codec.py.
+
+Builds OData-shaped pages ({"@odata.context", "value": [...], "@odata.nextLink"})
+from rows recorded by the poller under .runtime/data/<tenant>/<logical>/ (common/rowstore.py),
+or uses saved raw page bodies (*.json) from --pages DIR, then times every
+installed decoder on them.
+
+    python -m tests.bench_decode                 # recorded rows, 5000-row pages
+    python -m tests.bench_decode --page-size 200
+    python -m tests.bench_decode --pages ./recorded_pages
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+from itertools import islice
+
+from common.rowstore import iter_rows, stored_tables
+from connectors.d365.codec import DECODERS, get_decoder
+
+def _pages_from_rows(data_dir: Path, page_size: int) -> list[tuple[str, bytes]]:
+    pages = []
+    for tenant, table in stored_tables(data_dir):
+        rows = [r for r in islice(iter_rows(tenant, table, root=data_dir), page_size) if not r.get("@deleted")]
+        if not rows:
+            continue
+        # repeat rows so every table yields one full page of the requested size
+        value = (rows * (page_size // len(rows) + 1))[:page_size]
+        body = {
+            "@odata.context": f"https://example.crm.dynamics.com/api/data/v9.2/$metadata#{table}s",
+            "value": value,
+            "@odata.nextLink": f"https://example.crm.dynamics.com/api/data/v9.2/{table}s?$skiptoken=x",
+        }
+        pages.append((f"{table} x{page_size}", json.dumps(body).encode("utf-8")))
+    return pages
+
+def _pages_from_dir(pages_dir: Path) -> list[tuple[str, bytes]]:
+    return [(p.name, p.read_bytes()) for p in sorted(pages_dir.glob("*.json"))]
+
+def _time(fn, payload: bytes, repeat: int) -> float:
+    fn(payload)  # warm-up
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn(payload)
+    return (time.perf_counter() - t0) / repeat
+
+def run_bench(pages: list[tuple[str, bytes]], repeat: int) -> None:
+    decoders = {}
+    for name in DECODERS:
+        try:
+            decoders[name] = get_decoder(name)[1]
+        except ImportError:
+            print(f"(skipping {name}: not installed)")
+    for label, payload in pages:
+        base = _time(decoders["json"], payload, repeat)
+        print(f"\n{label}: {len(payload) / 1024:.0f} KiB")
+        for name, fn in decoders.items():
+            t = _time(fn, payload, repeat)
+            print(f"  {name:<8} {t * 1000:8.2f} ms/page   {base / t:5.2f}x vs json")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--data-dir", default=".runtime/data", help="recorded rows (<tenant>/<logical>/ segments)")
+    ap.add_argument("--pages", default=None, help="directory of raw page bodies (*.json) instead")
+    ap.add_argument("--page-size", type=int, default=5000)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    pages = _pages_from_dir(Path(args.pages)) if args.pages else _pages_from_rows(Path(args.data_dir), args.page_size)
+    if not pages:
+        raise SystemExit("No recorded pages found; run a poll first or pass --pages DIR")
+    run_bench(pages, args.repeat)
@@ -0,0 +1,56 @@
+import asyncio
+import common.auth as auth
+from common.auth import TokenProvider
+
+
+class _Response:
+    def __init__(self, token: str):
+        self._token = token
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"access_token": self._token, "expires_in": 3600}
+
+
+class _Client:
+    def __init__(self):
+        self.posts = 0
+
+    async def post(self, url, data=None, timeout=None):
+        self.posts += 1
+        await asyncio.sleep(0.01)
+        return _Response(f"token-{self.posts}")
+
+
+def test_caller_joining_background_refresh_gets_token(monkeypatch):
+    cli = _Client()
+    monkeypatch.setattr(auth, "get_http_client", lambda url: cli)
+
+    async def run():
+        prov = TokenProvider("tenant", "client", "secret", "https://org.example/.default")
+        prov._schedule_refresh(0)  # background refresh due now
+        while prov._inflight is None:
+            await asyncio.sleep(0)
+        # it is fetching; this caller joins it (no token cached yet)
+        token = await prov.get_token()
+        prov.close()
+        return token
+
+    assert asyncio.run(run()) == "token-1"
+    assert cli.posts == 1
+
+
+def test_concurrent_callers_share_one_fetch(monkeypatch):
+    cli = _Client()
+    monkeypatch.setattr(auth, "get_http_client", lambda url: cli)
+
+    async def run():
+        prov = TokenProvider("tenant", "client", "secret", "https://org.example/.default")
+        tokens = await asyncio.gather(*(prov.get_token() for _ in range(10)))
+        prov.close()
+        return tokens
+
+    assert asyncio.run(run()) == ["token-1"] * 10
+    assert cli.posts == 1
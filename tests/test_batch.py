@@ -0,0 +1,88 @@
+import asyncio
+import httpx
+import pytest
+import connectors.d365.ingest as ingest
+from connectors.d365.client import _build_batch_body, _parse_batch_response
+
+# As returned by Dataverse for a 2-part GET $batch (CRLF line endings)
+RECORDED = (
+    "--batchresponse_c1bd45c1-dd81-470d-b897-e965846aad2f\r\n"
+    "Content-Type: application/http\r\n"
+    "Content-Transfer-Encoding: binary\r\n"
+    "\r\n"
+    "HTTP/1.1 200 OK\r\n"
+    "Content-Type: application/json; odata.metadata=minimal; odata.streaming=true\r\n"
+    "OData-Version: 4.0\r\n"
+    "Preference-Applied: odata.maxpagesize=2\r\n"
+    "\r\n"
+    '{"@odata.context":"https://org.crm.dynamics.com/api/data/v9.2/$metadata#accounts(name,accountid)",'
+    '"value":[{"@odata.etag":"W/\\"2084511\\"","name":"Contoso é","accountid":"7b8a2d04-cb17-4f11-b872-6cb12230dde0"},'
+    '{"@odata.etag":"W/\\"2084512\\"","name":"Fabrikam","accountid":"667b9455-c86b-440a-b7f8-438226bb5c2a"}],'
+    '"@odata.nextLink":"https://org.crm.dynamics.com/api/data/v9.2/accounts?$select=name,accountid&$skiptoken=%3Ccookie%20pagenumber=%222%22%20/%3E"}\r\n'
+    "--batchresponse_c1bd45c1-dd81-470d-b897-e965846aad2f\r\n"
+    "Content-Type: application/http\r\n"
+    "Content-Transfer-Encoding: binary\r\n"
+    "\r\n"
+    "HTTP/1.1 404 Not Found\r\n"
+    "Content-Type: application/json; odata.metadata=minimal\r\n"
+    "OData-Version: 4.0\r\n"
+    "\r\n"
+    '{"error":{"code":"0x80060888","message":"Resource not found for the segment \'nosuchsets\'."}}\r\n'
+    "--batchresponse_c1bd45c1-dd81-470d-b897-e965846aad2f--\r\n"
+).encode("utf-8")
+
+
+def test_parse_recorded_batch_response():
+    ok, missing = _parse_batch_response(RECORDED)
+    assert ok["status"] == 200
+    assert ok["headers"]["Preference-Applied"] == "odata.maxpagesize=2"
+    assert [r["name"] for r in ok["body"]["value"]] == ["Contoso é", "Fabrikam"]
+    assert ok["body"]["@odata.nextLink"].endswith("%3Ccookie%20pagenumber=%222%22%20/%3E")
+    assert missing["status"] == 404
+    assert missing["body"]["error"]["code"] == "0x80060888"
+
+
+def test_parse_part_without_body():
+    body = (b"--batchresponse_1\r\nContent-Type: application/http\r\nContent-Transfer-Encoding: binary\r\n\r\n"
+            b"HTTP/1.1 204 No Content\r\nOData-Version: 4.0\r\n\r\n\r\n--batchresponse_1--\r\n")
+    assert _parse_batch_response(body) == [{"status": 204, "headers": {"OData-Version": "4.0"}, "body": None}]
+
+
+def test_parse_rejects_non_multipart():
+    with pytest.raises(ValueError):
+        _parse_batch_response(b'{"error":{"code":"0x0","message":"Bad Request"}}')
+
+
+def test_build_batch_body():
+    body = _build_batch_body("batch_x", [
+        {"path": "/accounts", "params": {"$select": "name"}, "max_page_size": 2},
+        {"path": "/EntityDefinitions(LogicalName='account')", "headers": {"Consistency": "x"}},
+    ]).decode("utf-8")
+    parts = body.split("--batch_x")
+    assert len(parts) == 4 and parts[-1] == "--\r\n"
+    assert "Content-Type: application/http\r\nContent-Transfer-Encoding: binary\r\n\r\nGET " in parts[1]
+    assert "Prefer: odata.maxpagesize=2\r\n" in parts[1]
+    assert "Consistency: x\r\n" in parts[2]
+    assert "\r\n\r\n" in parts[2] and " HTTP/1.1\r\n" in parts[2]
+
+
+def test_build_batch_body_rejects_writes():
+    with pytest.raises(ValueError):
+        _build_batch_body("batch_x", [{"path": "/accounts", "method": "POST"}])
+
+
+def test_poll_tables_resolves_metadata_per_table_when_batch_fails(monkeypatch):
+    async def failing_meta(tables, deadline=None):
+        raise httpx.ConnectError("batch down")
+
+    seen = {}
+
+    async def fake_poll_table(tenant, logical, meta=None, **kw):
+        seen[logical] = meta
+        return {"count": 1, "complete": True, "continuation": None}
+
+    monkeypatch.setattr(ingest, "get_tables_meta", failing_meta)
+    monkeypatch.setattr(ingest, "poll_table", fake_poll_table)
+    res = asyncio.run(ingest.poll_tables("t", ["account", "contact"]))
+    assert seen == {"account": None, "contact": None}  # poll_table resolves them itself
+    assert all(r["count"] == 1 and "error" not in r for r in res.values())
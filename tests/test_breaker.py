@@ -0,0 +1,117 @@
+import asyncio
+import httpx
+import pytest
+import connectors.d365.breaker as breaker
+import connectors.d365.client as client
+from connectors.d365.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = {"t": 1000.0}
+    monkeypatch.setattr(breaker.time, "monotonic", lambda: now["t"])
+    return now
+
+
+def _tripped(clock, open_seconds=30.0):
+    br = CircuitBreaker("org", failure_rate=0.5, min_requests=4, window=10.0, open_seconds=open_seconds)
+    for ok in (True, False, True, False):
+        br.allow()
+        br.record(ok)
+    assert br.state == OPEN
+    return br
+
+
+def test_opens_at_failure_rate_after_min_requests(clock):
+    br = CircuitBreaker("org", failure_rate=0.5, min_requests=4)
+    for ok in (False, False, False):
+        br.record(ok)
+    assert br.state == CLOSED  # too few calls to judge
+    br.record(True)
+    assert br.state == OPEN
+
+
+def test_old_outcomes_leave_the_window(clock):
+    br = CircuitBreaker("org", failure_rate=0.5, min_requests=4, window=10.0)
+    for _ in range(3):
+        br.record(False)
+    clock["t"] += 11
+    for _ in range(3):
+        br.record(True)
+    br.record(False)
+    assert br.state == CLOSED  # 1 failure of 4 in the window
+
+
+def test_open_circuit_fails_fast_with_time_left(clock):
+    br = _tripped(clock)
+    clock["t"] += 10
+    with pytest.raises(CircuitOpenError) as e:
+        br.allow()
+    assert e.value.retry_in == pytest.approx(20)
+    with pytest.raises(CircuitOpenError):
+        br.check()
+
+
+def test_half_open_probe_success_closes(clock):
+    br = _tripped(clock)
+    clock["t"] += 30
+    br.allow()  # the probe
+    assert br.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        br.allow()  # only one probe at a time
+    br.record(True)
+    assert br.state == CLOSED
+    br.allow()
+
+
+def test_half_open_probe_failure_reopens(clock):
+    br = _tripped(clock)
+    clock["t"] += 30
+    br.allow()
+    br.record(False)
+    assert br.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        br.allow()
+    clock["t"] += 30
+    br.allow()
+    assert br.state == HALF_OPEN
+
+
+def test_probe_without_verdict_frees_the_probe(clock):
+    br = _tripped(clock)
+    clock["t"] += 30
+    br.allow()
+    br.record(None)  # e.g. cancelled
+    assert br.state == HALF_OPEN
+    br.allow()
+
+
+def test_probe_cancelled_while_queued_on_the_governor_is_freed(monkeypatch):
+    async def handler(request):
+        return httpx.Response(200, json={"value": []})
+
+    async def token(profile=None):
+        return "t"
+
+    monkeypatch.setattr(client, "get_dataverse_token", token)
+    monkeypatch.setattr(client, "get_http_client",
+                        lambda url: httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    async def run():
+        url = client._api_base()
+        br, gov = client.get_breaker(url), client.get_governor(url)
+        br._open(breaker.time.monotonic() - br.open_seconds - 1)  # open, probe due
+        busy = gov.in_flight
+        gov.in_flight = int(gov.limit)  # every slot taken: the probe queues
+        probe = asyncio.ensure_future(client._request("GET", "/accounts"))
+        await asyncio.sleep(0.01)
+        assert br.state == HALF_OPEN and br._probe_in_flight
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert not br._probe_in_flight
+        gov.in_flight = busy
+        assert await client._request("GET", "/accounts") == {"value": []}
+        return br.state
+
+    assert asyncio.run(run()) == CLOSED
@@ -0,0 +1,70 @@
+import asyncio
+import time
+import pytest
+from connectors.d365.coalesce import SingleFlight, request_key
+from connectors.d365.retry import DeadlineExceeded
+
+
+def test_concurrent_callers_share_one_call():
+    flights = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"value": []}
+
+    async def run():
+        return await asyncio.gather(*(flights.do("k", fetch) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert len(calls) == 1 and all(r is results[0] for r in results)
+    assert len(flights) == 0
+
+
+def test_short_deadline_does_not_fail_other_callers():
+    flights = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.05)
+        return "rows"
+
+    async def run():
+        short = flights.do("k", fetch, deadline=time.monotonic() + 0.01)
+        patient = flights.do("k", fetch)
+        return await asyncio.gather(short, patient, return_exceptions=True)
+
+    short, patient = asyncio.run(run())
+    assert isinstance(short, DeadlineExceeded)
+    assert patient == "rows"
+
+
+def test_call_is_cancelled_once_nobody_waits():
+    flights = SingleFlight()
+    state = {}
+
+    async def fetch():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            state["cancelled"] = True
+            raise
+
+    async def run():
+        with pytest.raises(DeadlineExceeded):
+            await flights.do("k", fetch, deadline=time.monotonic() + 0.01)
+        await asyncio.sleep(0)
+        assert len(flights) == 0
+
+    asyncio.run(run())
+    assert state == {"cancelled": True}
+
+
+def test_request_key_ignores_auth_but_not_prefer():
+    a = request_key("https://Org.crm.dynamics.com", "/accounts", {"$top": 1},
+                    {"Authorization": "Bearer a", "Prefer": "odata.maxpagesize=10"})
+    b = request_key("https://org.crm.dynamics.com", "/accounts", {"$top": 1},
+                    {"Authorization": "Bearer b", "Prefer": "odata.maxpagesize=10"})
+    c = request_key("https://org.crm.dynamics.com", "/accounts", {"$top": 1},
+                    {"Prefer": "odata.maxpagesize=20"})
+    assert a == b and a != c
@@ -0,0 +1,91 @@
+import random
+import re
+import uuid
+from connectors.d365.cursor import (cursor_filter, cursor_orderby, cursor_sort_key, parse_cursor,
+                                    row_cursor)
+from connectors.d365.partition import guid_sort_key
+
+PK = "accountid"
+TS = "2025-09-08T21:54:24Z"
+GUID = "3f2504e0-4f89-11d3-9a0c-0305e82c3301"
+
+
+def _cmp(row, field, op, lit):
+    v = row.get(field)
+    if lit == "null":
+        return (v is None) == (op == "eq")
+    if v is None:
+        return False
+    a, b = (guid_sort_key(v), guid_sort_key(lit)) if field == PK else (v, int(lit) if field == "versionnumber" else lit)
+    return {"ge": a >= b, "gt": a > b, "lt": a < b, "le": a <= b, "eq": a == b, "ne": a != b}[op]
+
+
+def _matches(row, flt):
+    """Evaluate the $filter subset cursor_filter() produces against a row."""
+    if not flt:
+        return True
+    expr = re.sub(r"(\w+) (ge|gt|lt|le|eq|ne) ([^\s()]+)",
+                  lambda m: f"_cmp(row, {m[1]!r}, {m[2]!r}, {m[3]!r})", flt)
+    return eval(expr, {"_cmp": _cmp, "row": row})
+
+
+def test_filters_for_each_cursor_form():
+    assert cursor_filter(None, PK) is None
+    assert cursor_filter(TS, PK) == f"(modifiedon ne null) and (modifiedon gt {TS})"  # legacy
+    assert cursor_filter({"modifiedon": TS, "pk": GUID}, PK) == (
+        f"(modifiedon ne null) and ((modifiedon gt {TS}) or (modifiedon eq {TS} and {PK} gt {GUID}))")
+    assert cursor_filter({"modifiedon": TS, "pk": GUID}, None) == f"(modifiedon ne null) and (modifiedon gt {TS})"
+    assert cursor_filter({"versionnumber": "48211734"}, PK) == "versionnumber gt 48211734"
+    assert cursor_orderby("modifiedon", PK) == f"modifiedon asc,{PK} asc"
+    assert cursor_orderby("versionnumber", PK) == "versionnumber asc"
+
+
+def test_row_cursor_and_legacy_parse():
+    assert parse_cursor(TS) == {"modifiedon": TS} and parse_cursor("") is None
+    assert row_cursor({"modifiedon": TS, PK: GUID}, "modifiedon", PK) == {"modifiedon": TS, "pk": GUID}
+    assert row_cursor({"modifiedon": TS}, "modifiedon", PK) == {"modifiedon": TS}
+    assert row_cursor({"modifiedon": None, PK: GUID}, "modifiedon", PK) is None
+    assert row_cursor({"versionnumber": "7"}, "versionnumber", PK) == {"versionnumber": 7}
+    assert row_cursor({}, "versionnumber", PK) is None
+
+
+def test_sort_key_orders_guids_like_dataverse():
+    rnd = random.Random(5)
+    guids = [str(uuid.UUID(int=rnd.getrandbits(128))) for _ in range(20)]
+    cursors = [{"modifiedon": TS, "pk": g} for g in guids]
+    assert sorted(cursors, key=cursor_sort_key) == [{"modifiedon": TS, "pk": g}
+                                                     for g in sorted(guids, key=guid_sort_key)]
+    assert cursor_sort_key("2025-09-08T21:54:25Z") > cursor_sort_key({"modifiedon": TS, "pk": GUID})
+    assert cursor_sort_key({"versionnumber": 2}) > cursor_sort_key({"versionnumber": 1})
+
+
+def _read_in_pages(rows, field, pk, page, cursor=None):
+    """Poll `rows` page by page the way poll_table does: filter after the cursor, read one page, move on."""
+    order = {"modifiedon": lambda r: (r["modifiedon"] or "", guid_sort_key(r[PK])),  # nulls first
+             "versionnumber": lambda r: r["versionnumber"]}[field]
+    seen = []
+    while True:
+        batch = sorted((r for r in rows if _matches(r, cursor_filter(cursor, pk))), key=order)[:page]
+        if not batch:
+            return seen, cursor
+        seen += batch
+        cursor = row_cursor(batch[-1], field, pk)
+
+
+def test_paging_through_rows_sharing_a_timestamp_reads_each_once():
+    rnd = random.Random(11)
+    rows = [{PK: str(uuid.UUID(int=rnd.getrandbits(128))),
+             "modifiedon": TS if i < 50 else f"2025-09-0{i % 9 + 1}T00:00:00Z",
+             "versionnumber": 1000 + i} for i in range(80)]
+    rows.append({PK: str(uuid.UUID(int=rnd.getrandbits(128))), "modifiedon": None, "versionnumber": 2000})
+    for field in ("modifiedon", "versionnumber"):
+        seen, cursor = _read_in_pages(rows, field, PK, page=7)
+        assert sorted(r[PK] for r in seen) == sorted(r[PK] for r in rows)
+        assert _read_in_pages(rows, field, PK, page=7, cursor=cursor)[0] == []  # nothing new
+
+
+def test_legacy_cursor_resumes_after_its_timestamp():
+    rows = [{PK: GUID, "modifiedon": TS}, {PK: str(uuid.uuid4()), "modifiedon": "2025-09-09T00:00:00Z"}]
+    seen, cursor = _read_in_pages(rows, "modifiedon", PK, page=5, cursor=TS)
+    assert [r["modifiedon"] for r in seen] == ["2025-09-09T00:00:00Z"]
+    assert cursor == {"modifiedon": "2025-09-09T00:00:00Z", "pk": seen[0][PK]}  # upgraded to compound
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import time
+import pytest
+from fastapi.testclient import TestClient
+import apps.gateway.main as main
+import connectors.d365.ingest as ingest
+import connectors.d365.paginate as paginate
+from connectors.d365.paginate import paginate_table
+from connectors.d365.retry import DeadlineExceeded, attempt_timeout, deadline_in, remaining, within
+
+
+def test_remaining_and_attempt_timeout():
+    assert remaining(None) is None and attempt_timeout(None, 60) == 60
+    deadline = deadline_in(5)
+    assert 4.9 < remaining(deadline) <= 5
+    assert attempt_timeout(deadline, 60) <= 5 and attempt_timeout(deadline, 1) == 1
+    with pytest.raises(DeadlineExceeded):
+        remaining(time.monotonic() - 0.01)
+    with pytest.raises(DeadlineExceeded):
+        attempt_timeout(time.monotonic(), 60)
+
+
+def test_within_gives_up_at_the_deadline():
+    async def slow():
+        await asyncio.sleep(1)
+        return "late"
+
+    async def fast():
+        return "ok"
+
+    assert asyncio.run(within(None, fast())) == "ok"
+    assert asyncio.run(within(deadline_in(1), fast())) == "ok"
+    t0 = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(within(deadline_in(0.02), slow()))
+    assert time.monotonic() - t0 < 0.5
+
+
+def test_pages_stop_at_the_deadline_with_a_continuation(monkeypatch):
+    base = "https://org.crm.dynamics.com/api/data/v9.2/accounts"
+
+    async def get(path, params=None, extra_headers=None, deadline=None, raw=False, **kw):
+        n = int(path.rsplit("=", 1)[1]) if "page=" in path else 0
+        await asyncio.sleep(0.05)  # every page outlasts the budget
+        return json.dumps({"value": [{"id": n}], "@odata.nextLink": f"{base}?page={n + 1}"}).encode()
+
+    monkeypatch.setattr(paginate, "d365_get", get)
+    monkeypatch.setattr(paginate, "d365_get_absolute", get)
+
+    async def run():
+        state = {}
+        rows = [r["id"] async for r, _ in paginate_table("/accounts", deadline=deadline_in(0.02), state=state)]
+        return rows, state
+
+    rows, state = asyncio.run(run())
+    assert rows == [0]  # the page in flight is kept, no further page is requested
+    assert state["complete"] is False and state["continuation"] == f"{base}?page=1"
+
+
+@pytest.fixture
+def gateway():
+    return TestClient(main.app, raise_server_exceptions=False)
+
+
+def _request(headers=None):
+    return type("R", (), {"headers": headers or {}})()
+
+
+def test_request_deadline_sources(monkeypatch):
+    monkeypatch.setattr(main.settings, "hub_request_timeout", None)
+    assert main._request_deadline(_request()) is None
+    left = main._request_deadline(_request(), 3) - time.monotonic()
+    assert 3 - main.DEADLINE_MARGIN - 0.1 < left <= 3 - main.DEADLINE_MARGIN
+    left = main._request_deadline(_request({"X-Request-Timeout": "10"})) - time.monotonic()
+    assert left == pytest.approx(10 - main.DEADLINE_MARGIN, abs=0.1)
+    monkeypatch.setattr(main.settings, "hub_request_timeout", 20.0)
+    left = main._request_deadline(_request()) - time.monotonic()
+    assert left == pytest.approx(20 - main.DEADLINE_MARGIN, abs=0.1)
+
+
+def test_bad_timeout_header_is_a_400(gateway):
+    r = gateway.get("/tenants/t1/connectors/d365/tables/account/rows",
+                    headers={"X-Request-Timeout": "soon"})
+    assert r.status_code == 400
+
+
+def test_deadline_exceeded_maps_to_504(gateway, monkeypatch):
+    async def get_table(logical):
+        raise DeadlineExceeded("deadline exceeded")
+
+    monkeypatch.setattr(main, "get_table", get_table)
+    r = gateway.get("/tenants/t1/connectors/d365/tables/account/rows?timeout=1")
+    assert r.status_code == 504 and r.json()["error"] == "deadline_exceeded"
+
+
+def test_poll_out_of_time_returns_the_continuation(gateway, monkeypatch):
+    seen = {}
+    link = f"{main.current_profile().org_url}/api/data/v9.2/accounts?$skiptoken=2"
+
+    async def poll_tables(**kw):
+        seen.update(kw)
+        return {"account": {"count": 5, "complete": False, "continuation": link}}
+
+    monkeypatch.setattr(ingest, "poll_tables", poll_tables)
+    r = gateway.post("/tenants/t1/connectors/d365:poll?timeout=2", json={"tables": ["account"]})
+    body = r.json()
+    assert r.status_code == 200 and seen["deadline"] is not None
+    assert body["complete"] is False and body["continuation"] == {"account": link}
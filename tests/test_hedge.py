@@ -0,0 +1,100 @@
+import asyncio
+import time
+import httpx
+import pytest
+import connectors.d365.client as client
+from connectors.d365.hedge import MIN_SAMPLES, LatencyTracker, send_hedged
+
+
+def test_percentile_gate_needs_samples_and_respects_min_delay():
+    lat = LatencyTracker()
+    for i in range(MIN_SAMPLES - 1):
+        lat.record(0.01 * (i + 1))
+    assert lat.quantile(95) is None and lat.hedge_delay(95, 0.05) is None  # too few samples
+    lat.record(0.2)
+    assert lat.quantile(50) == pytest.approx(0.10)
+    assert lat.quantile(95) == pytest.approx(0.19)
+    assert lat.hedge_delay(95, 0.5) == 0.5
+
+
+def _sender(delays, log):
+    """send_once(is_hedge) sleeping delays[is_hedge]; delays[True] None = no free slot."""
+    async def send_once(is_hedge):
+        if delays[is_hedge] is None:
+            log.append(("skipped", is_hedge))
+            return None
+        try:
+            await asyncio.sleep(delays[is_hedge])
+        except asyncio.CancelledError:
+            log.append(("cancelled", is_hedge))
+            raise
+        return httpx.Response(200, text="hedge" if is_hedge else "primary")
+
+    return send_once
+
+
+def test_faster_hedge_wins_and_primary_is_cancelled():
+    log = []
+
+    async def run():
+        r = await send_hedged(_sender({False: 1.0, True: 0.01}, log), 0.02)
+        await asyncio.sleep(0)
+        return r
+
+    assert asyncio.run(run()).text == "hedge"
+    assert log == [("cancelled", False)]
+
+
+def test_no_hedge_before_the_delay_or_without_a_free_slot():
+    log = []
+    assert asyncio.run(send_hedged(_sender({False: 0.01, True: 0.0}, log), 0.5)).text == "primary"
+    assert asyncio.run(send_hedged(_sender({False: 0.05, True: None}, log), 0.01)).text == "primary"
+    assert asyncio.run(send_hedged(_sender({False: 0.01, True: 0.0}, log), None)).text == "primary"
+    assert log == [("skipped", True)]
+
+
+def test_failed_primary_falls_back_to_the_hedge():
+    async def send_once(is_hedge):
+        if not is_hedge:
+            await asyncio.sleep(0.03)
+            raise httpx.ConnectError("boom")
+        await asyncio.sleep(0.05)
+        return httpx.Response(200)
+
+    assert asyncio.run(send_hedged(send_once, 0.01)).status_code == 200
+
+
+def test_hedged_get_through_the_client(monkeypatch):
+    seen = []
+
+    async def handler(request):
+        n = len(seen)
+        seen.append(n)
+        try:
+            await asyncio.sleep(1.0 if n == 0 else 0)  # the first attempt is stuck
+        except asyncio.CancelledError:
+            seen.append("cancelled")
+            raise
+        return httpx.Response(200, json={"attempt": n})
+
+    async def token(profile=None):
+        return "t"
+
+    monkeypatch.setattr(client, "get_dataverse_token", token)
+    monkeypatch.setattr(client, "get_http_client",
+                        lambda url: httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    async def run():
+        url = client._api_base()
+        lat, gov = client.get_latency_tracker(url), client.get_governor(url)
+        for _ in range(MIN_SAMPLES):
+            lat.record(0.01)
+        t0 = time.monotonic()
+        body = await client._request("GET", "/accounts", hedge=True)
+        elapsed = time.monotonic() - t0
+        await asyncio.sleep(0)
+        return body, elapsed, gov.in_flight
+
+    body, elapsed, in_flight = asyncio.run(run())
+    assert body == {"attempt": 1} and elapsed < 0.5
+    assert "cancelled" in seen and in_flight == 0  # the loser gave its slot back
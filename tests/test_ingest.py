@@ -0,0 +1,189 @@
+import asyncio
+import json
+import re
+import httpx
+import pytest
+import connectors.d365.ingest as ingest
+import connectors.d365.paginate as paginate
+from common.cursors import get_cursor, set_cursor
+from common.rowstore import iter_rows
+
+META = {"accounts": {"set": "accounts", "pk": "accountid"}}
+
+
+@pytest.fixture
+def runtime(tmp_path, monkeypatch):
+    """Cursors and stored rows under a fresh .runtime/."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / ".runtime").mkdir()
+    return tmp_path
+
+
+@pytest.fixture
+def batched(monkeypatch):
+    """poll_tables() with metadata and first pages from a $batch; records poll_table() calls."""
+    calls = []
+
+    async def tables_meta(tables, deadline=None):
+        return {t: META[t] for t in tables}
+
+    async def batch(reqs, deadline=None):
+        return [{"status": 200, "body": {"value": [], "filter": r["params"].get("$filter")}} for r in reqs]
+
+    async def poll_table(**kw):
+        calls.append(kw)
+        return {"count": 0, "complete": True, "continuation": None}
+
+    monkeypatch.setattr(ingest, "get_tables_meta", tables_meta)
+    monkeypatch.setattr(ingest, "d365_batch", batch)
+    monkeypatch.setattr(ingest, "poll_table", poll_table)
+    return calls
+
+
+def test_batched_first_page_is_used_when_the_cursor_did_not_move(runtime, batched):
+    asyncio.run(ingest.poll_tables("t1", ["accounts"]))
+    assert batched[0]["first_page"] == {"value": [], "filter": None}
+
+
+def test_batched_first_page_is_dropped_when_another_poll_moved_the_cursor(runtime, batched):
+    async def run():
+        lock = ingest.table_lock("t1", "accounts")
+        await lock.acquire()  # the scheduler is polling the table
+        poll = asyncio.ensure_future(ingest.poll_tables("t1", ["accounts"]))
+        while not lock._waiters:
+            await asyncio.sleep(0)
+        set_cursor("t1", "accounts", {"modifiedon": "2024-01-02T00:00:00Z", "accountid": "a"})
+        lock.release()
+        return await poll
+
+    asyncio.run(run())
+    assert get_cursor("t1", "accounts")["modifiedon"] == "2024-01-02T00:00:00Z"
+    assert batched[0]["first_page"] is None  # fetched from the new cursor instead
+
+
+class _ChangeTrackingOrg:
+    """accounts with change tracking: three initial pages, then a delta with one update and one delete."""
+    BASE = "https://org.crm.dynamics.com/api/data/v9.2/accounts"
+    DELTA = BASE + "?$deltatoken=1"
+
+    def __init__(self):
+        self.requested = []
+        self.expired = False
+
+    async def get(self, path, params=None, extra_headers=None, deadline=None, raw=False, **kw):
+        self.requested.append(path)
+        assert "odata.track-changes" in extra_headers["Prefer"]
+        if path == self.DELTA:
+            if self.expired:
+                raise httpx.HTTPStatusError("410", request=httpx.Request("GET", path),
+                                            response=httpx.Response(410))
+            body = {"value": [{"accountid": "a1", "name": "changed"},
+                              {"@odata.context": f"{self.BASE}/$metadata#accounts/$deletedEntity",
+                               "id": "a2", "reason": "deleted"}],
+                    "@odata.deltaLink": self.BASE + "?$deltatoken=2"}
+        else:
+            n = int(path.rsplit("=", 1)[1]) if "page=" in path else 0
+            body = {"value": [{"accountid": f"a{2 * n}"}, {"accountid": f"a{2 * n + 1}"}]}
+            if n < 2:
+                body["@odata.nextLink"] = f"{self.BASE}?page={n + 1}"
+            else:
+                body["@odata.deltaLink"] = self.DELTA
+        return json.dumps(body).encode()
+
+
+@pytest.fixture
+def tracked(monkeypatch):
+    org = _ChangeTrackingOrg()
+    monkeypatch.setattr(paginate, "d365_get", org.get)
+    monkeypatch.setattr(paginate, "d365_get_absolute", org.get)
+    return org
+
+
+def _delta_poll(tenant, limit_pages=2):
+    return asyncio.run(ingest.poll_table(tenant, "account", limit_pages=limit_pages, mode="delta",
+                                         meta={"set": "accounts", "pk": "accountid"}))
+
+
+def test_first_delta_read_continues_without_the_continuation(runtime, tracked):
+    first = _delta_poll("delta-t1")
+    assert first["count"] == 4 and not first["complete"]
+    assert get_cursor("delta-t1", "account@delta") == first["continuation"]  # progress kept
+    second = _delta_poll("delta-t1")  # the caller did not send the continuation back
+    assert second["count"] == 2 and second["complete"]
+    assert tracked.requested == ["/accounts", f"{tracked.BASE}?page=1", f"{tracked.BASE}?page=2"]
+    assert get_cursor("delta-t1", "account@delta") == tracked.DELTA
+
+    third = _delta_poll("delta-t1")
+    assert third["count"] == 2 and third["deleted"] == 1
+    assert get_cursor("delta-t1", "account@delta") == tracked.BASE + "?$deltatoken=2"
+    rows = list(iter_rows("delta-t1", "account"))
+    assert [r["accountid"] for r in rows] == ["a0", "a1", "a2", "a3", "a4", "a5", "a1", "a2"]
+    assert rows[-1] == {"accountid": "a2", "@deleted": True, "@reason": "deleted"}
+
+
+def test_expired_delta_link_starts_a_full_read(runtime, tracked):
+    set_cursor("delta-t2", "account@delta", tracked.DELTA)
+    tracked.expired = True
+    res = _delta_poll("delta-t2", limit_pages=10)
+    assert res["count"] == 6 and res["complete"]
+    assert tracked.requested[:2] == [tracked.DELTA, "/accounts"]
+
+
+def test_partitioned_full_sync_resumes_each_window(runtime, monkeypatch):
+    base = "https://org.crm.dynamics.com/api/data/v9.2/accounts"
+    plans, requested = [], []
+
+    async def plan(set_name, partitions, by="auto", pk=None, deadline=None, **kw):
+        plans.append(partitions)
+        return "modifiedon", ["w0", "w1"]
+
+    async def get(path, params=None, extra_headers=None, deadline=None, raw=False, **kw):
+        if path == "/accounts":
+            w, n = int(params["$filter"][-1]), 0
+        else:
+            w, n = (int(v) for v in re.findall(r"=(\d+)", path))
+        requested.append((w, n))
+        body = {"value": [{"accountid": f"00000000-0000-0000-000{w}-0000000000{n}{i}", "modifiedon": f"2025-01-0{1 + n}T0{w}:00:0{i}Z"}
+                          for i in range(2)]}
+        if n < 2:
+            body["@odata.nextLink"] = f"{base}?w={w}&page={n + 1}"
+        return json.dumps(body).encode()
+
+    monkeypatch.setattr(ingest, "plan_partitions", plan)
+    monkeypatch.setattr(paginate, "d365_get", get)
+    monkeypatch.setattr(paginate, "d365_get_absolute", get)
+
+    def run(resume):
+        return asyncio.run(ingest.poll_table("part-t", "account", limit_pages=1, force_full=True, partitions=2,
+                                             meta={"set": "accounts", "pk": "accountid"}, resume=resume))
+
+    results = [run(False), run(True), run(True)]
+    assert [r["complete"] for r in results] == [False, False, True]
+    assert [r["resumed"] for r in results] == [False, True, True] and plans == [2]
+    assert [r["partitions_left"] for r in results] == [2, 2, 0]
+    assert sorted(requested) == [(w, n) for w in range(2) for n in range(3)]  # every page once
+    ids = [r["accountid"] for r in iter_rows("part-t", "account")]
+    assert len(ids) == 12 and len(set(ids)) == 12
+    assert get_cursor("part-t", "account") == {"modifiedon": "2025-01-03T01:00:01Z",
+                                                  "pk": "00000000-0000-0000-0001-000000000021"}
+    assert get_cursor("part-t", "account@partitions") is None
+
+
+def test_force_full_starts_over_unless_asked_to_resume(runtime, monkeypatch):
+    filters = []
+
+    async def get(path, params=None, extra_headers=None, deadline=None, raw=False, **kw):
+        filters.append(params.get("$filter"))
+        return json.dumps({"value": []}).encode()
+
+    monkeypatch.setattr(paginate, "d365_get", get)
+    checkpoint = {"modifiedon": "2025-01-02T00:00:00Z", "pk": "00000000-0000-0000-0000-000000000001"}
+
+    def run(resume):
+        set_cursor("full-t", "account@checkpoint", checkpoint)
+        return asyncio.run(ingest.poll_table("full-t", "account", force_full=True, partitions=1, resume=resume,
+                                             meta={"set": "accounts", "pk": "accountid"}))
+
+    assert run(False)["resumed"] is False and filters[-1] is None  # read from the start
+    assert get_cursor("full-t", "account@checkpoint") is None
+    assert run(True)["resumed"] is True and "2025-01-02T00:00:00Z" in filters[-1]
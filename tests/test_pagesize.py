@@ -0,0 +1,67 @@
+import json
+import pytest
+import connectors.d365.pagesize as pagesize
+from common.settings import settings
+from connectors.d365.pagesize import observe, page_size
+
+
+@pytest.fixture
+def auto(tmp_path, monkeypatch):
+    """Auto page size on, bounds 50..5000, 4 MB / 5 s targets, sizes stored under tmp_path."""
+    store = tmp_path / "pagesizes.json"
+    monkeypatch.setattr(pagesize, "_STORE", store)
+    monkeypatch.setattr(pagesize, "_sizes", None)
+    for name, value in {"d365_page_size_auto": True, "d365_page_size": 200, "d365_page_size_min": 50,
+                        "d365_page_size_max": 5000, "d365_page_target_bytes": 4_000_000,
+                        "d365_page_target_seconds": 5.0}.items():
+        monkeypatch.setattr(settings, name, value)
+    return store
+
+
+def _fetched(rows, bytes_per_row, seconds_per_row):
+    return {"pages": 1, "rows": rows, "bytes": rows * bytes_per_row, "seconds": rows * seconds_per_row}
+
+
+def test_narrow_fast_table_grows_at_most_double_per_poll(auto):
+    assert page_size("t", "account") == 200
+    assert observe("t", "account", 200, _fetched(200, 500, 0.001)) == 400
+    assert page_size("t", "account") == 400
+    size = 400
+    for _ in range(10):
+        size = observe("t", "account", size, _fetched(size, 500, 0.001))
+    assert size == 5000  # capped by D365_PAGE_SIZE_MAX
+
+
+def test_wide_table_shrinks_to_the_byte_target(auto):
+    size = 2000
+    for _ in range(5):
+        size = observe("t", "email", size, _fetched(size, 40_000, 0.001))
+    assert size == 100  # 4 MB / 40 KB per row
+
+
+def test_slow_rows_shrink_to_the_time_target_and_the_minimum(auto):
+    assert observe("t", "slow", 200, _fetched(200, 100, 0.05)) == 100
+    assert observe("t", "slow", 100, _fetched(100, 100, 0.5)) == 50  # halved, not below the min
+
+
+def test_throttled_partial_and_timed_out_polls(auto):
+    assert observe("t", "a", 200, _fetched(200, 500, 0.001), throttled=True) == 200  # no growth
+    assert observe("t", "b", 200, _fetched(120, 500, 0.001)) == 200  # table fits in one page
+    assert observe("t", "c", 200, None, timed_out=True) == 100
+    assert observe("t", "d", 200, None) == 200  # nothing read, nothing learned
+
+
+def test_sizes_persist_and_are_clamped_to_new_bounds(auto, monkeypatch):
+    observe("t", "account", 200, _fetched(200, 500, 0.001))
+    assert json.loads(auto.read_text())["t:account"]["size"] == 400
+    monkeypatch.setattr(pagesize, "_sizes", None)  # a restart
+    assert page_size("t", "account") == 400
+    monkeypatch.setattr(settings, "d365_page_size_max", 300)
+    assert page_size("t", "account") == 300
+
+
+def test_off_uses_the_configured_size(auto, monkeypatch):
+    observe("t", "account", 200, _fetched(200, 500, 0.001))
+    monkeypatch.setattr(settings, "d365_page_size_auto", False)
+    assert page_size("t", "account") == 200
+    assert observe("t", "account", 200, _fetched(200, 500, 0.001)) is None
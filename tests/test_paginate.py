@@ -0,0 +1,55 @@
+import asyncio
+import json
+import pytest
+import connectors.d365.paginate as paginate
+from connectors.d365.paginate import paginate_table
+
+BASE = "https://org.crm.dynamics.com/api/data/v9.2/accounts"
+
+
+@pytest.fixture
+def org(monkeypatch):
+    """Five pages of two rows; records every page requested."""
+    requested = []
+
+    def page(n):
+        body = {"value": [{"id": 2 * n}, {"id": 2 * n + 1}]}
+        if n < 4:
+            body["@odata.nextLink"] = f"{BASE}?page={n + 1}"
+        return json.dumps(body).encode()
+
+    async def get(path, params=None, extra_headers=None, deadline=None, raw=False, **kw):
+        n = int(path.rsplit("=", 1)[1]) if "page=" in path else 0
+        requested.append(n)
+        await asyncio.sleep(0.001)
+        return page(n)
+
+    monkeypatch.setattr(paginate, "d365_get", get)
+    monkeypatch.setattr(paginate, "d365_get_absolute", get)
+    return requested
+
+
+@pytest.mark.parametrize("prefetch", [0, 1, 3])
+def test_max_pages_stops_requests_and_returns_continuation(org, prefetch):
+    async def run():
+        state = {}
+        rows = [r["id"] async for r, _ in paginate_table("/accounts", page_size=2, prefetch=prefetch,
+                                                         max_pages=2, state=state)]
+        return rows, state
+
+    rows, state = asyncio.run(run())
+    assert rows == [0, 1, 2, 3]
+    assert org == [0, 1]  # no page fetched ahead past the limit
+    assert state["complete"] is False and state["continuation"] == f"{BASE}?page=2"
+    assert state["fetched"]["pages"] == 2 and state["fetched"]["rows"] == 4
+
+
+def test_reads_to_the_end_without_limit(org):
+    async def run():
+        state = {}
+        rows = [r["id"] async for r, _ in paginate_table("/accounts", page_size=2, prefetch=1, state=state)]
+        return rows, state
+
+    rows, state = asyncio.run(run())
+    assert rows == list(range(10)) and org == [0, 1, 2, 3, 4]
+    assert state["complete"] is True and state["continuation"] is None
@@ -0,0 +1,141 @@
+import asyncio
+import random
+import re
+import uuid
+from datetime import datetime, timedelta
+import pytest
+import connectors.d365.partition as partition
+from connectors.d365.partition import (guid_from_sort_key, guid_sort_key, plan_partitions,
+                                       plan_pk_ranges, plan_time_windows)
+
+# How SQL Server orders uniqueidentifier, smallest first: the last group is
+# the most significant, the first three groups compare byte-reversed.
+SQL_SERVER_ORDER = [
+    "01000000-0000-0000-0000-000000000000",
+    "10000000-0000-0000-0000-000000000000",
+    "00010000-0000-0000-0000-000000000000",
+    "00100000-0000-0000-0000-000000000000",
+    "00000100-0000-0000-0000-000000000000",
+    "00001000-0000-0000-0000-000000000000",
+    "00000001-0000-0000-0000-000000000000",
+    "00000010-0000-0000-0000-000000000000",
+    "00000000-0100-0000-0000-000000000000",
+    "00000000-1000-0000-0000-000000000000",
+    "00000000-0001-0000-0000-000000000000",
+    "00000000-0010-0000-0000-000000000000",
+    "00000000-0000-0100-0000-000000000000",
+    "00000000-0000-1000-0000-000000000000",
+    "00000000-0000-0001-0000-000000000000",
+    "00000000-0000-0010-0000-000000000000",
+    "00000000-0000-0000-0001-000000000000",
+    "00000000-0000-0000-0010-000000000000",
+    "00000000-0000-0000-0100-000000000000",
+    "00000000-0000-0000-1000-000000000000",
+    "00000000-0000-0000-0000-000000000001",
+    "00000000-0000-0000-0000-000000000010",
+    "00000000-0000-0000-0000-000000000100",
+    "00000000-0000-0000-0000-000000001000",
+    "00000000-0000-0000-0000-000000010000",
+    "00000000-0000-0000-0000-000000100000",
+    "00000000-0000-0000-0000-000001000000",
+    "00000000-0000-0000-0000-000010000000",
+    "00000000-0000-0000-0000-000100000000",
+    "00000000-0000-0000-0000-001000000000",
+    "00000000-0000-0000-0000-010000000000",
+    "00000000-0000-0000-0000-100000000000",
+]
+
+
+def test_guid_sort_key_follows_sql_server_order():
+    shuffled = random.Random(7).sample(SQL_SERVER_ORDER, len(SQL_SERVER_ORDER))
+    assert sorted(shuffled, key=guid_sort_key) == SQL_SERVER_ORDER
+
+
+def test_guid_sort_key_round_trips():
+    for g in SQL_SERVER_ORDER + [str(uuid.UUID(int=random.Random(i).getrandbits(128))) for i in range(50)]:
+        assert guid_from_sort_key(guid_sort_key(g)) == g
+
+
+PK = "accountid"
+
+
+def _rows(n, same_ts=False):
+    rnd = random.Random(3)
+    base = datetime(2024, 1, 1)
+    rows = []
+    for i in range(n):
+        ts = base if same_ts else base + timedelta(seconds=rnd.randrange(86400 * 30))
+        rows.append({PK: str(uuid.UUID(int=rnd.getrandbits(128))),
+                     "modifiedon": ts.strftime("%Y-%m-%dT%H:%M:%SZ")})
+    rows.append({PK: str(uuid.UUID(int=rnd.getrandbits(128))), "modifiedon": None})
+    return rows
+
+
+def _matches(row, flt):
+    for field, op, lit in re.findall(r"(\w+) (ge|gt|lt|le|eq|ne) ([^\s()]+)", flt):
+        v = row.get(field)
+        if lit == "null":
+            if (v is None) != (op == "eq"):
+                return False
+            continue
+        if v is None:
+            return False
+        a, b = (guid_sort_key(v), guid_sort_key(lit)) if field == PK else (v, lit)
+        if not {"ge": a >= b, "gt": a > b, "lt": a < b, "le": a <= b, "eq": a == b, "ne": a != b}[op]:
+            return False
+    return True
+
+
+@pytest.fixture
+def table(monkeypatch):
+    """An in-memory entity set answering the planner's $filter / $orderby / $top / $count GETs."""
+    data = {"rows": []}
+
+    async def get(path, params=None, deadline=None, **kw):
+        rows = [r for r in data["rows"] if _matches(r, params.get("$filter", ""))]
+        field, direction = params["$orderby"].split() if "$orderby" in params else (None, "asc")
+        if field:
+            key = guid_sort_key if field == PK else (lambda v: v)
+            rows.sort(key=lambda r: key(r[field]), reverse=direction == "desc")
+        j = {"value": rows[:int(params.get("$top", len(rows)))]}
+        if params.get("$count") == "true":
+            j["@odata.count"] = len(rows)
+        return j
+
+    monkeypatch.setattr(partition, "d365_get", get)
+    return data
+
+
+def _assert_disjoint_cover(rows, filters):
+    for row in rows:
+        hits = [f for f in filters if _matches(row, f)]
+        assert len(hits) == 1, (row, hits)
+
+
+def test_time_windows_cover_every_row_once(table):
+    table["rows"] = rows = _rows(300)
+    filters = asyncio.run(plan_time_windows("accounts", "modifiedon", 6))
+    assert len(filters) == 7 and filters[-1] == "modifiedon eq null"
+    assert " le " in filters[-2] and all(" lt " in f for f in filters[:-2])  # the last window keeps the max
+    _assert_disjoint_cover(rows, filters)
+
+
+def test_pk_ranges_cover_every_row_once_including_the_edges(table):
+    table["rows"] = rows = _rows(300)
+    filters = asyncio.run(plan_pk_ranges("accounts", PK, 5))
+    assert len(filters) == 5
+    _assert_disjoint_cover(rows, filters)
+    ordered = sorted(rows, key=lambda r: guid_sort_key(r[PK]))
+    assert _matches(ordered[0], filters[0]) and _matches(ordered[-1], filters[-1])
+
+
+def test_auto_falls_back_to_pk_when_timestamps_are_clustered(table):
+    table["rows"] = rows = _rows(200, same_ts=True)
+    field, filters = asyncio.run(plan_partitions("accounts", 4, by="auto", pk=PK))
+    assert field == PK and len(filters) == 4
+    _assert_disjoint_cover(rows, filters)  # pk ranges also hold rows without modifiedon
+
+
+def test_empty_table_plans_one_partition(table):
+    assert asyncio.run(plan_time_windows("accounts", "modifiedon", 4)) == ["modifiedon eq null"]
+    assert asyncio.run(plan_pk_ranges("accounts", PK, 4)) == [f"{PK} ne null"]
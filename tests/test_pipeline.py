@@ -0,0 +1,96 @@
+import asyncio
+import json
+import random
+import pytest
+import connectors.d365.paginate as paginate
+from connectors.d365.ingest import poll_table
+from connectors.d365.pipeline import Page, run_pipeline
+from common.cursors import get_cursor, set_cursor
+
+
+async def _source(n, rows_per_page=3, log=None):
+    for seq in range(n):
+        if log is not None:
+            log.append(seq)
+        yield Page(seq, [seq * rows_per_page + i for i in range(rows_per_page)], pos=seq)
+
+
+def test_sinks_see_pages_in_order_while_transforms_overlap():
+    rnd = random.Random(1)
+    running = {"now": 0, "max": 0}
+    seen = {"a": [], "b": []}
+    done = []
+
+    async def transform(rows):
+        running["now"] += 1
+        running["max"] = max(running["max"], running["now"])
+        await asyncio.sleep(rnd.random() * 0.01)  # later pages often finish first
+        running["now"] -= 1
+        return [r * 10 for r in rows]
+
+    def sink(name):
+        async def put(page):
+            await asyncio.sleep(rnd.random() * 0.002)
+            seen[name].append((page.seq, page.items))
+        return put
+
+    async def page_done(page):
+        done.append(page.pos)
+
+    metrics = asyncio.run(run_pipeline(_source(20), {"a": sink("a"), "b": sink("b")}, transform=transform,
+                                       transform_workers=4, on_page_done=page_done))
+    expected = [(s, [(s * 3 + i) * 10 for i in range(3)]) for s in range(20)]
+    assert seen["a"] == expected and seen["b"] == expected
+    assert done == list(range(20))
+    assert running["max"] > 1  # transforms did run concurrently
+    assert metrics["stages"]["transform"]["pages"] == 20 and metrics["stages"]["sink:a"]["rows"] == 60
+
+
+def test_failing_stage_cancels_the_run():
+    fetched, done = [], []
+
+    async def sink(page):
+        if page.seq == 2:
+            raise RuntimeError("disk full")
+
+    async def page_done(page):
+        done.append(page.seq)
+
+    with pytest.raises(RuntimeError, match="disk full"):
+        asyncio.run(run_pipeline(_source(1000, log=fetched), {"rows": sink}, queue_size=2,
+                                 on_page_done=page_done))
+    assert done == [0, 1]
+    assert len(fetched) < 20  # fetching stopped with the failure, bounded by the queues
+
+
+@pytest.fixture
+def runtime(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / ".runtime").mkdir()
+    return tmp_path
+
+
+def test_sink_error_leaves_the_cursor_alone(runtime, monkeypatch):
+    base = "https://org.crm.dynamics.com/api/data/v9.2/accounts"
+
+    async def get(path, params=None, extra_headers=None, deadline=None, raw=False, **kw):
+        n = int(path.rsplit("=", 1)[1]) if "page=" in path else 0
+        body = {"value": [{"accountid": f"00000000-0000-0000-0000-00000000000{n}",
+                           "modifiedon": f"2025-01-0{n + 1}T00:00:00Z"}]}
+        if n < 4:
+            body["@odata.nextLink"] = f"{base}?page={n + 1}"
+        return json.dumps(body).encode()
+
+    monkeypatch.setattr(paginate, "d365_get", get)
+    monkeypatch.setattr(paginate, "d365_get_absolute", get)
+    stored = {"modifiedon": "2024-12-31T00:00:00Z", "pk": "00000000-0000-0000-0000-000000000009"}
+    set_cursor("pipeline-t", "account", stored)
+
+    async def export(page):
+        if page.seq == 3:
+            raise RuntimeError("export failed")
+
+    with pytest.raises(RuntimeError, match="export failed"):
+        asyncio.run(poll_table("pipeline-t", "account", limit_pages=10,
+                               meta={"set": "accounts", "pk": "accountid"}, sinks={"export": export}))
+    assert get_cursor("pipeline-t", "account") == stored
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import os
+import httpx
+import pytest
+import common.profiles as profiles
+import connectors.d365.client as client
+from common.auth import get_token_provider
+from common.profiles import OrgRegistry, get_profile, use_profile
+from connectors.d365.breaker import get_breaker
+from connectors.d365.throttle import get_governor
+
+ORG = "https://contoso.crm.dynamics.com"
+
+
+@pytest.fixture
+def profiles_file(tmp_path, monkeypatch):
+    path = tmp_path / "profiles.json"
+    monkeypatch.setattr(profiles, "PROFILES_PATH", path)
+    monkeypatch.setattr(profiles, "_loaded", {"mtime": None, "profiles": {}, "checked": None, "generation": 0})
+    monkeypatch.setattr(profiles, "PROFILES_CHECK_EVERY", 0.0)
+
+    def write(limits=None, secret="s1"):
+        path.write_text(json.dumps({"contoso": {
+            "org_url": ORG, "tenant_id": "tid", "client_id": "cid",
+            "client_secret": secret, "limits": limits or {}}}))
+        st = path.stat()
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))  # a new mtime every write
+
+    return write
+
+
+def test_edited_limits_rebuild_breaker_and_governor(profiles_file):
+    profiles_file({"d365_breaker_open_seconds": 30, "d365_throttle_max": 16})
+    with use_profile("contoso"):
+        br, gov = get_breaker(ORG), get_governor(ORG)
+        assert get_breaker(ORG) is br and get_governor(ORG) is gov
+        assert br.open_seconds == 30 and gov.max_limit == 16
+    profiles_file({"d365_breaker_open_seconds": 5, "d365_throttle_max": 4})
+    with use_profile("contoso"):
+        assert get_breaker(ORG) is not br and get_breaker(ORG).open_seconds == 5
+        assert get_governor(ORG).max_limit == 4
+
+
+def test_rotated_secret_rebuilds_token_provider(profiles_file):
+    profiles_file(secret="old")
+    prov = get_token_provider(get_profile("contoso"))
+    assert get_token_provider(get_profile("contoso")) is prov
+    profiles_file(secret="new")
+    new = get_token_provider(get_profile("contoso"))
+    assert new is not prov and new.client_secret == "new"
+
+
+def test_org_registry_hands_replaced_objects_to_on_replace(profiles_file):
+    profiles_file({"d365_throttle_max": 8})
+    replaced = []
+    reg = OrgRegistry(lambda url: object(), depends_on=("d365_throttle_max",), on_replace=replaced.append)
+    with use_profile("contoso"):
+        first = reg.get(ORG + "/api/data/v9.2/accounts")
+        assert reg.get(ORG) is first  # one per host
+    profiles_file({"d365_throttle_max": 9})
+    with use_profile("contoso"):
+        assert reg.get(ORG) is not first
+    assert replaced == [first]
+
+
+def test_http_timeout_of_the_profile_caps_each_attempt_and_token_request(profiles_file, monkeypatch):
+    profiles_file({"d365_http_timeout": 7})
+    timeouts = []
+
+    async def handler(request):
+        timeouts.append(request.extensions["timeout"]["read"])
+        return httpx.Response(200, json={"value": []})
+
+    async def token(profile=None):
+        return "t"
+
+    monkeypatch.setattr(client, "get_dataverse_token", token)
+    monkeypatch.setattr(client, "get_http_client",
+                        lambda url: httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    with use_profile("contoso"):
+        asyncio.run(client.d365_get("/accounts"))
+    assert timeouts == [7]
+    assert get_token_provider(get_profile("contoso")).timeout == 7
+
+
+def test_lookups_between_checks_skip_the_file_and_settings(profiles_file, monkeypatch):
+    now = {"t": 1000.0}
+    monkeypatch.setattr(profiles.time, "monotonic", lambda: now["t"])
+    monkeypatch.setattr(profiles, "PROFILES_CHECK_EVERY", 1.0)
+    profiles_file({"d365_throttle_max": 8})
+    reads = []
+    real_org_setting = profiles.org_setting
+    monkeypatch.setattr(profiles, "org_setting", lambda url, name: reads.append(name) or real_org_setting(url, name))
+    reg = OrgRegistry(lambda url: object(), depends_on=("d365_throttle_max",))
+    with use_profile("contoso"):
+        first = reg.get(ORG)
+        assert [reg.get(ORG) for _ in range(10)] == [first] * 10
+        assert reads == ["d365_throttle_max"]  # settings read once, not per lookup
+        profiles_file({"d365_throttle_max": 9})
+        assert reg.get(ORG) is first  # not looked at again yet
+        now["t"] += 1.0
+    with use_profile("contoso"):
+        assert reg.get(ORG) is not first
@@ -0,0 +1,113 @@
+import asyncio
+import time
+import httpx
+import pytest
+from connectors.d365.retry import RetryBudget, RetryPolicy, deadline_in, send_with_retries
+from connectors.d365.throttle import ThrottleGovernor
+
+NO_WAIT = RetryPolicy(max_attempts=4, base_delay=0.0, max_delay=0.0)
+
+
+def _responder(*outcomes, governor=None):
+    """send(attempt) returning / raising `outcomes` in turn, through `governor` if given."""
+    calls = []
+
+    async def send(attempt):
+        calls.append(attempt)
+        out = outcomes[min(attempt, len(outcomes)) - 1]
+        if isinstance(out, Exception):
+            raise out
+        if governor is None:
+            return out
+        async with governor.slot():
+            governor.observe(out.status_code, out.headers)
+            return out
+
+    return send, calls
+
+
+def test_429_pauses_the_governor_and_retries_after_retry_after():
+    gov = ThrottleGovernor(initial=4)
+    send, calls = _responder(httpx.Response(429, headers={"Retry-After": "0.2"}), httpx.Response(200), governor=gov)
+
+    async def run():
+        t0 = time.monotonic()
+        r = await send_with_retries(send, method="GET", budget=RetryBudget(), policy=NO_WAIT)
+        return r, time.monotonic() - t0
+
+    r, elapsed = asyncio.run(run())
+    assert r.status_code == 200 and calls == [1, 2]
+    assert elapsed >= 0.19  # the retry waited for the org-wide pause, not a sleep of its own
+    assert gov.throttled == 1 and gov.limit == 4 / 2 + 1 / 2  # halved by the 429, then +1/limit
+
+
+def test_429_is_retried_even_for_post():
+    send, calls = _responder(httpx.Response(429), httpx.Response(204))
+    r = asyncio.run(send_with_retries(send, method="POST", budget=RetryBudget(), policy=NO_WAIT))
+    assert r.status_code == 204 and calls == [1, 2]
+
+
+def test_5xx_is_not_retried_for_post():
+    send, calls = _responder(httpx.Response(503), httpx.Response(200))
+    r = asyncio.run(send_with_retries(send, method="POST", budget=RetryBudget(), policy=NO_WAIT))
+    assert r.status_code == 503 and calls == [1]
+
+
+def test_attempts_are_capped():
+    send, calls = _responder(httpx.Response(503))
+    r = asyncio.run(send_with_retries(send, method="GET", budget=RetryBudget(),
+                                      policy=RetryPolicy(max_attempts=3, base_delay=0.0)))
+    assert r.status_code == 503 and calls == [1, 2, 3]
+
+
+def test_empty_budget_stops_retries():
+    budget = RetryBudget(ratio=0.0, reserve=1.0)  # one retry, never refilled
+    send, calls = _responder(httpx.Response(503))
+    r = asyncio.run(send_with_retries(send, method="GET", budget=budget, policy=NO_WAIT))
+    assert r.status_code == 503 and calls == [1, 2]
+    send, calls = _responder(httpx.Response(503), httpx.Response(200))
+    r = asyncio.run(send_with_retries(send, method="GET", budget=budget, policy=NO_WAIT))
+    assert r.status_code == 503 and calls == [1]
+
+
+def test_budget_refills_with_requests_up_to_reserve():
+    budget = RetryBudget(ratio=0.5, reserve=2.0)
+    assert budget.try_spend() and budget.try_spend() and not budget.try_spend()
+    budget.record_request()
+    assert not budget.try_spend()
+    for _ in range(10):
+        budget.record_request()
+    assert budget.tokens == 2.0
+
+
+def test_retry_that_cannot_finish_before_the_deadline_is_skipped():
+    send, calls = _responder(httpx.Response(503, headers={"Retry-After": "5"}), httpx.Response(200))
+
+    async def run():
+        t0 = time.monotonic()
+        r = await send_with_retries(send, method="GET", budget=RetryBudget(), policy=NO_WAIT,
+                                    deadline=deadline_in(1.0))
+        return r, time.monotonic() - t0
+
+    r, elapsed = asyncio.run(run())
+    assert r.status_code == 503 and calls == [1] and elapsed < 0.5
+
+
+def test_transport_errors():
+    # never sent: safe to retry any method
+    send, calls = _responder(httpx.ConnectError("refused"), httpx.Response(201))
+    r = asyncio.run(send_with_retries(send, method="POST", budget=RetryBudget(), policy=NO_WAIT))
+    assert r.status_code == 201 and calls == [1, 2]
+    # may have run upstream: only idempotent methods retry
+    send, calls = _responder(httpx.ReadTimeout("slow"), httpx.Response(201))
+    with pytest.raises(httpx.ReadTimeout):
+        asyncio.run(send_with_retries(send, method="POST", budget=RetryBudget(), policy=NO_WAIT))
+    send, calls = _responder(httpx.ReadTimeout("slow"), httpx.Response(200))
+    r = asyncio.run(send_with_retries(send, method="GET", budget=RetryBudget(), policy=NO_WAIT))
+    assert r.status_code == 200 and calls == [1, 2]
+
+
+def test_backoff_is_capped_and_respects_retry_after():
+    policy = RetryPolicy(base_delay=1.0, max_delay=4.0)
+    assert all(0 <= policy.backoff(10) <= 4.0 for _ in range(100))
+    assert policy.backoff(1, retry_after=7.0) == 7.0
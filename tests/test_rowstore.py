@@ -0,0 +1,119 @@
+import asyncio
+import gzip
+import json
+import pytest
+from common.rowstore import RowWriter, _sealer, iter_rows, read_manifest, stored_tables, table_dir
+
+
+def _legacy(root, tenant, table, rows):
+    path = root / tenant / f"{table}.jsonl"
+    path.parent.mkdir(parents=True)
+    path.write_text("".join(json.dumps(r) + "\n" for r in rows), encoding="utf-8")
+    return path
+
+
+def test_legacy_table_file_is_readable(tmp_path):
+    _legacy(tmp_path, "t", "account", [{"id": 1}, {"id": 2}])
+    assert stored_tables(tmp_path) == [("t", "account")]
+    assert [r["id"] for r in iter_rows("t", "account", root=tmp_path)] == [1, 2]
+
+
+def test_writer_migrates_legacy_file_into_first_segment(tmp_path):
+    legacy = _legacy(tmp_path, "t", "account", [{"id": 1}, {"id": 2}])
+    directory = table_dir("t", "account", tmp_path)
+
+    async def run():
+        w = RowWriter(directory, compression="gzip")
+        w.write({"id": 3})
+        await w.close()
+
+    asyncio.run(run())
+    _sealer.submit(lambda: None).result()  # wait for sealing
+
+    assert not legacy.exists()
+    manifest = read_manifest(directory)
+    assert [s["file"] for s in manifest] == ["00000000.jsonl.gz", "00000001.jsonl.gz"]
+    assert [s["rows"] for s in manifest] == [2, 1]  # the legacy rows, counted when sealed
+    assert [r["id"] for r in iter_rows("t", "account", root=tmp_path)] == [1, 2, 3]
+    assert stored_tables(tmp_path) == [("t", "account")]
+
+
+def _row(i, day):
+    return {"id": i, "modifiedon": f"2025-01-{day:02d}T00:00:00Z", "note": "x" * 100}
+
+
+def _sealed(directory):
+    _sealer.submit(lambda: None).result()
+    return read_manifest(directory)
+
+
+def test_segments_rotate_by_size_and_are_listed_in_the_manifest(tmp_path):
+    directory = tmp_path / "t" / "account"
+
+    async def run():
+        w = RowWriter(directory, buffer_rows=10, max_bytes=2000, compression="gzip")
+        for i in range(50):
+            w.write(_row(i, 1 + i // 10))
+        await w.commit()  # 5 batches of ~1.4 KB: every second one rotates
+        w.write(_row(50, 20))
+        await w.close()
+        return w.rows_written
+
+    assert asyncio.run(run()) == 51
+    manifest = _sealed(directory)
+    assert [s["file"] for s in manifest] == [f"{n:08d}.jsonl.gz" for n in (1, 2, 3)]
+    assert [s["rows"] for s in manifest] == [20, 20, 11]
+    first, last = manifest[0], manifest[-1]
+    assert (first["min_modifiedon"], first["max_modifiedon"]) == ("2025-01-01T00:00:00Z", "2025-01-02T00:00:00Z")
+    assert last["max_modifiedon"] == "2025-01-20T00:00:00Z"
+    assert first["bytes"] < first["raw_bytes"] and first["sealed"].endswith("Z")
+    with gzip.open(directory / first["file"], "rt") as f:
+        assert [json.loads(line)["id"] for line in f] == list(range(20))
+    assert not list(directory.glob("*.jsonl"))  # no raw segment left behind
+    assert [r["id"] for r in iter_rows("t", "account", root=tmp_path)] == list(range(51))
+    # segments outside since/until are skipped
+    assert [r["id"] for r in iter_rows("t", "account", since="2025-01-05T00:00:00Z", root=tmp_path)] == \
+        list(range(40, 51))
+
+
+def test_segment_left_open_by_a_crash_is_sealed_on_the_next_start(tmp_path):
+    directory = tmp_path / "t" / "account"
+    directory.mkdir(parents=True)
+    torn = json.dumps(_row(1, 3)) + "\n" + json.dumps(_row(2, 4)) + "\n" + '{"id": 3, "modif'
+    (directory / "00000004.jsonl").write_text(torn, encoding="utf-8")
+    assert [r["id"] for r in iter_rows("t", "account", root=tmp_path)] == [1, 2]  # readable before sealing
+
+    async def run():
+        w = RowWriter(directory, compression="gzip")
+        w.write(_row(5, 5))
+        await w.close()
+
+    asyncio.run(run())
+    manifest = _sealed(directory)
+    assert [(s["file"], s["rows"]) for s in manifest] == [("00000004.jsonl.gz", 2), ("00000005.jsonl.gz", 1)]
+    assert manifest[0]["max_modifiedon"] == "2025-01-04T00:00:00Z"
+
+
+def test_rows_are_buffered_until_a_flush_or_commit(tmp_path):
+    directory = tmp_path / "t" / "account"
+
+    async def run():
+        w = RowWriter(directory, buffer_rows=3, compression="none")
+        w.write(_row(1, 1))
+        w.write(_row(2, 1))
+        seg = directory / "00000001.jsonl"
+        before = seg.exists()
+        w.write(_row(3, 1))  # buffer full: handed to the writer thread
+        await w.commit()
+        lines = seg.read_text().splitlines()
+        await w.close()
+        return before, lines
+
+    before, lines = asyncio.run(run())
+    assert not before and len(lines) == 3
+    assert [s["file"] for s in _sealed(directory)] == ["00000001.jsonl"]  # compression "none"
+
+
+def test_unknown_fsync_policy_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        RowWriter(tmp_path, fsync="sometimes")
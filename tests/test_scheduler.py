@@ -0,0 +1,48 @@
+import pytest
+from connectors.d365.breaker import CircuitOpenError
+from connectors.d365.scheduler import BACKOFF, MAX_RESUME_FAILURES, TableSchedule
+
+MIN, MAX = 30.0, 900.0
+
+
+def _polled(sched, count=0, complete=True, continuation=None, error=None):
+    result = None if error else {"count": count, "complete": complete, "continuation": continuation}
+    sched.update(result, error, MIN, MAX)
+    return sched.interval
+
+
+def test_quiet_table_backs_off_to_the_max():
+    sched = TableSchedule("t", "account", MIN)
+    assert _polled(sched) == pytest.approx(MIN * BACKOFF)
+    assert _polled(sched) == pytest.approx(MIN * BACKOFF ** 2)
+    for _ in range(20):
+        _polled(sched)
+    assert sched.interval == MAX
+
+
+def test_busy_table_speeds_up_to_the_min():
+    sched = TableSchedule("t", "account", 480.0)
+    assert _polled(sched, count=5) == 240.0
+    for _ in range(10):
+        _polled(sched, count=5)
+    assert sched.interval == MIN
+
+
+def test_unfinished_poll_resumes_at_the_min_interval():
+    sched = TableSchedule("t", "account", MAX)
+    assert _polled(sched, count=100, complete=False, continuation="https://org/next") == MIN
+    assert sched.continuation == "https://org/next" and sched.snapshot()["resuming"]
+    _polled(sched, count=3)
+    assert sched.continuation is None
+
+
+def test_failures_double_and_wait_for_an_open_circuit():
+    sched = TableSchedule("t", "account", MIN)
+    sched.continuation = "https://org/next"
+    assert _polled(sched, error=RuntimeError("boom")) == 2 * MIN
+    assert _polled(sched, error=RuntimeError("boom")) == 4 * MIN
+    assert sched.failures == 2 and sched.last_error == "RuntimeError: boom"
+    assert _polled(sched, error=CircuitOpenError("org", 600)) == 600
+    assert sched.failures == MAX_RESUME_FAILURES and sched.continuation is None  # start over
+    _polled(sched, count=1)
+    assert sched.failures == 0 and sched.last_error is None and sched.interval == 300
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import httpx
+import pytest
+import connectors.d365.client as client
+from connectors.d365.stream import iter_odata_page
+
+
+def _parse(*chunks):
+    async def body():
+        for c in chunks:
+            yield c
+
+    async def run():
+        trailer = {}
+        rows = [row async for row in iter_odata_page(body(), trailer)]
+        return rows, trailer
+
+    return asyncio.run(run())
+
+
+def test_number_split_at_chunk_edge():
+    rows, _ = _parse(b'{"value":[{"n":12', b'34},{"n":5', b'6}]}')
+    assert rows == [{"n": 1234}, {"n": 56}]
+
+
+def test_number_ending_the_buffer_waits_for_more():
+    rows, _ = _parse(b'{"value":[1', b'2,3', b']}')
+    assert rows == [12, 3]
+
+
+def test_multibyte_utf8_split_across_chunks():
+    data = json.dumps({"value": [{"name": "Zoë €"}]}, ensure_ascii=False).encode()
+    cut = data.index("€".encode()) + 1  # inside the 3-byte sequence
+    rows, _ = _parse(data[:cut], data[cut:])
+    assert rows == [{"name": "Zoë €"}]
+
+
+def test_empty_value():
+    rows, trailer = _parse(b'{"@odata.context":"c","value":[ ]}')
+    assert rows == [] and trailer == {"@odata.context": "c"}
+    assert _parse(b"{}") == ([], {})
+
+
+def test_trailer_keys_before_and_after_value():
+    page = {"@odata.context": "ctx", "value": [{"a": 1}, {"a": [2, {"b": "]}"}]}],
+            "@odata.count": 2, "@odata.nextLink": "https://org/api?$skiptoken=x"}
+    data = json.dumps(page, indent=1).encode()
+    for chunks in ((data,), tuple(data[i:i + 1] for i in range(len(data)))):
+        rows, trailer = _parse(*chunks)
+        assert rows == page["value"]
+        assert trailer == {k: v for k, v in page.items() if k != "value"}
+
+
+def test_malformed_page_raises():
+    with pytest.raises(ValueError):
+        _parse(b'{"value":[{"a":1} {"a":2}]}')
+    with pytest.raises(ValueError):
+        _parse(b'{"value":[{"a":1}')
+
+
+def test_stream_holds_governor_slot_until_closed(monkeypatch):
+    async def handler(request):
+        return httpx.Response(200, json={"value": [{"a": 1}, {"a": 2}]})
+
+    async def token(profile=None):
+        return "t"
+
+    monkeypatch.setattr(client, "get_dataverse_token", token)
+    monkeypatch.setattr(client, "get_http_client",
+                        lambda url: httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    async def run():
+        governor = client.get_governor(client._api_base())
+        seen = []
+        async for row in client.d365_stream_rows("/accounts", {}):
+            seen.append(governor.in_flight)
+        return seen, governor.in_flight
+
+    seen, after = asyncio.run(run())
+    assert seen == [1, 1] and after == 0
+
+
+def test_row_spanning_many_chunks_is_decoded_once(monkeypatch):
+    page = {"value": [{"id": i, "notes": 'say "hi" \\ ' * 200, "tags": [{"k": "]}"}] * 50} for i in range(2)],
+            "@odata.nextLink": "https://org/api?$skiptoken=x"}
+    data = json.dumps(page).encode()
+    calls = []
+    decode = json.JSONDecoder.raw_decode
+    monkeypatch.setattr(json.JSONDecoder, "raw_decode", lambda self, s, idx=0: calls.append(idx) or decode(self, s, idx))
+    rows, trailer = _parse(*(data[i:i + 7] for i in range(0, len(data), 7)))
+    assert rows == page["value"] and trailer == {"@odata.nextLink": page["@odata.nextLink"]}
+    assert len(calls) == 5  # "value", the two rows, the nextLink key and its value: one decode each
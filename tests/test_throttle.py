@@ -0,0 +1,84 @@
+import asyncio
+import pytest
+import connectors.d365.throttle as throttle
+from connectors.d365.throttle import H_BURST_REMAINING, ThrottleGovernor, parse_retry_after
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = {"t": 1000.0}
+    monkeypatch.setattr(throttle.time, "monotonic", lambda: now["t"])
+    return now
+
+
+def test_429_halves_the_limit_once_per_cooldown(clock):
+    gov = ThrottleGovernor(initial=16)
+    gov.observe(429, {"Retry-After": "2"})
+    gov.observe(429, {})
+    assert gov.limit == 8 and gov.throttled == 2  # second one within the cooldown
+    assert gov.paused_until == clock["t"] + 2
+    clock["t"] += ThrottleGovernor.DECREASE_COOLDOWN
+    gov.observe(429, {})
+    assert gov.limit == 4
+
+
+def test_low_budget_decreases_and_successes_increase_additively(clock):
+    gov = ThrottleGovernor(initial=4, max_limit=5)
+    gov.observe(200, {H_BURST_REMAINING: "50"})
+    assert gov.limit == 2
+    for _ in range(2):
+        gov.observe(200, {H_BURST_REMAINING: "5,000"})
+    assert gov.limit == pytest.approx(2 + 1 / 2 + 1 / 2.5)  # +1/limit per success
+    for _ in range(100):
+        gov.observe(200, {})
+    assert gov.limit == 5  # never above max_limit
+
+
+def test_limit_never_below_min(clock):
+    gov = ThrottleGovernor(initial=2, min_limit=1)
+    for _ in range(5):
+        clock["t"] += 10
+        gov.observe(429, {})
+    assert gov.limit == 1
+
+
+def test_waiters_are_served_fifo_and_pause_holds_them():
+    async def run():
+        gov = ThrottleGovernor(initial=1)
+        await gov.acquire()
+        order = []
+
+        async def waiter(i):
+            async with gov.slot():
+                order.append(i)
+
+        tasks = [asyncio.ensure_future(waiter(i)) for i in range(3)]
+        await asyncio.sleep(0)
+        gov.pause(0.05)
+        gov.release()
+        await asyncio.sleep(0.01)
+        assert order == []  # paused: nobody runs yet
+        await asyncio.gather(*tasks)
+        return order, gov.in_flight
+
+    assert asyncio.run(run()) == ([0, 1, 2], 0)
+
+
+def test_cancelled_waiter_gives_its_place_up():
+    async def run():
+        gov = ThrottleGovernor(initial=1)
+        await gov.acquire()
+        t = asyncio.ensure_future(gov.acquire())
+        await asyncio.sleep(0)
+        t.cancel()
+        await asyncio.gather(t, return_exceptions=True)
+        gov.release()
+        return gov.in_flight, gov.try_acquire()
+
+    assert asyncio.run(run()) == (0, True)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0  # in the past
+    assert parse_retry_after("soon") is None and parse_retry_after(None) is None